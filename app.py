@@ -1,77 +1,52 @@
 import os
+import sys
 import time
 import pyautogui
-import subprocess
-from PIL import Image, ImageDraw, ImageFont
-import io
+from PIL import Image
 from dotenv import load_dotenv
 import base64
-import numpy as np
+import json
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+from OverlayHelper import grid_overlay_cache
+from ScreenshotHelper import EncodedFrame, FrameEncoder, BackgroundWriter
+from ScreenshotStoreHelper import ScreenshotStore, get_screenshot_store
+from FrameDiffHelper import FrameChangeDetector
+from CacheHelper import cached_completion, get_response_cache, stream_completion
+from CaptureHelper import capture_service
+from ActionHelper import ActionInterpreter, ActionParseError, StreamingExecutor, action_cache, pyautogui_functions
+from SettleHelper import settle_detector
+from LayoutHelper import UILayout, load_layout
+from LayoutExtractHelper import layout_extractor
+from PromptHelper import PromptTemplate, prompt_budget
+from ZoomHelper import REGION_PROMPT, coarse_to_fine, display_transform
+from ClientHelper import get_llm_client, is_api_error
+from TemplateMatchHelper import template_matcher
+from DaemonHelper import AgentDaemon
 
 
 def add_coordinate_labels(image_array, step=None):
     """
     Adds coordinate labels with arrows to an image for pixel positions.
+
+    The grid is rendered once per (resolution, step, font, arrow size) and the cached
+    RGBA layer is composited onto each new frame.
     
     Args:
-        image_array: numpy array of the image
+        image_array: numpy array of the image, or a PIL Image which is labeled in place
         step: spacing between labeled points (uses SCREENSHOT_STEP from env if None)
     
     Returns:
         PIL Image with coordinate labels and arrows
     """
-    # Convert numpy array to PIL Image for drawing
-    image = Image.fromarray(image_array)
-    draw = ImageDraw.Draw(image)
+    # Convert numpy array to PIL Image for drawing; PIL images are used as-is to avoid a copy
+    image = image_array if isinstance(image_array, Image.Image) else Image.fromarray(image_array)
     
     # Get step size from environment variable or use default
     step = int(os.getenv("SCREENSHOT_STEP", 50)) if step is None else step
     print(f"step: {step}")
     
-    # Try to load a system font, fall back to default if not found
-    try:
-        font = ImageFont.truetype("arial.ttf", int(os.getenv("FONT_SIZE", 6)))
-    except:
-        font = ImageFont.load_default()
-    
-    height, width = image_array.shape[:2]
-    arrow_length = int(os.getenv("ARROW_LENGTH", 20))
-    arrow_size = int(os.getenv("ARROW_SIZE", 5))
-    
-    # Create coordinate points grid
-    for y in range(0, height, step):
-        for x in range(0, width, step):
-            # Draw arrow
-            arrow_color = (255, 0, 0)  # Red color for visibility
-            
-            # Calculate arrow endpoint
-            end_x = x + 15
-            end_y = y - 15
-            
-            # Draw arrow line
-            draw.line([(end_x, end_y), (x, y)], fill=arrow_color, width=1)
-            
-            # Draw arrowhead
-            draw.polygon([
-                (x, y),
-                (x + arrow_size, y - arrow_size),
-                (x - arrow_size, y - arrow_size)
-            ], fill=arrow_color)
-            
-            # Add coordinate text
-            text = f"({x}, {y})"
-            text_bbox = draw.textbbox((end_x, end_y), text, font=font)
-            
-            # Draw white background for text
-            draw.rectangle([
-                (text_bbox[0]-2, text_bbox[1]-2),
-                (text_bbox[2]+2, text_bbox[3]+2)
-            ], fill=(255, 255, 255))
-            
-            # Draw coordinate text
-            draw.text((end_x, end_y), text, fill=(0, 0, 0), font=font)
-    
-    return image
+    return grid_overlay_cache.apply(image, step)
 
 
 def center_mouse_and_show_coordinates():
@@ -97,158 +72,306 @@ def center_mouse_and_show_coordinates():
     # Return the center coordinates
     return center_x, center_y
 
-def convert_coordinates_to_mac_os_4k_for_pyautogui(x, y):
+def convert_coordinates_to_mac_os_4k_for_pyautogui(x, y, transform=None):
     """
     Convert coordinates from Mac OS 4K resolution to PyAutoGUI coordinates.
     
     Args:
         x: x-coordinate in Mac OS 4K resolution
         y: y-coordinate in Mac OS 4K resolution
+        transform: ViewTransform of the image the coordinates were read from (e.g. a
+            zoomed crop); defaults to the full 4K frame
     
     Returns:
         Tuple of converted PyAutoGUI coordinates
     """
-    # Mac OS 4K resolution
-    mac_os_4k_width = 3840
-    mac_os_4k_height = 2160
-    
-    # PyAutoGUI default resolution
-    pyautogui_width, pyautogui_height = pyautogui.size()
-    
-    # Convert coordinates to PyAutoGUI resolution
-    x_new = x * pyautogui_width / mac_os_4k_width
-    y_new = y * pyautogui_height / mac_os_4k_height
-    
-    return x_new, y_new
+    # Mac OS 4K resolution; the transform to the PyAutoGUI resolution is cached per display geometry
+    transform = transform or display_transform((3840, 2160))
+    return transform.map(x, y)
 
-class ScreenshotProcessor:
-    def __init__(self, client):
-        print("Initializing...")
-        self.client = client
-
-        # Configure PyAutoGUI settings
-        pyautogui.PAUSE = 1
-        pyautogui.FAILSAFE = True
-        
-    def take_screenshot(self) -> str:
-        """Take a screenshot and save it temporarily."""
-        # Create screenshots directory if it doesn't exist
-        os.makedirs("screenshots", exist_ok=True)
-        
-        screenshot = pyautogui.screenshot()
-        
-        # Convert PIL Image to numpy array
-        screenshot_array = np.array(screenshot)
-        
-        # Add coordinate labels
-        labeled_screenshot = add_coordinate_labels(screenshot_array)
-        
-        # Save screenshot to bytes
-        img_byte_arr = io.BytesIO()
-        labeled_screenshot.save(img_byte_arr, format='PNG')
-        img_byte_arr = img_byte_arr.getvalue()
-        
-        # Save to file temporarily
-        datetime_yyyy_mm_dd_hh_mm_ss = time.strftime("%Y%m%d_%H%M%S")
-        temp_path = f"./screenshots/temp_screenshot-{datetime_yyyy_mm_dd_hh_mm_ss}.png"
-        labeled_screenshot.save(temp_path)
-        
-        return temp_path
-    
-
-    def generate_automation_code(self, screenshot_path: str, instruction: str) -> str:
-        """Generate automation code using OpenAI's API."""
-        try:
-            # Read the image file
-            with open(screenshot_path, "rb") as image_file:
-                labeled_image_data = image_file.read()
-            
-            # Create messages for the API
-            OLD_SYSTEM_PROMPT = """You are an expert Python automation engineer specializing in PyAutoGUI. 
-                    Generate precise Python code to automate user interface interactions based on screenshots and instruction 
-                    
-                    <instruction>
-                    {instruction}
-                    </instruction>
+# System prompts are compiled once with the static instructions first, so the prefix is
+# byte-identical across calls and only the tail varies
+OLD_SYSTEM_PROMPT = PromptTemplate(
+    prefix="""You are an expert Python automation engineer specializing in PyAutoGUI. 
+                    Generate precise Python code to automate user interface interactions based on screenshots and the instruction at the end.
 
                     The code should be properly formatted without indentation at the root level.
-                    Include necessary imports and use time.sleep() for proper timing.
+                    Include necessary imports. Each action already waits for the screen to settle, so only use time.sleep() to wait for slow page loads.
                     Use pyautogui functions and focus on accurate coordinates from the labeled screenshot.
                     Return only executable Python code without any markdown formatting or explanations.
                     The first generated click command (after the import statements) should be done at location (200, 200) to make the window active.
                     Use typewrite function for dropdowns like pizza type and size.
                     also remember to move mouse and click before typing in dropdowns.
                     give PRECISE x,y co-ordinates to nearest 1 pixel, interpolate if necessary. 
-                    """
-            with open("pizza_page_ui_layout.json", "r") as f:
-                ui_layout = f.read()
-            print(ui_layout)
-            JSON_SYSTEM_PROMPT = f"""You are an expert Python automation engineer specializing in PyAutoGUI. 
+                    """,
+    suffix="""
+                    <instruction>
+                    {instruction}
+                    </instruction>
+                    """,
+)
+
+JSON_SYSTEM_PROMPT = PromptTemplate(
+    prefix="""You are an expert Python automation engineer specializing in PyAutoGUI. 
             Use the UI layout json which has x, y coordinates of all ui components to generate precise Python code to automate user interface 
             interactions based on screenshots and instructions. 
             The code should be properly formatted without indentation at the root level. 
-            Include necessary imports and use time.sleep() for proper timing. 
+            Include necessary imports. Each action already waits for the screen to settle, so only use time.sleep() to wait for slow page loads. 
             Use pyautogui functions and focus on accurate coordinates from the labeled screenshot. 
             Return only executable Python code without any markdown formatting or explanations. 
             The first generated click command (after the import statements) should be done at location (200, 200) to make the window active.
             Use typewrite function for dropdowns like pizza type and size.
              also remember to move mouse and click before typing in dropdowns.
-            Do not sleep, execute without delay but delay each execution for 2 seconds.  
+            Do not add fixed delays between actions. 
             remember that the browser may not be the active window, so first click twice on the first item. 
             The first generated click command (after the import statements) should be done at location (200, 200) to make the window active.
-            The UI layout json is as follows:
+            """,
+    suffix="""The UI layout json is as follows:
             ```
             {ui_layout}
             ```
             
-            """
-            messages = [
-                {
-                    "role": "system",
-                    "content": OLD_SYSTEM_PROMPT,
-                },
+            """,
+)
+
+def extract_layout_components(image_array, instruction: str):
+    """
+    Layout extracted from the unlabeled screen and the components to send for `instruction`:
+    those it refers to, otherwise the interactive ones first, at most
+    LAYOUT_EXTRACT_MAX_COMPONENTS. Returns (None, []) when extraction is disabled.
+    """
+    if os.getenv("LAYOUT_EXTRACT_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None, []
+    layout = UILayout(layout_extractor.extract(image_array, title="Extracted from screen"))
+    components = layout.relevant_components(instruction)
+    if not components:
+        interactive = ("button", "input", "dropdown", "checkbox")
+        components = sorted((c.raw for c in layout.components), key=lambda c: (c["source"] != "template", c["type"] not in interactive))
+    return layout, components[:int(os.getenv("LAYOUT_EXTRACT_MAX_COMPONENTS", 50))]
+
+class ScreenshotProcessor:
+    def __init__(self, client):
+        print("Initializing...")
+        self.client = client
+
+        # Configure PyAutoGUI settings; with settle detection, actions wait for the screen instead of a fixed pause
+        pyautogui.PAUSE = 0 if settle_detector.enabled else 1
+        pyautogui.FAILSAFE = True
+
+        # Encode each frame once and keep disk writes off the capture path
+        self.encoder = FrameEncoder()
+        save_screenshots = os.getenv("SAVE_SCREENSHOTS", "true").lower() in ("true", "1", "yes")
+        self.store = get_screenshot_store() if save_screenshots else None
+        self.writer = BackgroundWriter() if save_screenshots and self.store is None else None
+        self.session = ScreenshotStore.new_session("screenshots")
+        self.saved_count = 0
+        self.last_frame = None
+
+        # Remember the last generated code so an unchanged screen can skip the vision call
+        self.change_detector = FrameChangeDetector()
+        self.last_diff = None
+        self.last_result = None
+
+        # Unlabeled frame behind the last encoded one, for local layout extraction
+        self.last_raw_frame = None
+        self.last_encoded = None
+        
+    def capture_frame(self) -> EncodedFrame:
+        """Capture, label and encode the screen once; optionally write it to disk in the background."""
+        # Reuse a frame grabbed in the last CAPTURE_MAX_AGE_MS, copied because labeling is in place;
+        # the unlabeled frame is kept for layout extraction
+        self.last_raw_frame = capture_service.get_frame(float(os.getenv("CAPTURE_MAX_AGE_MS", 100)))
+        screenshot = capture_service.copy_image(self.last_raw_frame)
+        
+        # Compare the raw frame with the previous one before it gets labeled
+        self.last_diff = self.change_detector.update(screenshot)
+        
+        # Add coordinate labels in place, without round-tripping through numpy
+        labeled_screenshot = add_coordinate_labels(screenshot)
+        
+        return self._encode(labeled_screenshot)
+
+    def capture_zoomed_frame(self, instruction: str, use_cache: bool = True) -> EncodedFrame:
+        """
+        Coarse-to-fine capture: the model picks a point for `instruction` on a downscaled,
+        coarsely labeled overview, and the returned frame is a full-resolution crop around
+        it with a finer grid labeled in screen coordinates (see ZoomHelper.CoarseToFine).
+        Falls back to the full labeled frame when no point is given.
+        """
+        self.last_raw_frame = capture_service.get_frame(float(os.getenv("CAPTURE_MAX_AGE_MS", 100)))
+        screenshot = capture_service.copy_image(self.last_raw_frame)
+        self.last_diff = self.change_detector.update(screenshot)
+
+        overview, _ = coarse_to_fine.overview(screenshot)
+        overview_frame = self.encoder.encode(overview)
+        reply = cached_completion(
+            self.client,
+            model=os.getenv("VISION_MODEL"),
+            messages=[
+                {"role": "system", "content": REGION_PROMPT},
                 {
                     "role": "user",
                     "content": [
-                        {
-                            "type": "text",
-                            #"text": f"Generate PyAutoGUI code to: {instruction}"
-                            "text": f"Generate PyAutoGUI code to: {instruction}"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/png;base64,{base64.b64encode(labeled_image_data).decode('utf-8')}"
-                            }
+                        {"type": "text", "text": f"Next step: {instruction}"},
+                        {"type": "image_url", "image_url": {"url": f"data:{overview_frame.mime_type};base64,{base64.b64encode(overview_frame.data).decode('utf-8')}"}},
+                    ],
+                },
+            ],
+            use_cache=use_cache,
+            max_tokens=20,
+            temperature=0.0,
+        )
+        point = coarse_to_fine.parse_point(reply)
+        if point is None:
+            print("No region chosen on the overview; sending the full labeled screenshot.")
+            return self._encode(add_coordinate_labels(screenshot))
+        detail, transform = coarse_to_fine.detail(screenshot, point)
+        print(f"Zoomed into {detail.width}x{detail.height} at screen {transform.to_screen(0, 0)}.")
+        return self._encode(detail)
+
+    def _encode(self, labeled_screenshot) -> EncodedFrame:
+        # Encode once; the same bytes go to the request builder and to disk
+        frame = self.encoder.encode(labeled_screenshot)
+        self.last_encoded = frame
+        
+        if self.store is not None:
+            # Deduplicated and delta-encoded on the store's thread; the ref stands in for a path
+            frame.path = self.store.submit(labeled_screenshot, frame.data, session=self.session)
+        elif self.writer is not None:
+            datetime_yyyy_mm_dd_hh_mm_ss = time.strftime("%Y%m%d_%H%M%S")
+            self.saved_count += 1
+            frame.path = f"./screenshots/temp_screenshot-{datetime_yyyy_mm_dd_hh_mm_ss}-{self.saved_count:04d}.{self.encoder.extension}"
+            self.writer.submit(frame.path, frame.data)
+        
+        return frame
+
+    def take_screenshot(self) -> str:
+        """
+        Take a screenshot and save it in the background when SAVE_SCREENSHOTS is enabled:
+        in the screenshot store (returning its ref) or, with the store disabled, as a file.
+        """
+        frame = self.capture_frame()
+        self.last_frame = frame
+        return frame.path
+    
+
+    def automation_messages(self, screenshot, instruction: str) -> list:
+        """
+        Build the chat messages for an instruction.
+
+        `screenshot` may be an EncodedFrame, the path of a saved screenshot or a
+        screenshot store ref. The last one returned by take_screenshot is served from
+        memory instead of re-read.
+        """
+        if isinstance(screenshot, EncodedFrame):
+            frame = screenshot
+        elif self.last_frame is not None and screenshot == self.last_frame.path:
+            frame = self.last_frame
+        elif ScreenshotStore.is_ref(screenshot) and self.store is not None:
+            # An earlier frame from the screenshot store
+            frame = self.encoder.encode(self.store.open(screenshot))
+        else:
+            # Read the image file
+            frame = EncodedFrame.from_file(screenshot)
+        
+        # The layout is loaded and indexed once; only components the instruction refers to are sent
+        layout = load_layout()
+        relevant_components = layout.relevant_components(instruction) if layout is not None else []
+        if not relevant_components and frame is self.last_encoded and self.last_raw_frame is not None:
+            # No hand-written layout covers this screen: extract one locally (cached by screen hash)
+            layout, relevant_components = extract_layout_components(self.last_raw_frame.array, instruction)
+        print(f"UI layout components sent: {len(relevant_components)}")
+        if relevant_components:
+            ui_layout = json.dumps({"title": layout.title, "resolution": layout.resolution, "components": relevant_components}, indent=4)
+            system_prompt = JSON_SYSTEM_PROMPT.render(ui_layout=ui_layout)
+        else:
+            system_prompt = OLD_SYSTEM_PROMPT.render(instruction=instruction)
+
+        # Create messages for the API
+        messages = [
+            {
+                "role": "system",
+                "content": system_prompt,
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        #"text": f"Generate PyAutoGUI code to: {instruction}"
+                        "text": f"Generate PyAutoGUI code to: {instruction}"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:{frame.mime_type};base64,{base64.b64encode(frame.data).decode('utf-8')}"
                         }
-                    ]
-                }
-            ]
+                    }
+                ]
+            }
+        ]
+
+        # Downscale or trim locally if the request is over the per-request budget
+        return prompt_budget.fit(messages)
 
-            # Make the API call
-            response = self.client.chat.completions.create(
+    def generate_automation_code(self, screenshot, instruction: str, use_cache: bool = True) -> str:
+        """
+        Generate automation code using OpenAI's API.
+
+        `screenshot` may be an EncodedFrame or the path of a saved screenshot (see
+        automation_messages). Responses are cached by instruction, screenshot content hash
+        (perceptual with LLM_CACHE_PERCEPTUAL_HASH) and model unless use_cache is False. Returns None when the API still fails
+        after the client's retries; other errors propagate.
+        """
+        try:
+            # Make the API call, or reuse the answer to an identical earlier request
+            return cached_completion(
+                self.client,
                 model=os.getenv("VISION_MODEL"),
-                messages=messages,
+                messages=self.automation_messages(screenshot, instruction),
+                use_cache=use_cache,
                 max_tokens=4000,
                 temperature=0.0,
             )
 
-            return response.choices[0].message.content
-
         except Exception as e:
-            print(f"Error generating automation code: {str(e)}")
+            if not is_api_error(e):
+                raise
+            print(f"Error generating automation code: {type(e).__name__}: {str(e)}")
             return None
 
+    def stream_automation_code(self, screenshot, instruction: str, use_cache: bool = True):
+        """
+        Streaming form of generate_automation_code: returns an iterator over the code as it
+        is generated, for StreamingExecutor to run statement by statement.
+        """
+        return stream_completion(
+            self.client,
+            model=os.getenv("VISION_MODEL"),
+            messages=self.automation_messages(screenshot, instruction),
+            use_cache=use_cache,
+            max_tokens=4000,
+            temperature=0.0,
+        )
+
     def process_screenshot_and_generate_code(self, instruction: str) -> tuple:
         """Process screenshot and generate automation code."""
         try:
-            # Take screenshot
-            screenshot_path = self.take_screenshot()
+            # Take screenshot, zoomed into the relevant region in two-stage mode
+            frame = self.capture_zoomed_frame(instruction) if coarse_to_fine.enabled else self.capture_frame()
+            self.last_frame = frame
             
-            # Generate automation code
-            generated_code = self.generate_automation_code(screenshot_path, instruction)
+            # Short-circuit when neither the screen nor the instruction changed
+            if not self.last_diff.changed and self.last_result is not None and self.last_result[0] == instruction:
+                print("Screen unchanged since the last request; reusing the generated code.")
+                return frame.path, self.last_result[1]
             
-            return screenshot_path, generated_code
+            # Generate automation code straight from the encoded bytes
+            generated_code = self.generate_automation_code(frame, instruction)
+            if generated_code:
+                self.last_result = (instruction, generated_code)
+            
+            return frame.path, generated_code
             
         except Exception as e:
             print(f"Error processing screenshot: {str(e)}")
@@ -266,18 +389,82 @@ def clean_code(code: str) -> str:
     return '\n'.join(cleaned_lines)
 
 def create_execution_environment():
-    """Create a safe execution environment with necessary imports."""
-    namespace = {
-        'pyautogui': pyautogui,
-        'time': time,
-        'subprocess': subprocess,
-    }
+    """Create the table of functions generated code may call; nothing else is reachable."""
+    functions = pyautogui_functions()
     
-    # Configure PyAutoGUI
+    # Configure PyAutoGUI; each action waits for the screen to settle instead of a fixed pause
     pyautogui.FAILSAFE = True
-    pyautogui.PAUSE = 1
+    pyautogui.PAUSE = 0 if settle_detector.enabled else 1
     
-    return namespace
+    return functions
+
+def stream_and_execute(processor, instruction: str):
+    """
+    Run the generated code while it is being generated. Each statement is validated and
+    executed as soon as it is complete, so confirmation is asked before the request.
+    """
+    confirmation = input("\nExecute the generated code as it streams in? (yes/no): ")
+    if confirmation.lower() != 'yes':
+        print("Execution cancelled.")
+        return
+    executor = StreamingExecutor(create_execution_environment())
+    try:
+        frame = processor.capture_zoomed_frame(instruction) if coarse_to_fine.enabled else processor.capture_frame()
+        processor.last_frame = frame
+        actions = executor.run(processor.stream_automation_code(frame, instruction))
+        print(f"\nExecuted {len(actions)} action(s) from:\n{executor.source}")
+        print(f"Settle times per action: {settle_detector.summary()}")
+    except ActionParseError as e:
+        print(f"Generated code was rejected after {len(executor.executed)} action(s) ran; the rest was not executed: {e}")
+    except Exception as e:
+        print(f"Error executing automation: {str(e)}")
+        print("Detailed error info:", e.__class__.__name__)
+
+def run_instruction(processor, instruction: str, execute: bool = False) -> dict:
+    """
+    Daemon job: generate and validate the code for one instruction, and run it when
+    `execute` is set. Raises when no valid code could be generated.
+    """
+    frame = processor.capture_zoomed_frame(instruction) if coarse_to_fine.enabled else processor.capture_frame()
+    processor.last_frame = frame
+    generated_code = processor.generate_automation_code(frame, instruction)
+    if not generated_code:
+        raise RuntimeError("failed to generate automation code")
+    cleaned_code = clean_code(generated_code)
+    actions = action_cache.compile(cleaned_code, pyautogui_functions().keys())
+    if execute:
+        ActionInterpreter(create_execution_environment()).run(actions)
+    return {
+        "code": cleaned_code,
+        "actions": len(actions),
+        "executed": execute,
+        "screenshot": frame.path,
+        "settle": settle_detector.summary() if execute else None,
+    }
+
+def warm_up(processor) -> dict:
+    """Build what every request needs once: the LLM client, capture, fonts and grid overlay, templates and layout."""
+    processor.capture_frame()
+    width, height = pyautogui.size()
+    templates = template_matcher.preload(layout_extractor.elements_dir) if os.path.isdir(layout_extractor.elements_dir) else []
+    layout = load_layout()
+    get_llm_client()
+    return {
+        "screen": f"{width}x{height}",
+        "templates": len(templates),
+        "layout_components": len(layout.components) if layout is not None else 0,
+    }
+
+def serve_daemon():
+    """Serve instructions from the local daemon API (see DaemonHelper) with warm state."""
+    if not os.getenv('OPENAI_API_KEY'):
+        print("Error: OPENAI_API_KEY not found in environment variables")
+        return
+    processor = ScreenshotProcessor(get_llm_client())
+    AgentDaemon(
+        lambda instruction, execute=False: run_instruction(processor, instruction, execute),
+        warm=lambda: warm_up(processor),
+    ).serve_forever()
 
 def main():
     """Main execution function."""
@@ -299,19 +486,25 @@ def main():
             print("Error: OPENAI_API_KEY not found in environment variables")
             return
         
-        from openai import OpenAI
-        client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            
-        processor = ScreenshotProcessor(client)
+        # Pooled client with rate limiting, retries and optional hedging (see ClientHelper)
+        processor = ScreenshotProcessor(get_llm_client())
         
         instruction = input("What action would you like to automate? ")
         
+        if os.getenv("STREAM_ACTIONS", "false").lower() in ("true", "1", "yes"):
+            stream_and_execute(processor, instruction)
+            return
+        
         # Fixed: Changed process_screenshot to process_screenshot_and_generate_code
         screenshot_path, generated_code = processor.process_screenshot_and_generate_code(instruction)
         
         if not generated_code:
             print("Failed to generate automation code")
             return
+        
+        response_cache = get_response_cache()
+        if response_cache is not None:
+            print(f"LLM response cache: {response_cache.stats()}")
             
         # Clean the code before displaying and executing
         cleaned_code = clean_code(generated_code)
@@ -319,6 +512,13 @@ def main():
         print("\nGenerated Python code:")
         print(cleaned_code)
         
+        # Validate the whole script up front; nothing runs if any line is rejected
+        try:
+            actions = action_cache.compile(cleaned_code, pyautogui_functions().keys())
+        except ActionParseError as e:
+            print(f"Generated code was rejected and will not be executed: {e}")
+            return
+        
         confirmation = input("\nWould you like to execute this code? (yes/no): ")
         PREPARE_TIME = 0  # Time to prepare before execution
         
@@ -331,8 +531,9 @@ def main():
                 # Wait for preparation time
                 time.sleep(PREPARE_TIME)
                 
-                # Execute the cleaned code in the prepared environment
-                exec(cleaned_code, exec_env)
+                # Run the validated actions against the prepared functions
+                ActionInterpreter(exec_env).run(actions)
+                print(f"Settle times per action: {settle_detector.summary()}")
                 
             except Exception as e:
                 print(f"Error executing automation: {str(e)}")
@@ -344,4 +545,8 @@ def main():
         print(f"An error occurred: {str(e)}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--daemon" in sys.argv[1:]:
+        load_dotenv()
+        serve_daemon()
+    else:
+        main()
\ No newline at end of file
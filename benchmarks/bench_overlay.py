@@ -0,0 +1,75 @@
+"""
+Per-frame cost of the coordinate grid overlay, drawn directly versus composited from the cache.
+
+Usage:
+    python benchmarks/bench_overlay.py --width 3840 --height 2160 --step 50 --frames 5
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+from OverlayHelper import GridOverlayCache, draw_coordinate_grid, load_font
+
+
+def make_frame(width, height, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+
+
+def bench_direct(frame, step, font_size, arrow_size):
+    image = Image.fromarray(frame)
+    height, width = frame.shape[:2]
+    draw_coordinate_grid(ImageDraw.Draw(image), width, height, step, load_font(font_size=font_size), arrow_size)
+    return image
+
+
+def bench_cached(frame, step, cache):
+    return cache.apply(Image.fromarray(frame), step)
+
+
+def time_frames(fn, frames):
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--step", type=int, default=int(os.getenv("SCREENSHOT_STEP", 50)))
+    parser.add_argument("--font-size", type=int, default=int(os.getenv("FONT_SIZE", 6)))
+    parser.add_argument("--arrow-size", type=int, default=int(os.getenv("ARROW_SIZE", 5)))
+    parser.add_argument("--frames", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["FONT_SIZE"] = str(args.font_size)
+    os.environ["ARROW_SIZE"] = str(args.arrow_size)
+    frame = make_frame(args.width, args.height)
+    cache = GridOverlayCache()
+
+    direct = time_frames(lambda: bench_direct(frame, args.step, args.font_size, args.arrow_size), args.frames)
+
+    start = time.perf_counter()
+    bench_cached(frame, args.step, cache)
+    first = time.perf_counter() - start
+    cached = time_frames(lambda: bench_cached(frame, args.step, cache), args.frames)
+
+    points = len(range(0, args.height, args.step)) * len(range(0, args.width, args.step))
+    print(f"{args.width}x{args.height}, step {args.step}: {points} labeled points per frame")
+    print(f"direct draw     : {1000 * min(direct):8.1f} ms/frame (best of {args.frames})")
+    print(f"cache cold      : {1000 * first:8.1f} ms (render + composite)")
+    print(f"cache composite : {1000 * min(cached):8.1f} ms/frame (best of {args.frames})")
+    print(f"speedup         : {min(direct) / min(cached):8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
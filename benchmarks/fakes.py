@@ -0,0 +1,271 @@
+"""
+Offline stand-ins for the display and the OpenAI API, used by the benchmarks.
+
+install_fake_pyautogui() must run before any module that imports pyautogui, since the
+capture and settle singletons bind pyautogui functions at import time.
+"""
+import asyncio
+import glob
+import json
+import os
+import select
+import socket
+import sys
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+RESOLUTIONS = {
+    "1080p": (1920, 1080),
+    "1440p": (2560, 1440),
+    "4k": (3840, 2160),
+}
+
+
+def synthetic_frame(width, height, seed=0):
+    """A UI-like frame: flat panels, buttons and text-like stripes on a light background."""
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", (width, height), (246, 246, 246))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, height // 20), fill=(40, 44, 52))
+    for _ in range(40):
+        left, top = int(rng.integers(0, width - 200)), int(rng.integers(height // 20, height - 60))
+        w, h = int(rng.integers(80, 400)), int(rng.integers(24, 200))
+        color = tuple(int(c) for c in rng.integers(60, 255, size=3))
+        draw.rectangle((left, top, left + w, top + h), fill=color, outline=(0, 0, 0))
+        for line in range(top + 6, top + h - 6, 14):
+            draw.line((left + 8, line, left + int(rng.integers(16, max(w - 8, 17))), line), fill=(20, 20, 20), width=2)
+    return image
+
+
+class FakeScreen:
+    """
+    FakeScreen:
+    -----------
+
+    Serves a fixed list of frames as the screen. The current frame only changes when
+    advance() is called, so a benchmark controls exactly when the screen changes.
+
+    Methods:
+    - from_directory(path, resolution) -> FakeScreen
+    - synthetic(resolution, count=4) -> FakeScreen
+    - advance()
+    - screenshot(region=None) -> Image
+    - size() -> Tuple[int, int]
+    - position() -> Tuple[int, int]
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.grabs = 0
+        self.cursor = (frames[0].width // 2, frames[0].height // 2)
+
+    @classmethod
+    def from_directory(cls, path, resolution):
+        """Recorded PNG frames from `path`, resized to `resolution` where they differ."""
+        frames = []
+        for file in sorted(glob.glob(os.path.join(path, "*.png"))):
+            image = Image.open(file).convert("RGB")
+            if image.size != resolution:
+                image = image.resize(resolution, Image.BILINEAR)
+            frames.append(image)
+        if not frames:
+            raise ValueError(f"no PNG frames in {path}")
+        return cls(frames)
+
+    @classmethod
+    def synthetic(cls, resolution, count=4):
+        return cls([synthetic_frame(*resolution, seed=seed) for seed in range(count)])
+
+    @property
+    def current(self):
+        return self.frames[self.index]
+
+    def advance(self):
+        self.index = (self.index + 1) % len(self.frames)
+
+    def screenshot(self, region=None):
+        self.grabs += 1
+        if region is None:
+            return self.current.copy()
+        left, top, width, height = region
+        return self.current.crop((left, top, left + width, top + height))
+
+    def size(self):
+        return self.current.size
+
+    def position(self):
+        return self.cursor
+
+
+def install_fake_pyautogui(screen):
+    """Register a pyautogui module backed by `screen`. Input functions only count their calls."""
+    module = types.ModuleType("pyautogui")
+    module.PAUSE = 0
+    module.FAILSAFE = False
+    module.calls = {}
+    module.screenshot = screen.screenshot
+    module.size = screen.size
+    module.position = screen.position
+
+    def record(name):
+        def function(*args, **kwargs):
+            module.calls[name] = module.calls.get(name, 0) + 1
+        return function
+
+    for name in ['click', 'doubleClick', 'tripleClick', 'rightClick', 'middleClick', 'moveTo', 'dragTo', 'mouseDown',
+                 'mouseUp', 'moveRel', 'move', 'dragRel', 'drag', 'scroll', 'hscroll', 'vscroll', 'write', 'typewrite',
+                 'press', 'hotkey', 'keyDown', 'keyUp', 'alert', 'confirm', 'prompt', 'password']:
+        setattr(module, name, record(name))
+    module.onScreen = lambda x, y: 0 <= x < screen.size()[0] and 0 <= y < screen.size()[1]
+    sys.modules["pyautogui"] = module
+    return module
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def _completion(content):
+    return _Namespace(choices=[_Namespace(message=_Namespace(content=content))])
+
+
+class FakeOpenAI:
+    """Synchronous client whose chat.completions.create sleeps `latency` seconds and returns `response`."""
+
+    def __init__(self, latency=0.5, response="import pyautogui\npyautogui.click(200, 200)"):
+        self.latency = latency
+        self.response = response
+        self.requests = []
+        self.chat = _Namespace(completions=_Namespace(create=self._create))
+
+    def _create(self, model, messages, **params):
+        self.requests.append({"model": model, "messages": messages, **params})
+        time.sleep(self.latency)
+        return _completion(self.response)
+
+
+class FakeAsyncOpenAI(FakeOpenAI):
+    """Async variant of FakeOpenAI for code written against openai.AsyncOpenAI."""
+
+    async def _create(self, model, messages, **params):
+        self.requests.append({"model": model, "messages": messages, **params})
+        await asyncio.sleep(self.latency)
+        return _completion(self.response)
+
+    async def close(self):
+        pass
+
+
+class StubOpenAIServer:
+    """
+    StubOpenAIServer:
+    -----------------
+
+    Local HTTP server speaking enough of the chat completions API for the real openai
+    client (and ClientHelper.LLMClient) to talk to it through OPENAI_BASE_URL. Each
+    request sleeps `latency` seconds (or the next value of `latencies`), the first
+    requests fail with the status codes in `failures` (with a Retry-After header when
+    `retry_after` is set), and `stream=true` is answered with server-sent events, one per
+    word. `requests` holds every request body and `cancelled` counts requests whose
+    client hung up before the answer was sent.
+
+    Methods:
+    - start() -> StubOpenAIServer
+    - stop()
+    - base_url
+    """
+
+    def __init__(self, latency=0.0, response="import pyautogui\npyautogui.click(200, 200)", failures=(), latencies=(),
+                 retry_after=None):
+        self.latency = latency
+        self.response = response
+        self.failures = list(failures)
+        self.latencies = list(latencies)
+        self.retry_after = retry_after
+        self.requests = []
+        self.cancelled = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _next(self, body):
+        with self._lock:
+            self.requests.append(body)
+            status = self.failures.pop(0) if self.failures else 200
+            latency = self.latencies.pop(0) if self.latencies else self.latency
+        return status, latency
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _hung_up(self, latency):
+                # Wait out the latency, returning early with True if the client closes the connection
+                readable, _, _ = select.select([self.connection], [], [], latency)
+                return bool(readable) and self.connection.recv(1, socket.MSG_PEEK) == b""
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                status, latency = stub._next(body)
+                if self._hung_up(latency):
+                    with stub._lock:
+                        stub.cancelled += 1
+                    return
+                if status != 200:
+                    headers = {"Retry-After": str(stub.retry_after)} if stub.retry_after is not None else None
+                    self._send_json(status, {"error": {"message": f"stub failure {status}", "type": "server_error"}}, headers)
+                    return
+                base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body.get("model", "stub")}
+                if not body.get("stream"):
+                    self._send_json(200, {**base, "object": "chat.completion", "choices": [{
+                        "index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": stub.response}}]})
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                for word in stub.response.split(" "):
+                    chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": word + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        return Handler
@@ -0,0 +1,197 @@
+"""
+Offline benchmark suite for the capture, labeling, matching and request pipeline.
+
+Runs every stage against a fake display (recorded PNG frames or synthetic ones) at each
+resolution and a fake OpenAI client with fixed latency, then reports per-stage timings,
+allocations and throughput. Results can be saved as JSON and compared with a baseline;
+the exit status is 1 when any stage regressed by more than --tolerance.
+
+Usage:
+    python benchmarks/run_benchmarks.py --iterations 10 --output bench.json
+    python benchmarks/run_benchmarks.py --frames-dir screenshots/ --baseline bench.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fakes import RESOLUTIONS, FakeOpenAI, FakeScreen, install_fake_pyautogui
+
+
+def load_modules(screen):
+    """Import the app against the fake display. Settle waits, the response cache and disk writes are turned off."""
+    os.environ.setdefault("SETTLE_ENABLED", "false")
+    os.environ.setdefault("LLM_CACHE_ENABLED", "false")
+    os.environ.setdefault("SAVE_SCREENSHOTS", "false")
+    os.environ.setdefault("CAPTURE_BACKEND", "pyautogui")
+    install_fake_pyautogui(screen)
+    spec = importlib.util.spec_from_file_location("root_app", os.path.join(ROOT, "app.py"))
+    root_app = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(root_app)  # puts src/ on sys.path
+    import pyautoguihelper
+    import CaptureHelper
+    return root_app, pyautoguihelper, CaptureHelper
+
+
+def run_stage(fn, iterations, before=None):
+    """Time `fn` over `iterations` runs (after one warm-up), then trace allocations of one more run."""
+    if before:
+        before()
+    fn()
+    timings = []
+    for _ in range(iterations):
+        if before:
+            before()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    if before:
+        before()
+    tracemalloc.start()
+    fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        "iterations": iterations,
+        "mean_ms": 1000 * mean,
+        "median_ms": 1000 * statistics.median(timings),
+        "p95_ms": 1000 * timings[min(len(timings) - 1, int(0.95 * len(timings)))],
+        "min_ms": 1000 * timings[0],
+        "throughput_per_s": 1 / mean if mean else float("inf"),
+        "alloc_peak_kb": peak / 1024,
+        "alloc_retained_kb": current / 1024,
+    }
+
+
+def bench_resolution(name, resolution, args, workdir, screen, modules):
+    if args.frames_dir:
+        frames = FakeScreen.from_directory(args.frames_dir, resolution).frames
+    else:
+        frames = FakeScreen.synthetic(resolution, count=args.frame_count).frames
+    # The fake pyautogui and the capture singleton are created once per process; swap the frames in place
+    screen.frames, screen.index = frames, 0
+    screen.cursor = (resolution[0] // 2, resolution[1] // 2)
+    root_app, pyautoguihelper, CaptureHelper = modules
+    capture_service = CaptureHelper.capture_service
+    capture_service.clear()
+
+    def changed_screen():
+        screen.advance()
+        capture_service.clear()
+
+    # A template cut from the first frame, so locate_* has a real match to find
+    template_path = os.path.join(workdir, f"template_{name}.png")
+    width, height = resolution
+    frames[0].crop((width // 3, height // 3, width // 3 + 120, height // 3 + 60)).save(template_path)
+
+    def first_frame():
+        screen.index = 0
+        capture_service.clear()
+
+    client = FakeOpenAI(latency=args.llm_latency)
+    processor = root_app.ScreenshotProcessor(client)
+    gui_helper = pyautoguihelper.PyAutoGuiHelper()
+    frame = frames[0]
+
+    stages = {
+        "add_coordinate_labels": (lambda: root_app.add_coordinate_labels(frame.copy()), None),
+        "take_screenshot": (processor.take_screenshot, changed_screen),
+        "locate_on_screen": (lambda: gui_helper.locate_on_screen(template_path), first_frame),
+        "locate_all_on_screen": (lambda: gui_helper.locate_all_on_screen(template_path), first_frame),
+        "outline_region_on_screen": (
+            lambda: gui_helper.outline_region_on_screen((width // 2 - 10, height // 2 - 10, 20, 20), 'red', os.path.join(workdir, "outline.png")),
+            changed_screen,
+        ),
+        "generate_automation_code": (
+            lambda: processor.generate_automation_code(processor.capture_frame(), "Click the Buy Now button", use_cache=False),
+            changed_screen,
+        ),
+    }
+    results = {}
+    for stage, (fn, before) in stages.items():
+        if args.stages and stage not in args.stages:
+            continue
+        iterations = max(1, args.iterations // 5) if stage == "generate_automation_code" else args.iterations
+        results[stage] = run_stage(fn, iterations, before)
+        print(f"{name:>6} {stage:<26} {results[stage]['median_ms']:9.1f} ms median  "
+              f"{results[stage]['throughput_per_s']:8.1f}/s  peak {results[stage]['alloc_peak_kb']:9.0f} KB")
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print median changes against the baseline; return the stages slower by more than `tolerance`."""
+    regressions = []
+    for name, stages in results.items():
+        for stage, result in stages.items():
+            before = baseline.get("results", {}).get(name, {}).get(stage)
+            if before is None:
+                continue
+            change = result["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0.0
+            flag = "REGRESSION" if change > tolerance else ("faster" if change < -tolerance else "")
+            print(f"{name:>6} {stage:<26} {before['median_ms']:9.1f} -> {result['median_ms']:9.1f} ms  {100 * change:+6.1f}%  {flag}")
+            if change > tolerance:
+                regressions.append(f"{name}/{stage}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolutions", default="1080p,1440p,4k", help=f"comma separated, from {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--frames-dir", help="directory of recorded PNG frames (synthetic frames when omitted)")
+    parser.add_argument("--frame-count", type=int, default=4, help="number of synthetic frames")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake OpenAI request")
+    parser.add_argument("--stages", help="comma separated subset of stages to run")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare with the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed median slowdown against the baseline")
+    args = parser.parse_args()
+    args.stages = set(args.stages.split(",")) if args.stages else None
+
+    names = [name.strip().lower() for name in args.resolutions.split(",")]
+    screen = FakeScreen.synthetic(RESOLUTIONS[names[0]], count=1)
+    modules = load_modules(screen)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in names:
+            results[name] = bench_resolution(name, RESOLUTIONS[name], args, workdir, screen, modules)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "frames": args.frames_dir or "synthetic",
+            "llm_latency": args.llm_latency,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"Regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
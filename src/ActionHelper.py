@@ -0,0 +1,346 @@
+import ast
+import codeop
+import hashlib
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+import pyautogui
+from pydantic import BaseModel
+from SettleHelper import settle_detector, with_settle
+from InputBackendHelper import restore_clipboard
+
+# Keyboard actions that can run back to back without a pause or settle wait between them
+KEYBOARD_ACTIONS = {
+    'type_text', 'press_key', 'hotkey',
+    'pyautogui.write', 'pyautogui.typewrite', 'pyautogui.press', 'pyautogui.hotkey',
+    'pyautogui.keyDown', 'pyautogui.keyUp',
+}
+# Modules the generated scripts may import; the imports themselves are no-ops
+ALLOWED_IMPORTS = {'pyautogui', 'time'}
+
+
+class Action(BaseModel):
+    name: str
+    args: List[Any] = []
+    kwargs: Dict[str, Any] = {}
+    line: int = 0
+
+
+class ActionParseError(ValueError):
+    pass
+
+
+def pyautogui_functions() -> Dict[str, Callable]:
+    """
+    The surface available to generated PyAutoGUI scripts, keyed by dotted name. Each
+    input function waits for the screen to settle afterwards, and time.sleep() sleeps the
+    requested duration and is recorded with the settle times.
+    """
+    point_names = ['click', 'doubleClick', 'tripleClick', 'rightClick', 'middleClick', 'moveTo', 'dragTo', 'mouseDown', 'mouseUp']
+    other_names = ['moveRel', 'move', 'dragRel', 'drag', 'scroll', 'hscroll', 'vscroll', 'write', 'typewrite', 'press', 'hotkey', 'keyDown', 'keyUp']
+    functions = {}
+    for name in point_names + other_names:
+        functions[f'pyautogui.{name}'] = with_settle(getattr(pyautogui, name), name, point_args=name in point_names)
+    functions['time.sleep'] = settle_detector.sleep
+    return functions
+
+
+def _dotted_name(node) -> str:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return f"{_dotted_name(node.value)}.{node.attr}"
+    raise ActionParseError("only plain function calls are allowed")
+
+
+def _literal(node, constants: Dict[str, Any]):
+    if isinstance(node, ast.Name) and node.id in constants:
+        return constants[node.id]
+    return ast.literal_eval(node)
+
+
+def parse_actions(source: str, allowed_names) -> Tuple[Action, ...]:
+    """
+    Parse a generated script into a tuple of Actions without executing anything.
+
+    Only calls to `allowed_names` with literal arguments, `name = literal` assignments
+    (substituted into later calls) and imports of pyautogui/time are accepted; anything
+    else raises ActionParseError with the offending line.
+    """
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        raise ActionParseError(f"line {e.lineno}: {e.msg}")
+    return tuple(_tree_actions(tree, allowed_names, {}))
+
+
+def _tree_actions(tree, allowed_names, constants: Dict[str, Any]) -> List[Action]:
+    # `constants` is updated in place, so assignments carry over between calls on the same script
+    actions = []
+    for statement in tree.body:
+        line = statement.lineno
+        try:
+            if isinstance(statement, (ast.Import, ast.ImportFrom)):
+                modules = [statement.module] if isinstance(statement, ast.ImportFrom) else [a.name for a in statement.names]
+                if not all(module in ALLOWED_IMPORTS for module in modules):
+                    raise ActionParseError(f"import of {', '.join(modules)} is not allowed")
+            elif isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+                constants[statement.targets[0].id] = _literal(statement.value, constants)
+            elif isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call):
+                call = statement.value
+                name = _dotted_name(call.func)
+                if name not in allowed_names:
+                    raise ActionParseError(f"{name} is not an allowed function")
+                if any(isinstance(arg, ast.Starred) for arg in call.args) or any(kw.arg is None for kw in call.keywords):
+                    raise ActionParseError("*args and **kwargs are not allowed")
+                actions.append(Action(
+                    name=name,
+                    args=[_literal(arg, constants) for arg in call.args],
+                    kwargs={kw.arg: _literal(kw.value, constants) for kw in call.keywords},
+                    line=line,
+                ))
+            elif isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant):
+                continue  # docstrings and stray literals
+            else:
+                raise ActionParseError(f"unsupported statement {type(statement).__name__}")
+        except ActionParseError as e:
+            raise ActionParseError(f"line {line}: {e}")
+        except (ValueError, TypeError, SyntaxError):
+            raise ActionParseError(f"line {line}: arguments must be literals")
+    return actions
+
+
+class StreamingActionParser:
+    """
+    StreamingActionParser:
+    ----------------------
+
+    Incremental form of parse_actions for a script that arrives in chunks. Text is
+    split into lines (stripped, with markdown fences dropped, as clean_code does) and
+    each statement is validated as soon as its last line is complete; a statement that
+    spans several lines waits until it closes. Raises ActionParseError at the first
+    statement that is invalid, without waiting for the rest of the script.
+
+    Methods:
+    - feed(text) -> List[Action]
+    - close() -> List[Action]
+    """
+
+    def __init__(self, allowed_names):
+        self.allowed_names = allowed_names
+        self.actions = []
+        self.lines = []
+        self._constants = {}
+        self._partial = ""
+        self._statement = []
+
+    @property
+    def source(self) -> str:
+        """The cleaned script received so far."""
+        return "\n".join(self.lines + [self._partial.strip()]).strip()
+
+    def feed(self, text: str) -> List[Action]:
+        """Add a chunk of model output; returns the actions completed by it."""
+        *lines, self._partial = (self._partial + text).split("\n")
+        actions = []
+        for line in lines:
+            actions.extend(self._add_line(line))
+        return actions
+
+    def close(self) -> List[Action]:
+        """End of output: the last line is complete and nothing may be left open."""
+        actions = self._add_line(self._partial) if self._partial else []
+        self._partial = ""
+        if self._statement:
+            self._parse(complete=True)
+        return actions
+
+    def _add_line(self, line: str) -> List[Action]:
+        line = line.strip()
+        if line.startswith("```"):
+            line = ""
+        self.lines.append(line)
+        self._statement.append(line)
+        return self._parse(complete=False)
+
+    def _parse(self, complete: bool) -> List[Action]:
+        first_line = len(self.lines) - len(self._statement) + 1
+        text = "\n".join(self._statement)
+        try:
+            # None means the statement is still open (unclosed bracket, string or continuation)
+            if codeop.compile_command(text, "<stream>", "exec") is None and not complete:
+                return []
+            tree = ast.parse(text)
+        except SyntaxError as e:
+            raise ActionParseError(f"line {first_line + (e.lineno or 1) - 1}: {e.msg}")
+        ast.increment_lineno(tree, first_line - 1)
+        self._statement = []
+        actions = _tree_actions(tree, self.allowed_names, self._constants)
+        self.actions.extend(actions)
+        return actions
+
+
+class ActionCache:
+    """
+    LRU cache of parsed action plans keyed by a hash of the source and the allowed surface.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compile(self, source: str, allowed_names) -> Tuple[Action, ...]:
+        key = hashlib.sha256(("\n".join(sorted(allowed_names)) + "\0" + source).encode("utf-8")).hexdigest()
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        plan = parse_actions(source, allowed_names)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.max_entries:
+                self._plans.popitem(last=False)
+        return plan
+
+
+action_cache = ActionCache()
+
+
+class ActionInterpreter:
+    """
+    ActionInterpreter:
+    ------------------
+
+    Runs a validated action plan against a table of functions. Consecutive keyboard
+    actions are run as one batch with pyautogui.PAUSE and settle waits suspended between
+    them, so the wait is paid once per batch instead of once per event. A clipboard
+    replaced by a paste in the batch is restored after the batch's settle wait.
+
+    Methods:
+    - run(actions)
+    """
+
+    def __init__(self, functions: Dict[str, Callable]):
+        self.functions = functions
+
+    def run(self, actions: Tuple[Action, ...]):
+        batch = []
+        for action in actions:
+            if action.name in KEYBOARD_ACTIONS:
+                batch.append(action)
+                continue
+            self._run_batch(batch)
+            batch = []
+            self.functions[action.name](*action.args, **action.kwargs)
+        self._run_batch(batch)
+
+    def _run_batch(self, batch: List[Action]):
+        if not batch:
+            return
+        if len(batch) == 1:
+            self.functions[batch[0].name](*batch[0].args, **batch[0].kwargs)
+            return
+        pause = pyautogui.PAUSE
+        pyautogui.PAUSE = 0
+        try:
+            with settle_detector.suspended():
+                for action in batch:
+                    self.functions[action.name](*action.args, **action.kwargs)
+        finally:
+            pyautogui.PAUSE = pause
+        time.sleep(pause)
+        settle_detector.wait(label="keyboard batch")
+        # A type_text in the batch may have pasted; its clipboard is restored once the batch settled
+        restore_clipboard(settled=settle_detector.enabled)
+
+
+def compile_and_run(source: str, functions: Dict[str, Callable]):
+    """Parse (or fetch from the cache) and run a script against `functions`. Raises ActionParseError before running anything."""
+    ActionInterpreter(functions).run(action_cache.compile(source, functions.keys()))
+
+
+class StreamingExecutor:
+    """
+    StreamingExecutor:
+    ------------------
+
+    Runs actions while the script is still being generated. A StreamingActionParser
+    validates each statement as its chunk arrives and the action is queued at once for a
+    worker thread, so input replay overlaps with generation. Actions that arrive
+    together are run as one plan, keeping ActionInterpreter's keyboard batching.
+
+    When a later statement fails validation, or an action raises, the queued actions that
+    have not started are dropped, the chunk iterator is closed (ending the request) and
+    the error is raised once the worker has stopped. Actions that already ran are not
+    undone; `executed` lists them.
+
+    Methods:
+    - run(chunks) -> Tuple[Action, ...]
+    """
+
+    def __init__(self, functions: Dict[str, Callable]):
+        self.functions = functions
+        self.parser = None
+        self.executed = []
+        self._error = None
+        self._abort = threading.Event()
+
+    @property
+    def source(self) -> str:
+        return self.parser.source if self.parser is not None else ""
+
+    def run(self, chunks: Iterable[str]) -> Tuple[Action, ...]:
+        self.parser = StreamingActionParser(self.functions.keys())
+        self.executed = []
+        self._error = None
+        self._abort.clear()
+        pending = queue.Queue()
+        worker = threading.Thread(target=self._work, args=(pending,), daemon=True)
+        worker.start()
+        try:
+            for chunk in chunks:
+                if self._abort.is_set():
+                    break
+                for action in self.parser.feed(chunk or ""):
+                    pending.put(action)
+            else:
+                for action in self.parser.close():
+                    pending.put(action)
+        except BaseException:
+            self._abort.set()
+            raise
+        finally:
+            pending.put(None)
+            worker.join()
+            if hasattr(chunks, "close"):
+                chunks.close()
+        if self._error is not None:
+            raise self._error
+        return tuple(self.parser.actions)
+
+    def _work(self, pending: queue.Queue):
+        interpreter = ActionInterpreter(self.functions)
+        done = False
+        while not done:
+            batch = [pending.get()]
+            # Take whatever else has already arrived so keyboard runs stay batched
+            while batch[-1] is not None:
+                try:
+                    batch.append(pending.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                done = True
+                batch.pop()
+            if self._abort.is_set() or not batch:
+                continue
+            try:
+                interpreter.run(tuple(batch))
+                self.executed.extend(batch)
+            except Exception as e:
+                self._error = e
+                self._abort.set()
@@ -0,0 +1,74 @@
+import asyncio
+from dotenv import load_dotenv
+from CacheHelper import acached_completion
+from ClientHelper import get_async_llm_client
+from LLMHelper import task_plan_messages, update_task_plan_messages, plan_diff_messages, next_action_messages, task_planner_model, vision_model
+from PlanHelper import TaskPlan, get_plan_cache, plan_for_update
+
+load_dotenv()
+
+
+async def generate_task_plan(goal, use_cache=True):
+    plan_cache = get_plan_cache()
+    plan = plan_cache.get(goal) if plan_cache and use_cache else None
+    if plan is None:
+        response = await acached_completion(
+            get_async_llm_client(),
+            model=task_planner_model,
+            messages=task_plan_messages(goal),
+            use_cache=use_cache,
+            max_tokens=500,
+            temperature=0.7,
+        )
+        plan = TaskPlan.from_text(goal, response.strip())
+        if plan_cache:
+            plan_cache.put(plan)
+    return plan.render()
+
+
+async def update_task_plan(initial_task_plan, user_feedback, use_cache=True, goal=None):
+    plan_cache = get_plan_cache()
+    plan = plan_for_update(initial_task_plan, goal, plan_cache)
+    response = await acached_completion(
+        get_async_llm_client(),
+        model=task_planner_model,
+        messages=plan_diff_messages(plan, user_feedback),
+        use_cache=use_cache,
+        max_tokens=300,
+        temperature=0.0,
+    )
+    updated_plan = plan.apply_diff(response)
+    if updated_plan is None:
+        response = await acached_completion(
+            get_async_llm_client(),
+            model=task_planner_model,
+            messages=update_task_plan_messages(initial_task_plan, user_feedback),
+            use_cache=use_cache,
+            max_tokens=500,
+            temperature=0.7,
+        )
+        updated_plan = TaskPlan.from_text(plan.goal, response.strip())
+    if plan_cache and goal:
+        plan_cache.put(updated_plan)
+    return updated_plan.render()
+
+
+async def get_next_action_with_image(state_description, image, crops=None, use_cache=True, timeout=None, context=None):
+    """
+    Async get_next_action_with_image. `image` is a screenshot path or PNG bytes; the
+    request is cancelled with asyncio.TimeoutError after `timeout` seconds.
+    """
+    history = context.parts() if context else None
+    messages = await asyncio.to_thread(next_action_messages, state_description, image, crops, history)
+    response = await asyncio.wait_for(
+        acached_completion(
+            get_async_llm_client(),
+            model=vision_model,
+            messages=messages,
+            use_cache=use_cache,
+            max_tokens=200,
+            temperature=0.7,
+        ),
+        timeout,
+    )
+    return response.strip()
@@ -1,16 +1,8 @@
-def execute_command(command, gui_helper):
-    """
-    Execute the given command using the provided PyAutoGuiHelper instance.
-
-    Args:
-        command (str): The command to execute.
-        gui_helper (PyAutoGuiHelper): An instance of PyAutoGuiHelper.
+from ActionHelper import ActionInterpreter, ActionParseError, StreamingExecutor, action_cache
 
-    Returns:
-        bool: True if the command was executed successfully, False otherwise.
-    """
-    # Allowed functions mapping
-    allowed_functions = {
+def gui_functions(gui_helper):
+    """The functions model commands may call, bound to `gui_helper`."""
+    return {
         'move_mouse': gui_helper.move_mouse,
         'move_mouse_relative': gui_helper.move_mouse_relative,
         'click': gui_helper.click,
@@ -26,14 +18,54 @@ def execute_command(command, gui_helper):
         'launch_url_in_default_browser': gui_helper.launch_url_in_default_browser,
     }
 
+def execute_command(command, gui_helper):
+    """
+    Execute the given command using the provided PyAutoGuiHelper instance.
+
+    Args:
+        command (str): The command to execute.
+        gui_helper (PyAutoGuiHelper): An instance of PyAutoGuiHelper.
+
+    Returns:
+        bool: True if the command was executed successfully, False otherwise.
+    """
+    # Allowed functions mapping
+    allowed_functions = gui_functions(gui_helper)
+
     try:
-        # Prepare a safe execution environment
-        exec_globals = {'__builtins__': None}
-        exec_locals = allowed_functions.copy()
+        # Parse and validate the whole command before running any of it;
+        # repeated commands reuse the cached plan
+        actions = action_cache.compile(command, allowed_functions.keys())
+    except ActionParseError as e:
+        print(f"Rejected command, nothing was executed: {e}")
+        return False
 
-        # Execute the command
-        exec(command, exec_globals, exec_locals)
+    try:
+        ActionInterpreter(allowed_functions).run(actions)
         return True
     except Exception as e:
         print(f"Error executing command: {e}")
         return False
+
+
+def execute_streamed_command(chunks, gui_helper):
+    """
+    Execute a command while it is still being generated.
+
+    Args:
+        chunks (Iterable[str]): The command text as it arrives from the model.
+        gui_helper (PyAutoGuiHelper): An instance of PyAutoGuiHelper.
+
+    Returns:
+        tuple: (command, success) with the full command text received and whether every
+        statement was valid and ran. Statements that ran before a failure are not undone.
+    """
+    executor = StreamingExecutor(gui_functions(gui_helper))
+    try:
+        executor.run(chunks)
+        return executor.source, True
+    except ActionParseError as e:
+        print(f"Rejected command after {len(executor.executed)} action(s) ran; the rest was not executed: {e}")
+    except Exception as e:
+        print(f"Error executing command: {e}")
+    return executor.source, False
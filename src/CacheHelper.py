@@ -0,0 +1,260 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterator, Optional
+from PIL import Image
+
+
+def perceptual_hash(image, hash_size: int = 16) -> str:
+    """
+    Difference hash of an image (PIL Image or encoded bytes) as a hex string.
+
+    The image is reduced to a (hash_size + 1) x hash_size grayscale thumbnail and each
+    bit records whether a pixel is brighter than its right neighbour, so re-encoding or
+    tiny rendering noise does not change the hash.
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.open(io.BytesIO(image))
+    image.draft("L", (hash_size * 4, hash_size * 4))
+    pixels = list(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def fingerprint_messages(messages, perceptual: bool = False) -> list:
+    """
+    Copy of chat messages with every inline image replaced by a SHA-256 of its bytes, or
+    by its perceptual hash with `perceptual` (which also matches slightly different screens).
+    """
+    fingerprint = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            parts = []
+            for part in content:
+                if part.get("type") == "image_url":
+                    url = part["image_url"]["url"]
+                    if url.startswith("data:"):
+                        data = base64.b64decode(url.split(",", 1)[1])
+                        if perceptual:
+                            parts.append({"type": "image_phash", "phash": perceptual_hash(data)})
+                        else:
+                            parts.append({"type": "image_sha256", "sha256": hashlib.sha256(data).hexdigest()})
+                    else:
+                        parts.append({"type": "image_url", "url": url})
+                else:
+                    parts.append(part)
+            content = parts
+        fingerprint.append({**message, "content": content})
+    return fingerprint
+
+
+class ResponseCache:
+    """
+    ResponseCache:
+    --------------
+
+    Two-level cache for model responses: an in-memory LRU in front of a SQLite file, both
+    with TTL expiry. Keys are derived from the prompt text, model name, sampling
+    parameters and exact content hashes of attached screenshots. With
+    LLM_CACHE_PERCEPTUAL_HASH, screenshots are keyed on a 16x16 difference hash instead,
+    so near-identical screens share answers (and so can screens with small changes).
+
+    Methods:
+    - make_key(model, messages, **params) -> str
+    - get(key) -> Optional[str]
+    - put(key, value)
+    - stats() -> dict
+    - clear()
+    """
+
+    def __init__(self, path: str = None, max_entries: int = None, max_disk_entries: int = None, ttl_seconds: float = None,
+                 perceptual: bool = None):
+        self.path = os.getenv("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3") if path is None else path
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 256)) if max_entries is None else max_entries
+        self.max_disk_entries = int(os.getenv("LLM_CACHE_MAX_DISK_ENTRIES", 10000)) if max_disk_entries is None else max_disk_entries
+        self.ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)) if ttl_seconds is None else ttl_seconds
+        self.perceptual = os.getenv("LLM_CACHE_PERCEPTUAL_HASH", "false").lower() in ("true", "1", "yes") if perceptual is None else perceptual
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL)"
+            )
+            self._db.commit()
+
+    def make_key(self, model: str, messages, **params) -> str:
+        payload = json.dumps(
+            {"model": model, "messages": fingerprint_messages(messages, self.perceptual), "params": params},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[1] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] <= self.ttl_seconds:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    return row[0]
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, value, now, now),
+                )
+                # Drop expired rows, then the least recently used ones beyond the disk budget
+                self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+                self._db.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Shared ResponseCache, created on first use. Returns None when LLM_CACHE_ENABLED is false.
+    """
+    global _response_cache
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+
+def cached_completion(client, model: str, messages, use_cache: bool = True, **params) -> str:
+    """
+    Return the message content of a chat completion, served from the response cache
+    when an identical request was answered before. Pass use_cache=False to always call the API.
+    """
+    cache = get_response_cache() if use_cache else None
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, messages, **params)
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+    response = client.chat.completions.create(model=model, messages=messages, **params)
+    content = response.choices[0].message.content
+
+    if cache is not None and content is not None:
+        cache.put(key, content)
+    return content
+
+
+def stream_completion(client, model: str, messages, use_cache: bool = True, **params) -> Iterator[str]:
+    """
+    Yield the message content of a chat completion chunk by chunk as it is generated.
+    A cached answer is yielded as a single chunk. The full answer is cached only when the
+    stream is read to the end; closing the generator early closes the HTTP stream.
+    """
+    cache = get_response_cache() if use_cache else None
+    key = None
+    if cache is not None:
+        key = cache.make_key(model, messages, **params)
+        content = cache.get(key)
+        if content is not None:
+            yield content
+            return
+
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, **params)
+    parts = []
+    try:
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+
+    if cache is not None and parts:
+        cache.put(key, "".join(parts))
+
+
+async def acached_completion(client, model: str, messages, use_cache: bool = True, **params) -> str:
+    """
+    Async counterpart of cached_completion for an openai.AsyncOpenAI client. Key hashing
+    (which decodes attached screenshots) runs in a worker thread.
+    """
+    cache = get_response_cache() if use_cache else None
+    key = None
+    if cache is not None:
+        key = await asyncio.to_thread(cache.make_key, model, messages, **params)
+        content = cache.get(key)
+        if content is not None:
+            return content
+
+    response = await client.chat.completions.create(model=model, messages=messages, **params)
+    content = response.choices[0].message.content
+
+    if cache is not None and content is not None:
+        cache.put(key, content)
+    return content
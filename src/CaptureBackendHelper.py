@@ -0,0 +1,349 @@
+import ctypes
+import ctypes.util
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+import numpy as np
+from PIL import Image
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+Region = Tuple[int, int, int, int]
+
+
+class CaptureBackend:
+    """
+    CaptureBackend:
+    ---------------
+
+    Grabs the screen, or a region of it natively, as an RGB uint8 NumPy array of shape
+    (height, width, 3). Arrays may be views (BGRA with a reversed channel stride) but are
+    never overwritten by later grabs, so callers may keep them; they must not modify them.
+
+    Methods:
+    - grab(region=None) -> np.ndarray
+    - size() -> Tuple[int, int]
+    - close()
+    """
+
+    name = "base"
+
+    def grab(self, region: Optional[Region] = None) -> np.ndarray:
+        raise NotImplementedError
+
+    def size(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class _XImage(ctypes.Structure):
+    # Leading fields of Xlib's XImage; only these are read
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class _XErrorEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("resourceid", ctypes.c_ulong),
+        ("serial", ctypes.c_ulong),
+        ("error_code", ctypes.c_ubyte),
+        ("request_code", ctypes.c_ubyte),
+        ("minor_code", ctypes.c_ubyte),
+    ]
+
+
+_XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(_XErrorEvent))
+# Last X error code per display; Xlib's default handler would exit the process instead
+_x_errors = {}
+
+
+@_XErrorHandler
+def _record_x_error(display, event):
+    _x_errors[display] = event.contents.error_code
+    return 0
+
+
+class _ShmImage:
+    """One XShm image and its shared memory segment, with an RGB view over the segment."""
+
+    def __init__(self, backend: "XShmBackend", width: int, height: int):
+        x11, xext, libc, display = backend._x11, backend._xext, backend._libc, backend._display
+        self.info = _XShmSegmentInfo()
+        self.image = xext.XShmCreateImage(display, backend._visual, backend._depth, 2, None,  # 2 = ZPixmap
+                                          ctypes.byref(self.info), width, height)
+        if not self.image:
+            raise RuntimeError("XShmCreateImage failed")
+        ximage = self.image.contents
+        if ximage.bits_per_pixel != 32:
+            raise RuntimeError(f"unsupported XShm pixel format ({ximage.bits_per_pixel} bpp)")
+        size = ximage.bytes_per_line * ximage.height
+        self.info.shmid = libc.shmget(0, size, 0o1000 | 0o600)  # IPC_PRIVATE, IPC_CREAT | rw-------
+        if self.info.shmid < 0:
+            raise RuntimeError("shmget failed")
+        self.info.shmaddr = libc.shmat(self.info.shmid, None, 0)
+        ximage.data = self.info.shmaddr
+        self.info.readOnly = 0
+        attached = xext.XShmAttach(display, ctypes.byref(self.info))
+        x11.XSync(display, 0)
+        # Mark the segment for removal now so it cannot leak; it lives until detached
+        libc.shmctl(self.info.shmid, 0, None)  # IPC_RMID
+        if not attached or _x_errors.pop(display, None):
+            libc.shmdt(ctypes.c_void_p(self.info.shmaddr))
+            raise RuntimeError("XShmAttach failed")
+        buffer = (ctypes.c_ubyte * size).from_address(self.info.shmaddr)
+        bgra = np.ctypeslib.as_array(buffer).reshape(height, ximage.bytes_per_line // 4, 4)[:, :width]
+        self.rgb = bgra[..., 2::-1]
+
+    def release(self, backend: "XShmBackend"):
+        backend._xext.XShmDetach(backend._display, ctypes.byref(self.info))
+        backend._libc.shmdt(ctypes.c_void_p(self.info.shmaddr))
+
+
+class XShmBackend(CaptureBackend):
+    """
+    X11 MIT-SHM capture through ctypes: the X server copies pixels straight into shared
+    memory, one reused segment for the full screen and one per region size, so no X
+    image is allocated per grab. Each grab is copied out of its segment (converting BGRA
+    to RGB) before the lock is released, so returned arrays are never overwritten by
+    another grab. X errors, such as a region outside the screen, raise RuntimeError.
+    """
+
+    name = "xshm"
+
+    def __init__(self, max_region_sizes: int = 8):
+        if not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"):
+            raise RuntimeError("no X11 display")
+        paths = [ctypes.util.find_library(name) for name in ("X11", "Xext", "c")]
+        if not all(paths):
+            raise RuntimeError("libX11/libXext not found")
+        self._x11, self._xext, self._libc = (ctypes.CDLL(path) for path in paths)
+        self._declare()
+        self._x11.XSetErrorHandler(_record_x_error)
+        self._display = self._x11.XOpenDisplay(None)
+        if not self._display:
+            raise RuntimeError("cannot open X display")
+        if not self._xext.XShmQueryExtension(self._display):
+            self._x11.XCloseDisplay(self._display)
+            raise RuntimeError("MIT-SHM extension not available")
+        screen = self._x11.XDefaultScreen(self._display)
+        self._root = self._x11.XRootWindow(self._display, screen)
+        self._visual = self._x11.XDefaultVisual(self._display, screen)
+        self._depth = self._x11.XDefaultDepth(self._display, screen)
+        self._size = (self._x11.XDisplayWidth(self._display, screen), self._x11.XDisplayHeight(self._display, screen))
+        self._lock = threading.Lock()
+        self._full = _ShmImage(self, *self._size)
+        self._regions = OrderedDict()
+        self.max_region_sizes = max_region_sizes
+
+    def _declare(self):
+        x11, xext, libc = self._x11, self._xext, self._libc
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XRootWindow.restype = ctypes.c_ulong
+        x11.XRootWindow.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSetErrorHandler.restype = ctypes.c_void_p
+        x11.XSetErrorHandler.argtypes = [_XErrorHandler]
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmCreateImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p,
+                                         ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage), ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def size(self) -> Tuple[int, int]:
+        return self._size
+
+    def grab(self, region: Optional[Region] = None) -> np.ndarray:
+        with self._lock:
+            if region is None:
+                shm = self._full
+                left, top = 0, 0
+            else:
+                left, top, width, height = (int(v) for v in region)
+                shm = self._regions.get((width, height))
+                if shm is None:
+                    shm = _ShmImage(self, width, height)
+                    self._regions[(width, height)] = shm
+                    while len(self._regions) > self.max_region_sizes:
+                        self._regions.popitem(last=False)[1].release(self)
+                self._regions.move_to_end((width, height))
+            _x_errors.pop(self._display, None)
+            if not self._xext.XShmGetImage(self._display, self._root, shm.image, left, top, ctypes.c_ulong(-1).value):
+                error = _x_errors.pop(self._display, None)
+                raise RuntimeError(f"XShmGetImage failed for region {region}" + (f" (X error {error})" if error else ""))
+            return np.ascontiguousarray(shm.rgb)
+
+    def close(self):
+        with self._lock:
+            for shm in [self._full] + list(self._regions.values()):
+                shm.release(self)
+            self._full, self._regions = None, OrderedDict()
+            self._x11.XCloseDisplay(self._display)
+            _x_errors.pop(self._display, None)
+
+
+class MssBackend(CaptureBackend):
+    """
+    Capture with the optional `mss` package (X11, macOS, Windows), on the primary monitor.
+    Each grab gets its own buffer, so views stay valid indefinitely.
+    """
+
+    name = "mss"
+
+    def __init__(self):
+        if mss is None:
+            raise RuntimeError("mss is not installed")
+        # mss instances are not shareable across threads
+        self._local = threading.local()
+        self._monitor = self._sct().monitors[1]
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
+    def size(self) -> Tuple[int, int]:
+        return (self._monitor["width"], self._monitor["height"])
+
+    def grab(self, region: Optional[Region] = None) -> np.ndarray:
+        if region is None:
+            monitor = self._monitor
+        else:
+            left, top, width, height = (int(v) for v in region)
+            monitor = {"left": self._monitor["left"] + left, "top": self._monitor["top"] + top, "width": width, "height": height}
+        shot = self._sct().grab(monitor)
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)[..., 2::-1]
+
+
+class FramebufferBackend(CaptureBackend):
+    """
+    An in-memory screen for tests and benchmarks. set_frame() replaces the screen
+    contents; grabs are views into the current frame.
+    """
+
+    name = "framebuffer"
+
+    def __init__(self, frame=None, size: Tuple[int, int] = (1920, 1080)):
+        self.set_frame(frame if frame is not None else np.zeros((size[1], size[0], 3), dtype=np.uint8))
+
+    def set_frame(self, frame):
+        """Use `frame` (PIL Image or RGB array) as the screen contents."""
+        if isinstance(frame, Image.Image):
+            frame = np.asarray(frame.convert("RGB"))
+        self._frame = frame
+
+    def size(self) -> Tuple[int, int]:
+        return (self._frame.shape[1], self._frame.shape[0])
+
+    def grab(self, region: Optional[Region] = None) -> np.ndarray:
+        if region is None:
+            return self._frame
+        left, top, width, height = (int(v) for v in region)
+        return self._frame[top:top + height, left:left + width]
+
+
+class PyAutoGuiBackend(CaptureBackend):
+    """Fallback through pyautogui.screenshot; one PIL image and one array per grab."""
+
+    name = "pyautogui"
+
+    def __init__(self):
+        import pyautogui
+        self._pyautogui = pyautogui
+
+    def size(self) -> Tuple[int, int]:
+        return tuple(self._pyautogui.size())
+
+    def grab(self, region: Optional[Region] = None) -> np.ndarray:
+        image = self._pyautogui.screenshot(region=region)
+        return np.asarray(image.convert("RGB") if image.mode != "RGB" else image)
+
+
+BACKENDS = {backend.name: backend for backend in (XShmBackend, MssBackend, FramebufferBackend, PyAutoGuiBackend)}
+# Tried in this order when CAPTURE_BACKEND is "auto"
+AUTO_ORDER = ("xshm", "mss", "pyautogui")
+
+
+def create_backend(name: str = None) -> CaptureBackend:
+    """
+    Create the capture backend named by `name` or CAPTURE_BACKEND (xshm, mss, framebuffer,
+    pyautogui or auto). With auto, the fastest backend that works on this machine is used.
+    """
+    name = (name or os.getenv("CAPTURE_BACKEND", "auto")).lower()
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown capture backend {name!r}; expected one of {', '.join(BACKENDS)} or auto")
+        return BACKENDS[name]()
+    for candidate in AUTO_ORDER:
+        try:
+            backend = BACKENDS[candidate]()
+            print(f"Capture backend: {backend.name}")
+            return backend
+        except Exception as e:
+            print(f"Capture backend {candidate} unavailable: {e}")
+    raise RuntimeError("No capture backend available")
+
+
+_capture_backend = None
+_capture_backend_lock = threading.Lock()
+
+
+def get_capture_backend() -> CaptureBackend:
+    """Shared capture backend, selected on first use."""
+    global _capture_backend
+    with _capture_backend_lock:
+        if _capture_backend is None:
+            _capture_backend = create_backend()
+        return _capture_backend
+
+
+def set_capture_backend(backend: CaptureBackend):
+    """Replace the shared backend, e.g. with a FramebufferBackend in tests."""
+    global _capture_backend
+    with _capture_backend_lock:
+        _capture_backend = backend
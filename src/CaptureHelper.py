@@ -0,0 +1,158 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Tuple
+import numpy as np
+import pyautogui
+from PIL import Image
+from CaptureBackendHelper import get_capture_backend
+
+
+class Frame:
+    """
+    A captured screen frame with its capture time and cursor position.
+
+    Frames from a capture backend hold an RGB `array` that no later grab overwrites;
+    `image` is created from it on first access. Both are shared by every
+    consumer of the frame and must not be modified; use CaptureService.screenshot() to get
+    a private copy. The content hash is computed on first access.
+    """
+
+    def __init__(self, image: Image = None, timestamp: float = 0.0, cursor: Tuple[int, int] = (0, 0), array: np.ndarray = None,
+                 generation: int = 0):
+        self._image = image
+        self._array = array
+        self.timestamp = timestamp
+        self.cursor = cursor
+        self.generation = generation
+        self._content_hash = None
+
+    @property
+    def image(self) -> Image:
+        if self._image is None:
+            self._image = Image.fromarray(np.ascontiguousarray(self._array))
+        return self._image
+
+    @property
+    def array(self) -> np.ndarray:
+        if self._array is None:
+            self._array = np.asarray(self._image)
+        return self._array
+
+    @property
+    def age_ms(self) -> float:
+        return (time.monotonic() - self.timestamp) * 1000
+
+    @property
+    def content_hash(self) -> str:
+        if self._content_hash is None:
+            self._content_hash = hashlib.blake2b(np.ascontiguousarray(self.array).data, digest_size=16).hexdigest()
+        return self._content_hash
+
+
+class CaptureService:
+    """
+    CaptureService:
+    ---------------
+
+    Shares screen captures between consumers. Every grab is kept in a bounded ring buffer
+    of recent frames, so a consumer that can tolerate a frame up to N ms old reuses the
+    newest one instead of triggering another X11 grab. At most `max_frames` frames
+    (CAPTURE_FRAME_BUDGET) are held in memory. Input actions call invalidate(), after
+    which frames grabbed before the input are no longer reused, however recent.
+
+    Grabs go through the capture backend (see CaptureBackendHelper) unless a `grab`
+    function returning PIL images is given.
+
+    Methods:
+    - grab() -> Frame
+    - grab_region(region) -> np.ndarray
+    - get_frame(max_age_ms=None) -> Frame
+    - screenshot(region=None, max_age_ms=None) -> Image
+    - copy_image(frame, region=None) -> Image
+    - pixel(x, y, max_age_ms=None) -> Tuple[int, int, int]
+    - frames() -> List[Frame]
+    - invalidate()
+    - clear()
+    """
+
+    def __init__(self, grab: Callable = None, cursor: Callable = None, max_frames: int = None):
+        self._grab = grab
+        self._cursor = cursor or pyautogui.position
+        self.max_frames = int(os.getenv("CAPTURE_FRAME_BUDGET", 4)) if max_frames is None else max_frames
+        self._frames = deque(maxlen=max(self.max_frames, 1))
+        self._lock = threading.Lock()
+        self.grabs = 0
+        self.reuses = 0
+        self._generation = 0
+
+    def grab(self) -> Frame:
+        # Read before grabbing: input that lands during the grab makes this frame stale
+        generation = self._generation
+        if self._grab is not None:
+            frame_data = {"image": self._grab()}
+        else:
+            frame_data = {"array": get_capture_backend().grab()}
+        position = self._cursor()
+        frame = Frame(timestamp=time.monotonic(), cursor=(position[0], position[1]), generation=generation, **frame_data)
+        with self._lock:
+            self._frames.append(frame)
+            self.grabs += 1
+        return frame
+
+    def grab_region(self, region: Tuple[int, int, int, int]) -> np.ndarray:
+        """A fresh, native grab of just `region`, bypassing the frame buffer."""
+        if self._grab is not None:
+            left, top, width, height = region
+            return np.asarray(self._grab().crop((left, top, left + width, top + height)))
+        return get_capture_backend().grab(region)
+
+    def get_frame(self, max_age_ms: float = None) -> Frame:
+        """Return the newest frame if it is no older than max_age_ms, otherwise grab a new one."""
+        if max_age_ms is not None and max_age_ms > 0:
+            with self._lock:
+                frame = self._frames[-1] if self._frames else None
+                if frame is not None and frame.generation == self._generation and frame.age_ms <= max_age_ms:
+                    self.reuses += 1
+                    return frame
+        return self.grab()
+
+    def screenshot(self, region: Tuple[int, int, int, int] = None, max_age_ms: float = None) -> Image:
+        """A private copy of a (possibly reused) frame, cropped to region if given."""
+        return self.copy_image(self.get_frame(max_age_ms), region)
+
+    @staticmethod
+    def copy_image(frame: Frame, region: Tuple[int, int, int, int] = None) -> Image:
+        """A private PIL copy of `frame`, cropped to region if given."""
+        if frame._image is None:
+            # Converting the (cropped) array makes the private copy directly
+            array = frame.array
+            if region is not None:
+                left, top, width, height = region
+                array = array[top:top + height, left:left + width]
+            return Image.fromarray(np.ascontiguousarray(array))
+        if region is None:
+            return frame.image.copy()
+        left, top, width, height = region
+        return frame.image.crop((left, top, left + width, top + height))
+
+    def pixel(self, x: int, y: int, max_age_ms: float = None) -> Tuple[int, int, int]:
+        return tuple(int(c) for c in self.get_frame(max_age_ms).array[y, x, :3])
+
+    def frames(self) -> List[Frame]:
+        with self._lock:
+            return list(self._frames)
+
+    def invalidate(self):
+        """Stop reusing the frames grabbed so far, e.g. because input may have changed the screen."""
+        with self._lock:
+            self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+
+
+capture_service = CaptureService()
@@ -0,0 +1,350 @@
+import asyncio
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Optional
+import httpx
+
+# Status codes worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def is_api_error(error: Exception) -> bool:
+    """Whether `error` came from the API, as opposed to a bug in the caller. Does not import openai."""
+    openai = sys.modules.get("openai")
+    return openai is not None and isinstance(error, openai.APIError)
+
+
+def retryable(error: Exception) -> bool:
+    """Whether a failed request may be sent again unchanged."""
+    if not is_api_error(error):
+        return False
+    openai = sys.modules["openai"]
+    if isinstance(error, openai.APIConnectionError):  # includes APITimeoutError
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked to wait (Retry-After), if it did."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class TokenBucket:
+    """
+    TokenBucket:
+    ------------
+
+    Rate limiter shared by sync and async callers: `rate` requests per second on average,
+    with bursts of up to `burst`. A rate of 0 disables it.
+
+    Methods:
+    - reserve() -> float
+    - acquire()
+    - aacquire()
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return how long to wait before using it."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self):
+        wait = self.reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self):
+        wait = self.reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+
+class LatencyTracker:
+    """Recent request latencies; percentile() is None until `min_samples` were seen."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(percent / 100 * len(samples)))]
+
+
+class _ClientSettings:
+    def __init__(self, base_url=None, max_retries=None, retry_base_seconds=None, retry_max_seconds=None,
+                 hedge=None, hedge_percentile=None, hedge_delay_seconds=None, rate_limiter=None):
+        self.base_url = os.getenv("OPENAI_BASE_URL") or None if base_url is None else base_url
+        self.timeout = float(os.getenv("LLM_TIMEOUT_SECONDS", 60))
+        self.max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", 8))
+        self.max_retries = int(os.getenv("LLM_MAX_RETRIES", 3)) if max_retries is None else max_retries
+        self.retry_base_seconds = float(os.getenv("LLM_RETRY_BASE_SECONDS", 0.5)) if retry_base_seconds is None else retry_base_seconds
+        self.retry_max_seconds = float(os.getenv("LLM_RETRY_MAX_SECONDS", 20)) if retry_max_seconds is None else retry_max_seconds
+        self.hedge = os.getenv("LLM_HEDGE_ENABLED", "false").lower() in ("true", "1", "yes") if hedge is None else hedge
+        self.hedge_percentile = float(os.getenv("LLM_HEDGE_PERCENTILE", 95)) if hedge_percentile is None else hedge_percentile
+        self.hedge_delay_seconds = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", 10)) if hedge_delay_seconds is None else hedge_delay_seconds
+        self.rate_limiter = get_rate_limiter() if rate_limiter is None else rate_limiter
+        self._latencies = {}
+        self._latencies_lock = threading.Lock()
+
+    def latencies(self, params: dict) -> LatencyTracker:
+        """Latencies of requests like `params`: prompts of one model and answer length take comparable time."""
+        key = (params.get("model"), params.get("max_tokens"))
+        with self._latencies_lock:
+            if key not in self._latencies:
+                self._latencies[key] = LatencyTracker()
+            return self._latencies[key]
+
+    def record_latency(self, params: dict, seconds: float):
+        # A stream returns once the headers arrive, so its latency says nothing about a full answer
+        if not params.get("stream"):
+            self.latencies(params).add(seconds)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, or the server's Retry-After when it gave one."""
+        requested = retry_after(error)
+        if requested is not None:
+            return min(requested, self.retry_max_seconds)
+        return random.uniform(0, min(self.retry_max_seconds, self.retry_base_seconds * 2 ** attempt))
+
+    def hedge_delay(self, params: dict) -> float:
+        """Seconds to wait for the first request before a backup is sent: the observed p95 once known."""
+        observed = self.latencies(params).percentile(self.hedge_percentile)
+        return self.hedge_delay_seconds if observed is None else observed
+
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+
+
+class _Namespace:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class LLMClient:
+    """
+    LLMClient:
+    ----------
+
+    Chat completions client shared by the app: one pooled HTTP connection
+    (LLM_MAX_CONNECTIONS, LLM_TIMEOUT_SECONDS, OPENAI_BASE_URL), the shared token bucket
+    (LLM_RATE_LIMIT_PER_SECOND, LLM_RATE_LIMIT_BURST), and up to LLM_MAX_RETRIES retries
+    with jittered exponential backoff on connection errors, timeouts, 429 and 5xx.
+
+    With LLM_HEDGE_ENABLED, a non-streaming request that has not answered within the
+    observed p95 latency of requests for the same model and max_tokens
+    (LLM_HEDGE_PERCENTILE; LLM_HEDGE_DELAY_SECONDS until enough were seen) gets one backup
+    request, and the first answer wins. Hedged requests run on an AsyncLLMClient in a
+    private event loop, so the losing request is cancelled rather than left running.
+
+    Exposes chat.completions.create like openai.OpenAI, so it is passed wherever a client is.
+
+    Methods:
+    - create(**params)
+    - close()
+    """
+
+    def __init__(self, api_key: str = None, **settings):
+        # Imported here, on first use, since importing openai dominates start-up time
+        import openai
+
+        self.settings = _ClientSettings(**settings)
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self.client = openai.OpenAI(
+            api_key=self.api_key,
+            base_url=self.settings.base_url,
+            timeout=self.settings.timeout,
+            max_retries=0,
+            http_client=httpx.Client(limits=self.settings.limits()),
+        )
+        self.chat = _Namespace(completions=_Namespace(create=self.create))
+        self._hedger = None
+        self._hedger_loop = None
+        self._hedger_lock = threading.Lock()
+
+    @property
+    def hedged(self) -> int:
+        return self._hedger.hedged if self._hedger is not None else 0
+
+    def create(self, **params):
+        if not self.settings.hedge or params.get("stream"):
+            return self._send(params)
+        return self._send_hedged(params)
+
+    def _send(self, params):
+        attempt = 0
+        while True:
+            self.settings.rate_limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = self.client.chat.completions.create(**params)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.settings.max_retries:
+                    raise
+                delay = self.settings.backoff(attempt, e)
+                attempt += 1
+                print(f"LLM request failed ({type(e).__name__}); retry {attempt}/{self.settings.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.settings.record_latency(params, time.monotonic() - start)
+            return response
+
+    def _send_hedged(self, params):
+        with self._hedger_lock:
+            if self._hedger is None:
+                # Cancelling an asyncio task aborts its HTTP request; a blocked sync call cannot be
+                self._hedger_loop = asyncio.new_event_loop()
+                threading.Thread(target=self._hedger_loop.run_forever, daemon=True, name="llm-hedge").start()
+                self._hedger = AsyncLLMClient(api_key=self.api_key, settings=self.settings)
+        return asyncio.run_coroutine_threadsafe(self._hedger.create(**params), self._hedger_loop).result()
+
+    def close(self):
+        self.client.close()
+        with self._hedger_lock:
+            if self._hedger is not None:
+                asyncio.run_coroutine_threadsafe(self._hedger.close(), self._hedger_loop).result()
+                self._hedger_loop.call_soon_threadsafe(self._hedger_loop.stop)
+                self._hedger = self._hedger_loop = None
+
+
+class AsyncLLMClient:
+    """
+    AsyncLLMClient:
+    ---------------
+
+    Async counterpart of LLMClient over openai.AsyncOpenAI, with the same settings and the
+    same shared token bucket. The losing request of a hedged pair is cancelled.
+
+    Methods:
+    - create(**params)
+    - close()
+    """
+
+    def __init__(self, api_key: str = None, settings: _ClientSettings = None, **overrides):
+        import openai
+
+        # A sync LLMClient passes its own settings, so both share latency statistics
+        self.settings = settings or _ClientSettings(**overrides)
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=self.settings.base_url,
+            timeout=self.settings.timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=self.settings.limits()),
+        )
+        self.chat = _Namespace(completions=_Namespace(create=self.create))
+        self.hedged = 0
+
+    async def create(self, **params):
+        if not self.settings.hedge or params.get("stream"):
+            return await self._send(params)
+        return await self._send_hedged(params)
+
+    async def _send(self, params):
+        attempt = 0
+        while True:
+            await self.settings.rate_limiter.aacquire()
+            start = time.monotonic()
+            try:
+                response = await self.client.chat.completions.create(**params)
+            except Exception as e:
+                if not retryable(e) or attempt >= self.settings.max_retries:
+                    raise
+                delay = self.settings.backoff(attempt, e)
+                attempt += 1
+                print(f"LLM request failed ({type(e).__name__}); retry {attempt}/{self.settings.max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            self.settings.record_latency(params, time.monotonic() - start)
+            return response
+
+    async def _send_hedged(self, params):
+        first = asyncio.ensure_future(self._send(params))
+        done, _ = await asyncio.wait([first], timeout=self.settings.hedge_delay(params))
+        if done:
+            return first.result()
+        self.hedged += 1
+        pending = {first, asyncio.ensure_future(self._send(params))}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                task = done.pop()
+                if task.exception() is None or not pending:
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def close(self):
+        await self.client.close()
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+_llm_client = None
+_async_llm_client = None
+_clients_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucket:
+    """Token bucket shared by every client in the process."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = TokenBucket(float(os.getenv("LLM_RATE_LIMIT_PER_SECOND", 0)), int(os.getenv("LLM_RATE_LIMIT_BURST", 4)))
+        return _rate_limiter
+
+
+def get_llm_client() -> LLMClient:
+    """Shared LLMClient, created on first use."""
+    global _llm_client
+    with _clients_lock:
+        if _llm_client is None:
+            _llm_client = LLMClient()
+        return _llm_client
+
+
+def get_async_llm_client() -> AsyncLLMClient:
+    """Shared AsyncLLMClient, created on first use."""
+    global _async_llm_client
+    with _clients_lock:
+        if _async_llm_client is None:
+            _async_llm_client = AsyncLLMClient()
+        return _async_llm_client
+
+
+async def close_async_llm_client():
+    global _async_llm_client
+    if _async_llm_client is not None:
+        await _async_llm_client.close()
+        _async_llm_client = None
@@ -0,0 +1,160 @@
+import base64
+import io
+import os
+import threading
+from collections import deque
+from typing import List, Optional
+from PIL import Image
+from pydantic import BaseModel
+from PromptHelper import LOW_DETAIL_IMAGE_TOKENS, count_tokens
+
+HISTORY_HEADER = "Previous steps, oldest first (the current screenshot follows):"
+
+
+class ContextEntry(BaseModel):
+    step: int
+    action: str
+    result: str
+    thumbnail: Optional[bytes] = None
+
+    def line(self, max_chars: int) -> str:
+        # Multi-line commands are shown as one line, cut to `max_chars`
+        action = " ".join(self.action.split())
+        if len(action) > max_chars:
+            action = action[:max_chars - 3] + "..."
+        return f"Step {self.step}: {action} -> {self.result}"
+
+
+class AgentContext:
+    """
+    AgentContext:
+    -------------
+
+    Rolling history of the agent's past steps (action, result, frame) for the next-action
+    request. The last CONTEXT_MAX_ENTRIES steps are kept as one line each, and the newest
+    CONTEXT_THUMBNAIL_ENTRIES of them also carry a thumbnail of the screen the action ran
+    on (at most CONTEXT_THUMBNAIL_SIDE pixels, encoded once as JPEG). Steps that fall out
+    of the window are folded into a one-line summary.
+
+    parts() returns the history as content parts under CONTEXT_MAX_TOKENS tokens and
+    CONTEXT_MAX_IMAGE_BYTES image bytes: thumbnails are dropped oldest first, then step
+    lines, which then count towards the summary. Disabled with CONTEXT_HISTORY_ENABLED.
+
+    Methods:
+    - record(action, result, frame=None)
+    - parts() -> list
+    - measure() -> dict
+    - clear()
+    """
+
+    def __init__(self, max_entries: int = None, thumbnail_entries: int = None, thumbnail_side: int = None,
+                 max_tokens: int = None, max_image_bytes: int = None, max_action_chars: int = 160):
+        self.max_entries = int(os.getenv("CONTEXT_MAX_ENTRIES", 8)) if max_entries is None else max_entries
+        self.thumbnail_entries = int(os.getenv("CONTEXT_THUMBNAIL_ENTRIES", 2)) if thumbnail_entries is None else thumbnail_entries
+        self.thumbnail_side = int(os.getenv("CONTEXT_THUMBNAIL_SIDE", 320)) if thumbnail_side is None else thumbnail_side
+        self.max_tokens = int(os.getenv("CONTEXT_MAX_TOKENS", 1500)) if max_tokens is None else max_tokens
+        self.max_image_bytes = int(os.getenv("CONTEXT_MAX_IMAGE_BYTES", 128 * 1024)) if max_image_bytes is None else max_image_bytes
+        self.max_action_chars = max_action_chars
+        self.entries = deque()
+        self.steps = 0
+        self.folded = 0
+        self.folded_failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, action: str, result: str, frame: Image.Image = None):
+        """Add a step. `frame` is the screen the action ran on; only the thumbnail is kept."""
+        with self._lock:
+            self.steps += 1
+            entry = ContextEntry(step=self.steps, action=action, result=result)
+            if frame is not None and self.thumbnail_entries > 0:
+                entry.thumbnail = self._thumbnail(frame)
+            self.entries.append(entry)
+            while len(self.entries) > self.max_entries:
+                self._fold(self.entries.popleft())
+            # Thumbnails older than the newest thumbnail_entries are never sent again
+            for old in list(self.entries)[:-self.thumbnail_entries or None]:
+                old.thumbnail = None
+
+    def parts(self) -> List[dict]:
+        """History as chat content parts within the budget, or [] when there is no history."""
+        with self._lock:
+            entries = list(self.entries)
+            folded, folded_failures = self.folded, self.folded_failures
+        if not entries and not folded:
+            return []
+        lines = [entry.line(self.max_action_chars) for entry in entries]
+        with_thumbnail = [entry.thumbnail is not None for entry in entries]
+        while True:
+            tokens = count_tokens("\n".join([HISTORY_HEADER, self._summary(folded, folded_failures)] + lines))
+            tokens += LOW_DETAIL_IMAGE_TOKENS * sum(with_thumbnail)
+            image_bytes = sum(len(entry.thumbnail) for entry, keep in zip(entries, with_thumbnail) if keep)
+            if tokens <= self.max_tokens and image_bytes <= self.max_image_bytes:
+                break
+            if any(with_thumbnail):
+                with_thumbnail[with_thumbnail.index(True)] = False
+            elif entries:
+                entry = entries.pop(0)
+                lines.pop(0)
+                with_thumbnail.pop(0)
+                folded += 1
+                folded_failures += entry.result != "succeeded"
+            else:
+                break
+
+        text = [HISTORY_HEADER]
+        summary = self._summary(folded, folded_failures)
+        if summary:
+            text.append(summary)
+        parts = []
+        for entry, line, keep in zip(entries, lines, with_thumbnail):
+            text.append(line)
+            if keep:
+                parts.append({"type": "text", "text": "\n".join(text)})
+                parts.append({
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{base64.b64encode(entry.thumbnail).decode('utf-8')}", "detail": "low"},
+                })
+                text = []
+        if text:
+            parts.append({"type": "text", "text": "\n".join(text)})
+        return parts
+
+    def measure(self) -> dict:
+        """Tokens and image bytes parts() currently sends."""
+        parts = self.parts()
+        texts = [part["text"] for part in parts if part["type"] == "text"]
+        images = [base64.b64decode(part["image_url"]["url"].split(",", 1)[1]) for part in parts if part["type"] == "image_url"]
+        return {
+            "entries": len(self.entries),
+            "tokens": sum(count_tokens(text) for text in texts) + LOW_DETAIL_IMAGE_TOKENS * len(images),
+            "image_bytes": sum(len(data) for data in images),
+        }
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.steps = self.folded = self.folded_failures = 0
+
+    def _fold(self, entry: ContextEntry):
+        self.folded += 1
+        self.folded_failures += entry.result != "succeeded"
+
+    @staticmethod
+    def _summary(folded: int, failures: int) -> str:
+        if not folded:
+            return ""
+        return f"Steps 1-{folded} (not shown): {folded - failures} succeeded, {failures} failed or were done manually."
+
+    def _thumbnail(self, frame: Image.Image):
+        image = frame.convert("RGB")
+        image.thumbnail((self.thumbnail_side, self.thumbnail_side), Image.BILINEAR)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=70)
+        return buffer.getvalue()
+
+
+def create_agent_context() -> Optional[AgentContext]:
+    """A new AgentContext for one agent run, or None when CONTEXT_HISTORY_ENABLED is false."""
+    if os.getenv("CONTEXT_HISTORY_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None
+    return AgentContext()
@@ -0,0 +1,443 @@
+"""
+Long-running agent daemon with a local request API, and a client for it.
+
+The daemon is started with `python app.py --daemon`. It warms the capture service, fonts,
+grid overlays, templates and the LLM client once, then serves instructions one at a time
+from a queue. Clients talk HTTP over a Unix socket (AGENT_DAEMON_SOCKET, mode 0600) or over TCP on
+127.0.0.1 when AGENT_DAEMON_PORT is set. In TCP mode every request must carry the bearer
+token the daemon writes to AGENT_DAEMON_TOKEN_FILE (mode 0600). Requests with an Origin
+header are refused and POST bodies must be application/json, so a web page in the
+user's browser cannot submit jobs.
+
+Usage:
+    python src/DaemonHelper.py submit "Click the Buy Now button" --execute --wait 60
+    python src/DaemonHelper.py result <job id> --wait 30
+    python src/DaemonHelper.py cancel <job id>
+    python src/DaemonHelper.py status
+
+Endpoints:
+    POST   /jobs          {"instruction": "...", "execute": false} -> 202 with the queued job
+                          (execute must be a JSON boolean; other keys are rejected)
+    GET    /jobs/<id>     job status and result; ?wait=<seconds> waits for it to finish
+    DELETE /jobs/<id>     cancel a queued job
+    GET    /status        queue length, current job, uptime and warm-up results
+
+This module only uses the standard library, so the client starts without loading the
+app's heavy dependencies.
+"""
+import argparse
+import hmac
+import http.client
+import itertools
+import json
+import math
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_SOCKET = "/tmp/open-computer-use.sock"
+DEFAULT_TOKEN_FILE = os.path.join("~", ".cache", "open-computer-use", "daemon.token")
+# Options a job may carry, with their required types; they are passed to the handler as keywords
+JOB_OPTIONS = {"execute": bool}
+
+
+class Job:
+    """One queued instruction and, once it ran, its result or error."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, instruction: str, options: dict):
+        self.id = f"{int(time.time())}-{next(self._ids)}"
+        self.instruction = instruction
+        self.options = options
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "instruction": self.instruction,
+            "options": self.options,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class AgentDaemon:
+    """
+    AgentDaemon:
+    ------------
+
+    Request queue and HTTP API in front of a `handler(instruction, **options) -> dict`.
+    Jobs run one at a time on a worker thread (there is one screen and one keyboard),
+    after `warm()` has run once. The last AGENT_DAEMON_MAX_JOBS jobs are kept for
+    status and result requests.
+
+    Methods:
+    - start() -> AgentDaemon
+    - serve_forever()
+    - shutdown()
+    - submit(instruction, **options) -> Job
+    - get(job_id) -> Optional[Job]
+    - cancel(job_id) -> bool
+    - status() -> dict
+    - address
+    """
+
+    def __init__(self, handler: Callable[..., dict], warm: Callable[[], dict] = None, socket_path: str = None,
+                 port: int = None, max_jobs: int = None):
+        self.handler = handler
+        self.warm = warm
+        self.socket_path = os.getenv("AGENT_DAEMON_SOCKET", DEFAULT_SOCKET) if socket_path is None else socket_path
+        self.port = int(os.getenv("AGENT_DAEMON_PORT", 0)) if port is None else port
+        self.max_jobs = int(os.getenv("AGENT_DAEMON_MAX_JOBS", 100)) if max_jobs is None else max_jobs
+        self.token = _write_token(token_path()) if self.port else None
+        self.jobs = OrderedDict()
+        self.current = None
+        self.warm_up = None
+        self.started = time.time()
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._server = self._make_server()
+        self._background = False
+
+    @property
+    def address(self) -> str:
+        if self.port:
+            return f"http://127.0.0.1:{self._server.server_address[1]}"
+        return f"unix:{self.socket_path}"
+
+    def _make_server(self):
+        handler = _handler(self)
+        if self.port:
+            server = ThreadingHTTPServer(("127.0.0.1", self.port), handler)
+        else:
+            _remove_stale_socket(self.socket_path)
+            server = _UnixHTTPServer(self.socket_path, handler)
+            os.chmod(self.socket_path, 0o600)
+        server.daemon_threads = True
+        return server
+
+    def start(self) -> "AgentDaemon":
+        """Start the worker and the server in background threads."""
+        self._background = True
+        threading.Thread(target=self._work, daemon=True).start()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        threading.Thread(target=self._work, daemon=True).start()
+        print(f"Agent daemon listening on {self.address}")
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopping the agent daemon.")
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        self._queue.put(None)
+        if self._background:
+            self._server.shutdown()
+        self._server.server_close()
+        if not self.port and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        if self.token and os.path.exists(token_path()):
+            os.unlink(token_path())
+
+    def submit(self, instruction: str, **options) -> Job:
+        job = Job(instruction, options)
+        with self._lock:
+            self.jobs[job.id] = job
+            # Forget the oldest finished jobs beyond max_jobs
+            for old_id in [i for i, old in self.jobs.items() if old.done.is_set()][:max(len(self.jobs) - self.max_jobs, 0)]:
+                del self.jobs[old_id]
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started. Running jobs are not interrupted."""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status != "queued":
+                return False
+            job.status = "cancelled"
+            job.finished = time.time()
+        job.done.set()
+        return True
+
+    def status(self) -> dict:
+        with self._lock:
+            queued = sum(job.status == "queued" for job in self.jobs.values())
+            current = self.current.id if self.current else None
+        return {
+            "address": self.address,
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "ready": self.warm_up is not None,
+            "warm_up": self.warm_up,
+            "queued": queued,
+            "current": current,
+            "jobs": len(self.jobs),
+        }
+
+    def _work(self):
+        start = time.perf_counter()
+        try:
+            warm_up = dict((self.warm() if self.warm else None) or {})
+        except Exception as e:
+            warm_up = {"error": f"{type(e).__name__}: {e}"}
+        warm_up["seconds"] = round(time.perf_counter() - start, 3)
+        self.warm_up = warm_up
+        print(f"Agent daemon warmed up: {self.warm_up}")
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                self.current = job
+            try:
+                job.result = self.handler(job.instruction, **job.options)
+                job.status = "succeeded"
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = "failed"
+            with self._lock:
+                job.finished = time.time()
+                self.current = None
+            job.done.set()
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    pass
+
+
+def token_path() -> str:
+    return os.path.expanduser(os.getenv("AGENT_DAEMON_TOKEN_FILE", DEFAULT_TOKEN_FILE))
+
+
+def _write_token(path: str) -> str:
+    """Write a new random token readable only by the current user, and return it."""
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    if os.path.exists(path):
+        os.unlink(path)
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "w") as f:
+        f.write(token)
+    return token
+
+
+def _remove_stale_socket(path: str):
+    """Remove a socket file left behind by a daemon that is no longer running."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise RuntimeError(f"an agent daemon is already listening on {path}")
+
+
+def _handler(daemon: AgentDaemon):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def address_string(self):
+            # Unix socket peers have no address
+            return "local"
+
+        def _reply(self, status: int, payload: dict):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _refused(self) -> bool:
+            """Reply with an error and return True unless the request may be served."""
+            if self.headers.get("Origin") is not None:
+                self._reply(403, {"error": "browser requests are not accepted"})
+                return True
+            if daemon.token and not hmac.compare_digest(self.headers.get("Authorization", ""), f"Bearer {daemon.token}"):
+                self._reply(401, {"error": f"missing or wrong token (see {token_path()})"})
+                return True
+            if self.command == "POST" and self.headers.get_content_type() != "application/json":
+                self._reply(415, {"error": "Content-Type must be application/json"})
+                return True
+            return False
+
+        def _job(self, path: str) -> Optional[Job]:
+            job = daemon.get(path[len("/jobs/"):])
+            if job is None:
+                self._reply(404, {"error": "no such job"})
+            return job
+
+        def do_GET(self):
+            if self._refused():
+                return
+            url = urlparse(self.path)
+            if url.path == "/status":
+                self._reply(200, daemon.status())
+            elif url.path.startswith("/jobs/"):
+                job = self._job(url.path)
+                if job is not None:
+                    try:
+                        wait = float(parse_qs(url.query).get("wait", [0])[0])
+                    except ValueError:
+                        wait = math.nan
+                    if not math.isfinite(wait) or wait < 0:
+                        self._reply(400, {"error": "wait must be a number of seconds"})
+                        return
+                    if wait > 0:
+                        job.done.wait(wait)
+                    self._reply(200, job.to_dict())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self._refused():
+                return
+            if urlparse(self.path).path != "/jobs":
+                self._reply(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._reply(400, {"error": "invalid Content-Length"})
+                return
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError as e:  # JSONDecodeError, or a body that is not UTF-8
+                self._reply(400, {"error": f"invalid JSON: {e}"})
+                return
+            instruction = body.pop("instruction", None) if isinstance(body, dict) else None
+            if not isinstance(instruction, str) or not instruction.strip():
+                self._reply(400, {"error": "an instruction is required"})
+                return
+            unknown = sorted(set(body) - set(JOB_OPTIONS))
+            if unknown:
+                self._reply(400, {"error": f"unknown options: {', '.join(unknown)}"})
+                return
+            invalid = [name for name, value in body.items() if not isinstance(value, JOB_OPTIONS[name])]
+            if invalid:
+                self._reply(400, {"error": f"{invalid[0]} must be a {JOB_OPTIONS[invalid[0]].__name__}"})
+                return
+            job = daemon.submit(instruction.strip(), **body)
+            self._reply(202, {**job.to_dict(), "position": daemon.status()["queued"]})
+
+        def do_DELETE(self):
+            if self._refused():
+                return
+            path = urlparse(self.path).path
+            if not path.startswith("/jobs/"):
+                self._reply(404, {"error": "not found"})
+                return
+            job = self._job(path)
+            if job is not None:
+                cancelled = daemon.cancel(job.id)
+                self._reply(200 if cancelled else 409, job.to_dict())
+
+    return Handler
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def request(method: str, path: str, body: dict = None, socket_path: str = None, port: int = None, timeout: float = 30) -> dict:
+    """Send one request to the daemon and return the decoded JSON reply (with its "http_status")."""
+    port = int(os.getenv("AGENT_DAEMON_PORT", 0)) if port is None else port
+    headers = {}
+    if port:
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        with open(token_path(), "r") as f:
+            headers["Authorization"] = f"Bearer {f.read().strip()}"
+    else:
+        connection = _UnixHTTPConnection(os.getenv("AGENT_DAEMON_SOCKET", DEFAULT_SOCKET) if socket_path is None else socket_path, timeout)
+    try:
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        if data:
+            headers["Content-Type"] = "application/json"
+        connection.request(method, path, body=data, headers=headers)
+        response = connection.getresponse()
+        return {**json.loads(response.read() or b"{}"), "http_status": response.status}
+    finally:
+        connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit = commands.add_parser("submit", help="queue an instruction")
+    submit.add_argument("instruction")
+    submit.add_argument("--execute", action="store_true", help="run the generated actions instead of only returning them")
+    submit.add_argument("--wait", type=float, default=0, help="seconds to wait for the result")
+    result = commands.add_parser("result", help="show a job")
+    result.add_argument("job_id")
+    result.add_argument("--wait", type=float, default=0, help="seconds to wait for the job to finish")
+    cancel = commands.add_parser("cancel", help="cancel a queued job")
+    cancel.add_argument("job_id")
+    commands.add_parser("status", help="show the daemon status")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "submit":
+            reply = request("POST", "/jobs", {"instruction": args.instruction, "execute": args.execute})
+            if args.wait and reply["http_status"] == 202:
+                reply = request("GET", f"/jobs/{reply['id']}?wait={args.wait}", timeout=args.wait + 30)
+        elif args.command == "result":
+            reply = request("GET", f"/jobs/{args.job_id}?wait={args.wait}", timeout=args.wait + 30)
+        elif args.command == "cancel":
+            reply = request("DELETE", f"/jobs/{args.job_id}")
+        else:
+            reply = request("GET", "/status")
+    except OSError as e:
+        print(f"Could not reach the agent daemon: {e}. Start it with `python app.py --daemon`.")
+        sys.exit(2)
+    print(json.dumps(reply, indent=2))
+    sys.exit(0 if reply["http_status"] < 400 and reply.get("status") != "failed" else 1)
+
+
+if __name__ == "__main__":
+    main()
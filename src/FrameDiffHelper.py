@@ -0,0 +1,163 @@
+import os
+from typing import List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+Region = Tuple[int, int, int, int]
+
+
+class FrameDiff(BaseModel):
+    changed: bool
+    first_frame: bool = False
+    changed_fraction: float = 0.0
+    dirty_tiles: List[Region] = []
+    dirty_regions: List[Region] = []
+
+
+class FrameChangeDetector:
+    """
+    FrameChangeDetector:
+    --------------------
+
+    Detects screen changes by hashing fixed-size tiles of each frame with NumPy and
+    comparing the hashes with those of the previous frame. Only the hashes are kept,
+    not the previous frame itself.
+
+    Methods:
+    - update(frame) -> FrameDiff
+    - reset()
+    """
+
+    def __init__(self, tile_size: int = None):
+        self.tile_size = int(os.getenv("FRAME_DIFF_TILE_SIZE", 32)) if tile_size is None else tile_size
+        self._hashes: Optional[np.ndarray] = None
+        self._shape = None
+        self._weights = {}
+
+    def reset(self):
+        self._hashes = None
+        self._shape = None
+
+    def update(self, frame) -> FrameDiff:
+        """
+        Hash the frame (numpy array or PIL Image), compare it with the previous one and
+        remember it as the new reference.
+        """
+        if isinstance(frame, Image.Image):
+            frame = np.asarray(frame)
+        if frame.ndim == 2:
+            frame = frame[:, :, None]
+
+        hashes = self.tile_hashes(frame)
+        previous, previous_shape = self._hashes, self._shape
+        self._hashes, self._shape = hashes, frame.shape
+
+        height, width = frame.shape[:2]
+        if previous is None or previous_shape != frame.shape:
+            return FrameDiff(
+                changed=True,
+                first_frame=True,
+                changed_fraction=1.0,
+                dirty_tiles=[(0, 0, width, height)],
+                dirty_regions=[(0, 0, width, height)],
+            )
+
+        dirty = hashes != previous
+        if not dirty.any():
+            return FrameDiff(changed=False)
+
+        return FrameDiff(
+            changed=True,
+            changed_fraction=float(dirty.mean()),
+            dirty_tiles=[self._tile_box(ty, tx, ty, tx, width, height) for ty, tx in zip(*np.nonzero(dirty))],
+            dirty_regions=self._merge_tiles(dirty, width, height),
+        )
+
+    def tile_hashes(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Return a (rows, cols) array of 64-bit tile hashes.
+
+        Each hash is a weighted sum of the tile's bytes with fixed random weights per
+        row and per column byte, which wraps around in uint64 and is computed without
+        copying the frame.
+        """
+        t = self.tile_size
+        height, width, channels = frame.shape
+        rows, cols = -(-height // t), -(-width // t)
+        full_rows, full_cols = height // t, width // t
+        hashes = np.zeros((rows, cols), dtype=np.uint64)
+
+        # Full tiles in one pass, then the partial right/bottom edge tiles.
+        blocks = [
+            (0, full_rows * t, 0, full_cols * t),
+            (0, full_rows * t, full_cols * t, width),
+            (full_rows * t, height, 0, full_cols * t),
+            (full_rows * t, height, full_cols * t, width),
+        ]
+        for y0, y1, x0, x1 in blocks:
+            if y1 <= y0 or x1 <= x0:
+                continue
+            block = frame[y0:y1, x0:x1]
+            tile_h, tile_w = min(t, y1 - y0), min(t, x1 - x0)
+            ny, nx = (y1 - y0) // tile_h, (x1 - x0) // tile_w
+            row_weights, col_weights = self._tile_weights(tile_h, tile_w * channels)
+            tiles = block.reshape(ny, tile_h, nx, tile_w * channels)
+            block_hashes = np.einsum("ytxk,k->ytx", tiles, col_weights)
+            block_hashes = np.einsum("ytx,t->yx", block_hashes, row_weights)
+            hashes[y0 // t:y0 // t + ny, x0 // t:x0 // t + nx] = block_hashes
+        return hashes
+
+    def _tile_weights(self, tile_h: int, row_bytes: int):
+        key = (tile_h, row_bytes)
+        if key not in self._weights:
+            rng = np.random.default_rng(0x5EED)
+            row_weights = rng.integers(1, 2**63, size=tile_h, dtype=np.uint64) | np.uint64(1)
+            col_weights = rng.integers(1, 2**63, size=row_bytes, dtype=np.uint64) | np.uint64(1)
+            self._weights[key] = (row_weights, col_weights)
+        return self._weights[key]
+
+    def _tile_box(self, ty0: int, tx0: int, ty1: int, tx1: int, width: int, height: int) -> Region:
+        t = self.tile_size
+        left, top = int(tx0) * t, int(ty0) * t
+        right, bottom = min((int(tx1) + 1) * t, width), min((int(ty1) + 1) * t, height)
+        return (left, top, right - left, bottom - top)
+
+    def _merge_tiles(self, dirty: np.ndarray, width: int, height: int) -> List[Region]:
+        """Merge 8-connected dirty tiles into bounding boxes."""
+        seen = np.zeros_like(dirty)
+        regions = []
+        rows, cols = dirty.shape
+        for ty, tx in zip(*np.nonzero(dirty)):
+            if seen[ty, tx]:
+                continue
+            seen[ty, tx] = True
+            stack = [(ty, tx)]
+            y0, x0, y1, x1 = ty, tx, ty, tx
+            while stack:
+                y, x = stack.pop()
+                y0, x0, y1, x1 = min(y0, y), min(x0, x), max(y1, y), max(x1, x)
+                for ny in range(max(y - 1, 0), min(y + 2, rows)):
+                    for nx in range(max(x - 1, 0), min(x + 2, cols)):
+                        if dirty[ny, nx] and not seen[ny, nx]:
+                            seen[ny, nx] = True
+                            stack.append((ny, nx))
+            regions.append(self._tile_box(y0, x0, y1, x1, width, height))
+        return regions
+
+
+def crop_regions(image: Image, regions: List[Region], padding: int = 0) -> List[Tuple[Region, Image]]:
+    """
+    Crop each (left, top, width, height) region out of the image, grown by `padding`
+    pixels and clamped to the image bounds.
+    """
+    crops = []
+    for left, top, width, height in regions:
+        box = (
+            max(left - padding, 0),
+            max(top - padding, 0),
+            min(left + width + padding, image.width),
+            min(top + height + padding, image.height),
+        )
+        crops.append(((box[0], box[1], box[2] - box[0], box[3] - box[1]), image.crop(box)))
+    return crops
@@ -0,0 +1,520 @@
+import ctypes
+import ctypes.util
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional, Tuple
+import pyautogui
+
+try:
+    import pyperclip
+except ImportError:
+    pyperclip = None
+
+BUTTONS = {'left': 1, 'middle': 2, 'right': 3, 'primary': 1, 'secondary': 3}
+# pyautogui key names that differ from X keysym names
+KEYSYM_NAMES = {
+    'enter': 'Return', 'return': 'Return', '\n': 'Return', 'tab': 'Tab', '\t': 'Tab', 'space': 'space', ' ': 'space',
+    'esc': 'Escape', 'escape': 'Escape', 'backspace': 'BackSpace', 'delete': 'Delete', 'del': 'Delete', 'insert': 'Insert',
+    'up': 'Up', 'down': 'Down', 'left': 'Left', 'right': 'Right', 'home': 'Home', 'end': 'End',
+    'pageup': 'Prior', 'pgup': 'Prior', 'pagedown': 'Next', 'pgdn': 'Next',
+    'shift': 'Shift_L', 'shiftleft': 'Shift_L', 'shiftright': 'Shift_R',
+    'ctrl': 'Control_L', 'ctrlleft': 'Control_L', 'ctrlright': 'Control_R',
+    'alt': 'Alt_L', 'altleft': 'Alt_L', 'altright': 'Alt_R', 'option': 'Alt_L',
+    'win': 'Super_L', 'winleft': 'Super_L', 'winright': 'Super_R', 'command': 'Super_L', 'super': 'Super_L',
+    'capslock': 'Caps_Lock', 'numlock': 'Num_Lock', 'printscreen': 'Print', 'pause': 'Pause',
+    **{f'f{n}': f'F{n}' for n in range(1, 25)},
+}
+# Flush queued XTest events after this many, so very long strings do not flood the server
+MAX_EVENTS_PER_FLUSH = 512
+
+
+class Clipboard:
+    """
+    Clipboard:
+    ----------
+
+    Plain-text clipboard through pyperclip when installed, otherwise pbcopy/pbpaste,
+    wl-copy/wl-paste, xclip or xsel, whichever is found first.
+
+    Methods:
+    - available() -> bool
+    - get() -> Optional[str]
+    - set(text) -> bool
+    """
+
+    def __init__(self):
+        self._copy, self._paste = None, None
+        if pyperclip is not None:
+            return
+        candidates = [(["pbcopy"], ["pbpaste"])] if sys.platform == "darwin" else []
+        if os.environ.get("WAYLAND_DISPLAY"):
+            candidates.append((["wl-copy"], ["wl-paste", "--no-newline"]))
+        candidates += [
+            (["xclip", "-selection", "clipboard"], ["xclip", "-selection", "clipboard", "-o"]),
+            (["xsel", "--clipboard", "--input"], ["xsel", "--clipboard", "--output"]),
+        ]
+        for copy, paste in candidates:
+            if shutil.which(copy[0]):
+                self._copy, self._paste = copy, paste
+                break
+
+    def available(self) -> bool:
+        return pyperclip is not None or self._copy is not None
+
+    def get(self) -> Optional[str]:
+        try:
+            if pyperclip is not None:
+                return pyperclip.paste()
+            if self._paste is None:
+                return None
+            result = subprocess.run(self._paste, capture_output=True, timeout=2)
+            return result.stdout.decode("utf-8") if result.returncode == 0 else None
+        except Exception:
+            return None
+
+    def set(self, text: str) -> bool:
+        try:
+            if pyperclip is not None:
+                pyperclip.copy(text)
+                return True
+            if self._copy is None:
+                return False
+            # xclip and wl-copy keep serving the selection from a child process; do not wait on its output
+            result = subprocess.run(self._copy, input=text.encode("utf-8"), stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL, timeout=2)
+            return result.returncode == 0
+        except Exception as e:
+            print(f"Clipboard unavailable: {e}")
+            return False
+
+
+class InputBackend:
+    """
+    InputBackend:
+    -------------
+
+    Injects mouse and keyboard input, with pyautogui-compatible arguments. Shared
+    behaviour, configured by the environment unless passed in:
+    - INPUT_INSTANT_MOVES: ignore tween durations and jump straight to the target
+    - INPUT_PASTE_MIN_CHARS: type_text pastes text at least this long through the
+      clipboard (0, the default, disables pasting). Text with line breaks is always
+      typed, so each one still presses Enter; so is text when the clipboard is unavailable
+    - INPUT_PASTE_HOTKEY: the paste shortcut, e.g. ctrl+shift+v for terminals
+    - INPUT_CLIPBOARD_RESTORE: keep the previous clipboard contents so
+      restore_clipboard() can put them back once the paste has been read
+    - INPUT_CLIPBOARD_RESTORE_SECONDS: how long restore_clipboard(settled=False) waits
+      first, for when no settle wait showed that the paste was read
+
+    Methods:
+    - move_to(x, y, duration=0.0)
+    - move_rel(dx, dy, duration=0.0)
+    - click(x=None, y=None, clicks=1, interval=0.0, button='left')
+    - drag_to(x, y, duration=0.0, button='left')
+    - drag_rel(dx, dy, duration=0.0, button='left')
+    - scroll(clicks, x=None, y=None)
+    - write(text, interval=0.0)
+    - type_text(text, interval=0.0)
+    - press(key)
+    - hotkey(*keys)
+    - paste(text) -> bool
+    - restore_clipboard(settled=True)
+    - position() -> Tuple[int, int]
+    - close()
+    """
+
+    name = "base"
+
+    def __init__(self, instant_moves: bool = None, paste_min_chars: int = None, restore_clipboard: bool = None,
+                 paste_keys: Tuple[str, ...] = None, clipboard: Clipboard = None):
+        self.instant_moves = os.getenv("INPUT_INSTANT_MOVES", "true").lower() in ("true", "1", "yes") if instant_moves is None else instant_moves
+        self.paste_min_chars = int(os.getenv("INPUT_PASTE_MIN_CHARS", 0)) if paste_min_chars is None else paste_min_chars
+        self.keep_clipboard = os.getenv("INPUT_CLIPBOARD_RESTORE", "true").lower() in ("true", "1", "yes") if restore_clipboard is None else restore_clipboard
+        default_keys = "command+v" if sys.platform == "darwin" else "ctrl+v"
+        self.paste_keys = tuple(os.getenv("INPUT_PASTE_HOTKEY", default_keys).split("+")) if paste_keys is None else tuple(paste_keys)
+        self.restore_seconds = float(os.getenv("INPUT_CLIPBOARD_RESTORE_SECONDS", 0.5))
+        self.clipboard = clipboard or Clipboard()
+        self._saved_clipboard = None
+
+    def _duration(self, duration: float) -> float:
+        return 0.0 if self.instant_moves else duration
+
+    def type_text(self, text: str, interval: float = 0.0):
+        """Paste long single-line text in one go when pasting is on; anything else is typed."""
+        if interval == 0 and 0 < self.paste_min_chars <= len(text) and "\n" not in text and self.paste(text):
+            return
+        self.write(text, interval=interval)
+
+    def paste(self, text: str) -> bool:
+        """
+        Paste `text` with INPUT_PASTE_HOTKEY. The previous clipboard contents are kept until
+        restore_clipboard(), since the target reads the clipboard some time after the keys.
+        """
+        if not self.clipboard.available():
+            return False
+        if self.keep_clipboard and self._saved_clipboard is None:
+            self._saved_clipboard = self.clipboard.get()
+        if not self.clipboard.set(text):
+            return False
+        self.hotkey(*self.paste_keys)
+        return True
+
+    def restore_clipboard(self, settled: bool = True):
+        """
+        Put back the clipboard contents from before the last paste, if any were kept. Call
+        it after the screen settled; with settled=False it first waits
+        INPUT_CLIPBOARD_RESTORE_SECONDS for the target to read the paste.
+        """
+        previous, self._saved_clipboard = self._saved_clipboard, None
+        if previous is None:
+            return
+        if not settled:
+            time.sleep(self.restore_seconds)
+        self.clipboard.set(previous)
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        raise NotImplementedError
+
+    def move_rel(self, dx: int, dy: int, duration: float = 0.0):
+        raise NotImplementedError
+
+    def click(self, x: int = None, y: int = None, clicks: int = 1, interval: float = 0.0, button: str = 'left'):
+        raise NotImplementedError
+
+    def drag_to(self, x: int, y: int, duration: float = 0.0, button: str = 'left'):
+        raise NotImplementedError
+
+    def drag_rel(self, dx: int, dy: int, duration: float = 0.0, button: str = 'left'):
+        x, y = self.position()
+        self.drag_to(x + dx, y + dy, duration=duration, button=button)
+
+    def scroll(self, clicks: int, x: int = None, y: int = None):
+        raise NotImplementedError
+
+    def write(self, text: str, interval: float = 0.0):
+        raise NotImplementedError
+
+    def press(self, key: str):
+        raise NotImplementedError
+
+    def hotkey(self, *keys: str):
+        raise NotImplementedError
+
+    def position(self) -> Tuple[int, int]:
+        return tuple(pyautogui.position())
+
+    def close(self):
+        pass
+
+
+class PyAutoGuiInputBackend(InputBackend):
+    """Input through pyautogui, one call per action; works everywhere pyautogui does."""
+
+    name = "pyautogui"
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        pyautogui.moveTo(x, y, duration=self._duration(duration))
+
+    def move_rel(self, dx: int, dy: int, duration: float = 0.0):
+        pyautogui.moveRel(dx, dy, duration=self._duration(duration))
+
+    def click(self, x: int = None, y: int = None, clicks: int = 1, interval: float = 0.0, button: str = 'left'):
+        pyautogui.click(x, y, clicks=clicks, interval=interval, button=button)
+
+    def drag_to(self, x: int, y: int, duration: float = 0.0, button: str = 'left'):
+        pyautogui.dragTo(x, y, duration=self._duration(duration), button=button)
+
+    def drag_rel(self, dx: int, dy: int, duration: float = 0.0, button: str = 'left'):
+        pyautogui.dragRel(dx, dy, duration=self._duration(duration), button=button)
+
+    def scroll(self, clicks: int, x: int = None, y: int = None):
+        pyautogui.scroll(clicks, x=x, y=y)
+
+    def write(self, text: str, interval: float = 0.0):
+        pyautogui.write(text, interval=interval)
+
+    def press(self, key: str):
+        pyautogui.press(key)
+
+    def hotkey(self, *keys: str):
+        pyautogui.hotkey(*keys)
+
+
+class XTestInputBackend(InputBackend):
+    """
+    X11 input through the XTEST extension via ctypes. Each action queues its whole event
+    sequence (a full string, a hotkey chord, a click) and sends it with one XFlush, with
+    none of pyautogui's per-call overhead. pyautogui.PAUSE and the fail-safe corner are
+    still honoured. Characters without a key on the current keymap are typed through
+    pyautogui instead.
+    """
+
+    name = "xtest"
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        if not sys.platform.startswith("linux") or not os.environ.get("DISPLAY"):
+            raise RuntimeError("no X11 display")
+        paths = [ctypes.util.find_library(name) for name in ("X11", "Xtst")]
+        if not all(paths):
+            raise RuntimeError("libX11/libXtst not found")
+        self._x11, self._xtst = (ctypes.CDLL(path) for path in paths)
+        self._declare()
+        self._display = self._x11.XOpenDisplay(None)
+        if not self._display:
+            raise RuntimeError("cannot open X display")
+        if not self._xtst.XTestQueryExtension(self._display, *(ctypes.byref(ctypes.c_int()) for _ in range(4))):
+            self._x11.XCloseDisplay(self._display)
+            raise RuntimeError("XTEST extension not available")
+        self._root = self._x11.XDefaultRootWindow(self._display)
+        self._lock = threading.Lock()
+        self._keys = {}
+        self._pending = 0
+
+    def _declare(self):
+        x11, xtst = self._x11, self._xtst
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XFlush.argtypes = [ctypes.c_void_p]
+        x11.XStringToKeysym.restype = ctypes.c_ulong
+        x11.XStringToKeysym.argtypes = [ctypes.c_char_p]
+        x11.XKeysymToKeycode.restype = ctypes.c_ubyte
+        x11.XKeysymToKeycode.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+        x11.XKeycodeToKeysym.restype = ctypes.c_ulong
+        x11.XKeycodeToKeysym.argtypes = [ctypes.c_void_p, ctypes.c_ubyte, ctypes.c_int]
+        x11.XQueryPointer.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong), ctypes.POINTER(ctypes.c_ulong),
+                                      ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_int),
+                                      ctypes.POINTER(ctypes.c_int), ctypes.POINTER(ctypes.c_uint)]
+        xtst.XTestQueryExtension.argtypes = [ctypes.c_void_p] + [ctypes.POINTER(ctypes.c_int)] * 4
+        xtst.XTestFakeMotionEvent.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeButtonEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+        xtst.XTestFakeKeyEvent.argtypes = [ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_ulong]
+
+    # Event queueing; the caller holds self._lock
+
+    def _queued(self):
+        self._pending += 1
+        if self._pending >= MAX_EVENTS_PER_FLUSH:
+            self._flush()
+
+    def _flush(self):
+        self._x11.XFlush(self._display)
+        self._pending = 0
+
+    def _motion(self, x: int, y: int):
+        self._xtst.XTestFakeMotionEvent(self._display, -1, int(x), int(y), 0)
+        self._queued()
+
+    def _button(self, button: str, down: bool):
+        self._xtst.XTestFakeButtonEvent(self._display, BUTTONS[button] if isinstance(button, str) else button, down, 0)
+        self._queued()
+
+    def _key(self, keycode: int, down: bool):
+        self._xtst.XTestFakeKeyEvent(self._display, keycode, down, 0)
+        self._queued()
+
+    def _keycode(self, key: str) -> Optional[Tuple[int, bool]]:
+        """(keycode, needs shift) for a pyautogui key name or a single character, or None if unmapped."""
+        if key in self._keys:
+            return self._keys[key]
+        name = KEYSYM_NAMES.get(key.lower() if len(key) > 1 else key)
+        if name is not None:
+            keysym = self._x11.XStringToKeysym(name.encode())
+        elif len(key) == 1:
+            # Latin-1 characters are their own keysyms; the rest of Unicode is offset by 0x01000000
+            code = ord(key)
+            keysym = code if 0x20 <= code <= 0x7e or 0xa0 <= code <= 0xff else 0x01000000 + code
+        else:
+            keysym = self._x11.XStringToKeysym(key.encode())
+        result = None
+        keycode = self._x11.XKeysymToKeycode(self._display, keysym) if keysym else 0
+        if keycode:
+            if len(key) > 1 or self._x11.XKeycodeToKeysym(self._display, keycode, 0) == keysym:
+                result = (keycode, False)
+            elif self._x11.XKeycodeToKeysym(self._display, keycode, 1) == keysym:
+                result = (keycode, True)
+        self._keys[key] = result
+        return result
+
+    def _begin(self):
+        failsafe_check = getattr(pyautogui, "failSafeCheck", None)
+        if failsafe_check is not None:
+            failsafe_check()
+
+    def _end(self):
+        self._flush()
+        if pyautogui.PAUSE:
+            time.sleep(pyautogui.PAUSE)
+
+    def _glide(self, x: int, y: int, duration: float):
+        """Move to (x, y), tweened over `duration` unless instant moves are on."""
+        duration = self._duration(duration)
+        if duration <= 0:
+            self._motion(x, y)
+            return
+        start_x, start_y = self._position()
+        steps = max(int(duration * 60), 1)
+        for step in range(1, steps + 1):
+            self._motion(start_x + (x - start_x) * step / steps, start_y + (y - start_y) * step / steps)
+            self._flush()
+            time.sleep(duration / steps)
+
+    def _position(self) -> Tuple[int, int]:
+        root, child = ctypes.c_ulong(), ctypes.c_ulong()
+        root_x, root_y, win_x, win_y, mask = ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_int(), ctypes.c_uint()
+        self._x11.XQueryPointer(self._display, self._root, ctypes.byref(root), ctypes.byref(child), ctypes.byref(root_x),
+                                ctypes.byref(root_y), ctypes.byref(win_x), ctypes.byref(win_y), ctypes.byref(mask))
+        return root_x.value, root_y.value
+
+    def position(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._position()
+
+    def move_to(self, x: int, y: int, duration: float = 0.0):
+        with self._lock:
+            self._begin()
+            self._glide(x, y, duration)
+            self._end()
+
+    def move_rel(self, dx: int, dy: int, duration: float = 0.0):
+        with self._lock:
+            self._begin()
+            x, y = self._position()
+            self._glide(x + dx, y + dy, duration)
+            self._end()
+
+    def click(self, x: int = None, y: int = None, clicks: int = 1, interval: float = 0.0, button: str = 'left'):
+        with self._lock:
+            self._begin()
+            if x is not None and y is not None:
+                self._motion(x, y)
+            for index in range(clicks):
+                if index and interval:
+                    self._flush()
+                    time.sleep(interval)
+                self._button(button, True)
+                self._button(button, False)
+            self._end()
+
+    def drag_to(self, x: int, y: int, duration: float = 0.0, button: str = 'left'):
+        with self._lock:
+            self._begin()
+            start_x, start_y = self._position()
+            self._button(button, True)
+            if self._duration(duration) <= 0:
+                # One intermediate motion so drag-and-drop targets see movement, not a jump
+                self._motion((start_x + x) // 2, (start_y + y) // 2)
+            self._glide(x, y, duration)
+            self._button(button, False)
+            self._end()
+
+    def scroll(self, clicks: int, x: int = None, y: int = None):
+        with self._lock:
+            self._begin()
+            if x is not None and y is not None:
+                self._motion(x, y)
+            wheel = 4 if clicks > 0 else 5
+            for _ in range(abs(int(clicks))):
+                self._button(wheel, True)
+                self._button(wheel, False)
+            self._end()
+
+    def write(self, text: str, interval: float = 0.0):
+        with self._lock:
+            keys = [self._keycode(char) for char in text]
+        if not text or None in keys:
+            # Some character is not on the current keymap; pyautogui handles (or skips) it
+            pyautogui.write(text, interval=interval)
+            return
+        with self._lock:
+            shift = self._keycode('shift')[0]
+            self._begin()
+            for keycode, shifted in keys:
+                if shifted:
+                    self._key(shift, True)
+                self._key(keycode, True)
+                self._key(keycode, False)
+                if shifted:
+                    self._key(shift, False)
+                if interval:
+                    self._flush()
+                    time.sleep(interval)
+            self._end()
+
+    def press(self, key: str):
+        self.hotkey(key)
+
+    def hotkey(self, *keys: str):
+        with self._lock:
+            codes = [self._keycode(key) for key in keys]
+        if None in codes:
+            pyautogui.hotkey(*keys)
+            return
+        with self._lock:
+            self._begin()
+            for keycode, _ in codes:
+                self._key(keycode, True)
+            for keycode, _ in reversed(codes):
+                self._key(keycode, False)
+            self._end()
+
+    def close(self):
+        with self._lock:
+            self._x11.XCloseDisplay(self._display)
+
+
+INPUT_BACKENDS = {backend.name: backend for backend in (XTestInputBackend, PyAutoGuiInputBackend)}
+# Tried in this order when INPUT_BACKEND is "auto"
+INPUT_AUTO_ORDER = ("xtest", "pyautogui")
+
+
+def create_input_backend(name: str = None) -> InputBackend:
+    """
+    Create the input backend named by `name` or INPUT_BACKEND (xtest, pyautogui or auto).
+    With auto, XTEST is used when an X display is available.
+    """
+    name = (name or os.getenv("INPUT_BACKEND", "auto")).lower()
+    if name != "auto":
+        if name not in INPUT_BACKENDS:
+            raise ValueError(f"Unknown input backend {name!r}; expected one of {', '.join(INPUT_BACKENDS)} or auto")
+        return INPUT_BACKENDS[name]()
+    for candidate in INPUT_AUTO_ORDER:
+        try:
+            backend = INPUT_BACKENDS[candidate]()
+            print(f"Input backend: {backend.name}")
+            return backend
+        except Exception as e:
+            print(f"Input backend {candidate} unavailable: {e}")
+    raise RuntimeError("No input backend available")
+
+
+_input_backend = None
+_input_backend_lock = threading.Lock()
+
+
+def get_input_backend() -> InputBackend:
+    """Shared input backend, selected on first use."""
+    global _input_backend
+    with _input_backend_lock:
+        if _input_backend is None:
+            _input_backend = create_input_backend()
+        return _input_backend
+
+
+def restore_clipboard(settled: bool = True):
+    """restore_clipboard() on the shared backend, if one was created."""
+    if _input_backend is not None:
+        _input_backend.restore_clipboard(settled)
+
+
+def set_input_backend(backend: InputBackend):
+    """Replace the shared backend, e.g. to force pyautogui for one run."""
+    global _input_backend
+    with _input_backend_lock:
+        _input_backend = backend
@@ -1,45 +1,171 @@
+import base64
+import io
 import os
-import openai
+from PIL import Image
 from dotenv import load_dotenv
+from CacheHelper import cached_completion, stream_completion
+from ClientHelper import get_llm_client
+from PlanHelper import TaskPlan, get_plan_cache, plan_for_update
+from PromptHelper import prompt_budget
+from ZoomHelper import REGION_PROMPT, coarse_to_fine
 
 load_dotenv()
-openai_client = openai.Client(api_key=os.getenv("OPENAI_API_KEY"))
 task_planner_model = os.getenv("TASK_PLANNER_MODEL", "gpt-4o")
+vision_model = os.getenv("VISION_MODEL", "gpt-4-vision")
 
-def generate_task_plan(goal):
+def task_plan_messages(goal):
     prompt = f"Generate a detailed task plan to achieve the following goal but only within the scope of actions that can be performed on a computer:\\n\\n{goal}"
+    return [{"role": "user", "content": prompt}]
 
-    # Make the API call
-    response = openai_client.chat.completions.create(
+def update_task_plan_messages(initial_task_plan, user_feedback):
+    prompt = f"The initial task plan is:\\n{initial_task_plan}\\n\\nUser feedback:\\n{user_feedback}\\n\\nProvide an updated task plan incorporating the user's feedback."
+    return [{"role": "user", "content": prompt}]
+
+def next_action_messages(state_description, image, crops=None, history=None):
+    """
+    Build the vision request for the next action. `image` is a screenshot path, PNG bytes
+    or a PIL Image (encoded only when it is sent). `history` is a list of content parts
+    describing earlier steps (AgentContext.parts()), sent before the screenshot.
+
+    When `crops` is given as a list of ((left, top, width, height), PIL Image) pairs, only
+    those changed regions are sent instead of the full screenshot. The request is fitted
+    to the PROMPT_MAX_TOKENS / PROMPT_MAX_IMAGE_BYTES budget before it is returned.
+    """
+    content = list(history or [])
+    if crops:
+        content.append({"type": "text", "text": "Only these regions changed since the previous screenshot (left, top, width, height in screen pixels):"})
+        for region, crop in crops:
+            buffer = io.BytesIO()
+            crop.save(buffer, format="PNG")
+            content.append({"type": "text", "text": f"Region {region}:"})
+            content.append(_image_part(buffer.getvalue()))
+    else:
+        if isinstance(image, (bytes, bytearray)):
+            image_data = image
+        elif isinstance(image, Image.Image):
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            image_data = buffer.getvalue()
+        else:
+            with open(image, "rb") as image_file:
+                image_data = image_file.read()
+        content.append(_image_part(image_data))
+
+    return prompt_budget.fit([
+        {"role": "system", "content": state_description},
+        {"role": "user", "content": content},
+    ])
+
+def plan_diff_messages(plan, user_feedback):
+    return [{"role": "user", "content": plan.diff_prompt(user_feedback)}]
+
+def generate_task_plan(goal, use_cache=True):
+    """
+    Task plan for `goal` as a numbered step list. Plans are kept as steps in the plan
+    cache under the normalized goal, so a goal seen before is answered without a request.
+    """
+    plan_cache = get_plan_cache()
+    plan = plan_cache.get(goal) if plan_cache and use_cache else None
+    if plan is None:
+        # Make the API call
+        response = cached_completion(
+            get_llm_client(),
+            model=task_planner_model,
+            messages=task_plan_messages(goal),
+            use_cache=use_cache,
+            max_tokens=500,
+            temperature=0.7,
+        )
+        plan = TaskPlan.from_text(goal, response.strip())
+        if plan_cache:
+            plan_cache.put(plan)
+    return plan.render()
+
+def update_task_plan(initial_task_plan, user_feedback, use_cache=True, goal=None):
+    """
+    Apply `user_feedback` to a plan by asking only for edits to the steps it affects (see
+    TaskPlan.diff_prompt). Falls back to a full rewrite when the reply is not a valid edit
+    list. With `goal`, the updated plan replaces the cached plan for that goal.
+    """
+    plan_cache = get_plan_cache()
+    plan = plan_for_update(initial_task_plan, goal, plan_cache)
+    response = cached_completion(
+        get_llm_client(),
         model=task_planner_model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=500,
-        temperature=0.7,
+        messages=plan_diff_messages(plan, user_feedback),
+        use_cache=use_cache,
+        max_tokens=300,
+        temperature=0.0,
     )
-    initial_task_plan = response.choices[0].message.content.strip()
-    return initial_task_plan
+    updated_plan = plan.apply_diff(response)
+    if updated_plan is None:
+        response = cached_completion(
+            get_llm_client(),
+            model=task_planner_model,
+            messages=update_task_plan_messages(initial_task_plan, user_feedback),
+            use_cache=use_cache,
+            max_tokens=500,
+            temperature=0.7,
+        )
+        updated_plan = TaskPlan.from_text(plan.goal, response.strip())
+    if plan_cache and goal:
+        plan_cache.put(updated_plan)
+    return updated_plan.render()
 
-def update_task_plan(initial_task_plan, user_feedback):
-    prompt = f"The initial task plan is:\\n{initial_task_plan}\\n\\nUser feedback:\\n{user_feedback}\\n\\nProvide an updated task plan incorporating the user's feedback."
-    response = openai_client.chat.completions.create(
-        model=task_planner_model,
-        messages=[{"role": "user", "content": prompt}],
-        max_tokens=500,
+def get_next_action_with_image(state_description, image_path, crops=None, use_cache=True, context=None):
+    """
+    Ask the vision model for the next action.
+
+    When `crops` is given, only those changed regions are sent instead of the full
+    screenshot at `image_path` (see next_action_messages). With `context` (an
+    AgentContext), recent steps are sent too, within the context's token and byte budget.
+    Responses are cached by prompt and screenshot content hash (perceptual with
+    LLM_CACHE_PERCEPTUAL_HASH) unless use_cache is False.
+    """
+    response = cached_completion(
+        get_llm_client(),
+        model=vision_model,
+        messages=next_action_messages(state_description, image_path, crops, context.parts() if context else None),
+        use_cache=use_cache,
+        max_tokens=200,
         temperature=0.7,
     )
-    updated_task_plan = response.choices[0].message.content.strip()
-    return updated_task_plan
-
-def get_next_action_with_image(state_description, image_path):
-    # Assuming we can send image to GPT-4 Vision
-    with open(image_path, "rb") as image_file:
-        image_data = image_file.read()
-    response = openai_client.chat.completions.create(
-        model="gpt-4-vision",
-        messages=[{"role": "system", "content": state_description}],
-        files=[{"name": "current_state.png", "bytes": image_data}],
+    action = response.strip()
+    return action
+
+def stream_next_action_with_image(state_description, image_path, crops=None, use_cache=True, context=None):
+    """
+    Streaming form of get_next_action_with_image: yields the action text as the model
+    generates it, for StreamingExecutor to run statement by statement.
+    """
+    return stream_completion(
+        get_llm_client(),
+        model=vision_model,
+        messages=next_action_messages(state_description, image_path, crops, context.parts() if context else None),
+        use_cache=use_cache,
         max_tokens=200,
         temperature=0.7,
     )
-    action = response.choices[0].message.content.strip()
-    return action
+
+def locate_region(state_description, overview, use_cache=True):
+    """
+    Stage one of coarse-to-fine vision: ask which screen point to zoom into, given the
+    labeled overview from CoarseToFine.overview. Returns (x, y) or None.
+    """
+    messages = next_action_messages(state_description, overview)
+    messages[1]["content"].insert(0, {"type": "text", "text": REGION_PROMPT})
+    response = cached_completion(
+        get_llm_client(),
+        model=vision_model,
+        messages=messages,
+        use_cache=use_cache,
+        max_tokens=20,
+        temperature=0.0,
+    )
+    return coarse_to_fine.parse_point(response)
+
+def _image_part(image_data):
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:image/png;base64,{base64.b64encode(image_data).decode('utf-8')}"},
+    }
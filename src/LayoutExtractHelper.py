@@ -0,0 +1,242 @@
+import glob
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+import numpy as np
+from TemplateMatchHelper import template_matcher, to_gray, non_max_suppression
+
+Box = Tuple[int, int, int, int]
+
+# ui_elements/ file names are matched to layout component types by these words
+ELEMENT_TYPES = (("checkbox", "checkbox"), ("dropdown", "dropdown"), ("button", "button"), ("field", "input"), ("body", "input"))
+
+
+def connected_boxes(mask: np.ndarray) -> List[Box]:
+    """
+    Bounding boxes (left, top, width, height) of the 8-connected components of a boolean
+    mask, found by run-length labeling: runs of each row are unioned with the runs of
+    the previous row they touch, so only runs (not pixels) are visited in Python.
+    """
+    parent = []
+
+    def find(label):
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    runs = []
+    previous = []
+    for row in range(mask.shape[0]):
+        edges = np.diff(np.concatenate(([0], mask[row].view(np.int8), [0])))
+        current = []
+        first = 0
+        for start, end in zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()):
+            label = None
+            while first < len(previous) and previous[first][1] < start:
+                first += 1
+            index = first
+            # A previous run [ps, pe) touches [start, end) diagonally or directly when ps <= end and pe >= start
+            while index < len(previous) and previous[index][0] <= end:
+                root = find(previous[index][2])
+                if label is None:
+                    label = root
+                elif root != label:
+                    parent[root] = label
+                index += 1
+            if label is None:
+                label = len(parent)
+                parent.append(label)
+            current.append((start, end, label))
+            runs.append((row, start, end, label))
+        previous = current
+
+    extents = {}
+    for row, start, end, label in runs:
+        root = find(label)
+        box = extents.get(root)
+        if box is None:
+            extents[root] = [start, row, end, row + 1]
+        else:
+            box[0], box[1], box[2], box[3] = min(box[0], start), min(box[1], row), max(box[2], end), max(box[3], row + 1)
+    return [(left, top, right - left, bottom - top) for left, top, right, bottom in extents.values()]
+
+
+class LayoutExtractor:
+    """
+    LayoutExtractor:
+    ----------------
+
+    Finds candidate UI elements in a screenshot on the CPU and returns a layout document
+    in the same shape as playground/pizza_page_ui_layout.json (title, resolution and
+    components with a type and centre coordinates, plus their bounds).
+
+    Pipeline: gradient edges, edge density on a coarse grid of `cell` pixels, connected
+    components of the dense cells, a heuristic type per component (checkbox, button,
+    input, text, region), and template matches against the images in ui_elements/,
+    which take precedence over overlapping components. Results are cached in memory and
+    on disk (LAYOUT_EXTRACT_CACHE_DIR) by a hash of the screen contents.
+
+    Methods:
+    - extract(frame, title='') -> dict
+    - clear()
+    """
+
+    def __init__(self, elements_dir: str = None, cell: int = None, edge_threshold: float = None,
+                 confidence: float = None, cache_dir: str = None, max_entries: int = 32):
+        self.elements_dir = os.getenv("UI_ELEMENTS_DIR", "ui_elements") if elements_dir is None else elements_dir
+        self.cell = int(os.getenv("LAYOUT_EXTRACT_CELL", 8)) if cell is None else cell
+        self.edge_threshold = float(os.getenv("LAYOUT_EXTRACT_EDGE_THRESHOLD", 24)) if edge_threshold is None else edge_threshold
+        self.confidence = float(os.getenv("LAYOUT_EXTRACT_CONFIDENCE", 0.85)) if confidence is None else confidence
+        self.cache_dir = os.getenv("LAYOUT_EXTRACT_CACHE_DIR", ".cache/layouts") if cache_dir is None else cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, array: np.ndarray, title: str) -> str:
+        digest = hashlib.blake2b(np.ascontiguousarray(array).data, digest_size=16)
+        digest.update(f"{self.cell}:{self.edge_threshold}:{self.confidence}:{title}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def extract(self, frame, title: str = "") -> dict:
+        """Layout document for `frame` (PIL Image or RGB array), served from the cache for a screen seen before."""
+        array = np.asarray(frame)
+        key = self._key(array, title)
+        with self._lock:
+            document = self._memory.get(key)
+            if document is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return document
+        path = os.path.join(self.cache_dir, f"{key}.json") if self.cache_dir else None
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                document = json.load(f)
+            self.hits += 1
+        else:
+            document = self._extract(array, title)
+            self.misses += 1
+            if path:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                with open(path, "w") as f:
+                    json.dump(document, f)
+        with self._lock:
+            self._memory[key] = document
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _extract(self, array: np.ndarray, title: str) -> dict:
+        gray = to_gray(array)
+        height, width = gray.shape
+        edges = self._edges(gray)
+        matched = self._match_elements(gray)
+        components = list(matched)
+        matched_boxes = [c["bounds"] for c in matched]
+        detected = []
+        for box in self._candidate_boxes(edges):
+            if any(_overlap(box, other) > 0.5 for other in matched_boxes):
+                continue
+            detected.append((self._classify(gray, edges, box), box))
+        # Labels and icons drawn inside a button or field belong to it
+        containers = [self._component(t, box, "edges")["bounds"] for t, box in detected if t in ("button", "input", "dropdown")]
+        for component_type, box in detected:
+            if component_type in ("text", "icon") and any(_overlap(box, other) > 0.9 for other in containers):
+                continue
+            components.append(self._component(component_type, box, "edges"))
+        components.sort(key=lambda c: (c["bounds"]["top"], c["bounds"]["left"]))
+        return {"title": title, "resolution": f"{width}x{height}", "components": components}
+
+    def _edges(self, gray: np.ndarray) -> np.ndarray:
+        edges = np.zeros(gray.shape, dtype=bool)
+        edges[:, 1:] |= np.abs(np.diff(gray, axis=1)) > self.edge_threshold
+        edges[1:, :] |= np.abs(np.diff(gray, axis=0)) > self.edge_threshold
+        return edges
+
+    def _candidate_boxes(self, edges: np.ndarray) -> List[Box]:
+        cell = self.cell
+        height, width = edges.shape
+        rows, cols = height // cell, width // cell
+        dense = edges[:rows * cell, :cols * cell].reshape(rows, cell, cols, cell).any(axis=(1, 3))
+        boxes = []
+        for left, top, w, h in connected_boxes(dense):
+            box = (left * cell, top * cell, w * cell, h * cell)
+            # Drop specks and anything spanning most of the screen (backgrounds, page frames)
+            if w * h < 2 or box[2] * box[3] > 0.25 * width * height:
+                continue
+            boxes.append(self._tighten(edges, box))
+        return boxes
+
+    @staticmethod
+    def _tighten(edges: np.ndarray, box: Box) -> Box:
+        left, top, width, height = box
+        region = edges[top:top + height, left:left + width]
+        ys, xs = np.flatnonzero(region.any(axis=1)), np.flatnonzero(region.any(axis=0))
+        if len(ys) == 0 or len(xs) == 0:
+            return box
+        return (left + int(xs[0]), top + int(ys[0]), int(xs[-1] - xs[0] + 1), int(ys[-1] - ys[0] + 1))
+
+    @staticmethod
+    def _classify(gray: np.ndarray, edges: np.ndarray, box: Box) -> str:
+        left, top, width, height = box
+        region = edges[top:top + height, left:left + width]
+        # A drawn border shows up as edge pixels along most of the box outline
+        border = np.concatenate([region[:2].any(axis=0), region[-2:].any(axis=0), region[:, :2].any(axis=1), region[:, -2:].any(axis=1)]).mean()
+        if border > 0.8 and width <= 32 and height <= 32 and abs(width - height) <= 6:
+            return "checkbox"
+        if border > 0.8 and height <= 80:
+            inside = gray[top + 2:top + height - 2, left + 2:left + width - 2]
+            outside = gray[max(top - 4, 0):top, left:left + width]
+            filled = inside.size and outside.size and abs(float(np.median(inside)) - float(np.median(outside))) > 20
+            if filled and 1.2 <= width / height <= 10:
+                return "button"
+            return "input"
+        if height <= 48 and width >= 2 * height:
+            return "text"
+        if width <= 64 and height <= 64:
+            return "icon"
+        return "region"
+
+    @staticmethod
+    def _component(component_type: str, box: Box, source: str, **extra) -> dict:
+        left, top, width, height = box
+        return {
+            "type": component_type,
+            **extra,
+            "coordinates": {"x": int(left + width // 2), "y": int(top + height // 2)},
+            "bounds": {"left": int(left), "top": int(top), "width": int(width), "height": int(height)},
+            "source": source,
+        }
+
+    def _match_elements(self, gray: np.ndarray) -> List[dict]:
+        paths = sorted(glob.glob(os.path.join(self.elements_dir, "*.png"))) if self.elements_dir else []
+        if not paths:
+            return []
+        components = []
+        for path, matches in template_matcher.match(gray, paths, self.confidence, limit=5).items():
+            name = os.path.splitext(os.path.basename(path))[0]
+            component_type = next((t for word, t in ELEMENT_TYPES if word in name), "image")
+            for left, top, width, height, score in non_max_suppression(matches):
+                components.append(self._component(component_type, (left, top, width, height), "template",
+                                                  id=name, score=round(float(score), 3)))
+        return components
+
+
+def _overlap(box: Box, bounds: Dict[str, int]) -> float:
+    """Intersection over the area of `box`."""
+    left, top, width, height = box
+    ix = max(0, min(left + width, bounds["left"] + bounds["width"]) - max(left, bounds["left"]))
+    iy = max(0, min(top + height, bounds["top"] + bounds["height"]) - max(top, bounds["top"]))
+    return ix * iy / max(width * height, 1)
+
+
+layout_extractor = LayoutExtractor()
@@ -0,0 +1,205 @@
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+from pydantic import BaseModel
+
+Point = Tuple[int, int]
+
+
+def _tokens(text: str) -> List[str]:
+    """Lower-case word tokens, splitting camelCase ids like 'pizzaType' into 'pizza', 'type'."""
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class UIComponent(BaseModel):
+    index: int
+    type: str = ""
+    id: Optional[str] = None
+    text: Optional[str] = None
+    x: int
+    y: int
+    options: List[str] = []
+    option_points: Dict[str, Point] = {}
+    raw: Dict[str, Any] = {}
+
+
+class UILayout:
+    """
+    UILayout:
+    ---------
+
+    An indexed view of a UI layout file such as playground/pizza_page_ui_layout.json.
+    Components are indexed by id, type and text tokens, and their points are bucketed in
+    a uniform spatial grid for point and box queries. Named targets like
+    "pizzaType dropdown" or "Olives" resolve to coordinates without a model call.
+
+    Methods:
+    - by_id(id) -> Optional[UIComponent]
+    - by_type(type) -> List[UIComponent]
+    - find_text(text) -> List[UIComponent]
+    - nearest(x, y, max_distance=None) -> Optional[UIComponent]
+    - in_box(left, top, width, height) -> List[UIComponent]
+    - resolve(target) -> Optional[Tuple[int, int]]
+    - relevant_components(instruction, limit=None) -> List[dict]
+    """
+
+    def __init__(self, document: dict, cell_size: int = 100):
+        self.title = document.get("title", "")
+        self.resolution = document.get("resolution", "")
+        self.cell_size = cell_size
+        self.components: List[UIComponent] = []
+        self._by_id = {}
+        self._by_type = defaultdict(list)
+        self._by_token = defaultdict(set)
+        self._grid = defaultdict(list)
+
+        for index, raw in enumerate(document.get("components", [])):
+            coordinates = raw.get("coordinates", {})
+            option_points = {}
+            # Per-option coordinates are stored under an extra dict key, e.g. "Toppings"
+            for value in raw.values():
+                if isinstance(value, dict) and value and all(isinstance(v, dict) and "x" in v and "y" in v for v in value.values()):
+                    option_points.update({name: (int(p["x"]), int(p["y"])) for name, p in value.items()})
+            component = UIComponent(
+                index=index,
+                type=raw.get("type", ""),
+                id=raw.get("id"),
+                text=raw.get("text"),
+                x=int(coordinates.get("x", 0)),
+                y=int(coordinates.get("y", 0)),
+                options=raw.get("options", []),
+                option_points=option_points,
+                raw=raw,
+            )
+            self.components.append(component)
+            if component.id:
+                self._by_id[component.id] = component
+            self._by_type[component.type.lower()].append(component)
+            for token in self._component_tokens(component):
+                self._by_token[token].add(index)
+            self._grid[self._cell(component.x, component.y)].append(component)
+            for point in option_points.values():
+                self._grid[self._cell(*point)].append(component)
+
+    @classmethod
+    def from_file(cls, path: str) -> "UILayout":
+        with open(path, "r") as f:
+            return cls(json.load(f))
+
+    def _cell(self, x: int, y: int) -> Tuple[int, int]:
+        return (x // self.cell_size, y // self.cell_size)
+
+    @staticmethod
+    def _component_tokens(component: UIComponent) -> set:
+        tokens = set(_tokens(component.id or "")) | set(_tokens(component.text or "")) | set(_tokens(component.type))
+        for option in component.options:
+            tokens |= set(_tokens(option))
+        return tokens
+
+    def by_id(self, id: str) -> Optional[UIComponent]:
+        return self._by_id.get(id)
+
+    def by_type(self, type: str) -> List[UIComponent]:
+        return list(self._by_type.get(type.lower(), []))
+
+    def find_text(self, text: str) -> List[UIComponent]:
+        needle = text.lower()
+        return [c for c in self.components if needle in (c.text or "").lower() or any(needle == o.lower() for o in c.options)]
+
+    def nearest(self, x: int, y: int, max_distance: int = None) -> Optional[UIComponent]:
+        """Closest component point to (x, y), searching grid rings outward from (x, y)'s cell."""
+        cx, cy = self._cell(x, y)
+        max_ring = (max_distance // self.cell_size + 1) if max_distance is not None else max(
+            [abs(k[0] - cx) for k in self._grid] + [abs(k[1] - cy) for k in self._grid] + [0])
+        best, best_distance = None, None
+        for ring in range(max_ring + 1):
+            for gx in range(cx - ring, cx + ring + 1):
+                for gy in range(cy - ring, cy + ring + 1):
+                    if max(abs(gx - cx), abs(gy - cy)) != ring:
+                        continue
+                    for component in self._grid.get((gx, gy), []):
+                        for px, py in [(component.x, component.y)] + list(component.option_points.values()):
+                            distance = (px - x) ** 2 + (py - y) ** 2
+                            if best_distance is None or distance < best_distance:
+                                best, best_distance = component, distance
+            # Anything in a further ring is at least `ring` cells away
+            if best is not None and best_distance <= (ring * self.cell_size) ** 2:
+                break
+        if best is not None and max_distance is not None and best_distance > max_distance ** 2:
+            return None
+        return best
+
+    def in_box(self, left: int, top: int, width: int, height: int) -> List[UIComponent]:
+        found = {}
+        x0, y0 = self._cell(left, top)
+        x1, y1 = self._cell(left + width, top + height)
+        for gx in range(x0, x1 + 1):
+            for gy in range(y0, y1 + 1):
+                for component in self._grid.get((gx, gy), []):
+                    points = [(component.x, component.y)] + list(component.option_points.values())
+                    if any(left <= px <= left + width and top <= py <= top + height for px, py in points):
+                        found[component.index] = component
+        return [found[i] for i in sorted(found)]
+
+    def _scores(self, text: str) -> Dict[int, int]:
+        scores = defaultdict(int)
+        for token in _tokens(text):
+            for index in self._by_token.get(token, ()):
+                scores[index] += 1
+        return scores
+
+    def resolve(self, target: str) -> Optional[Point]:
+        """
+        Coordinates for a named target: an exact id, an option name with its own
+        coordinates (e.g. a topping checkbox), or the best token match on id, type and text.
+        """
+        if target in self._by_id:
+            component = self._by_id[target]
+            return (component.x, component.y)
+        wanted = target.lower()
+        for component in self.components:
+            for option, point in component.option_points.items():
+                if option.lower() in wanted:
+                    return point
+        scores = self._scores(target)
+        if not scores:
+            return None
+        best = max(scores, key=lambda index: (scores[index], -index))
+        component = self.components[best]
+        return (component.x, component.y)
+
+    def relevant_components(self, instruction: str, limit: int = None) -> List[dict]:
+        """Raw components sharing a word with the instruction, best first; empty when none do."""
+        scores = self._scores(instruction)
+        ranked = sorted(scores, key=lambda index: (-scores[index], index))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [self.components[index].raw for index in ranked]
+
+
+_layouts = {}
+_layouts_lock = threading.Lock()
+
+
+def load_layout(path: str = None) -> Optional[UILayout]:
+    """
+    Load and index a layout file once, reloading only when it changes on disk. The path
+    defaults to UI_LAYOUT_PATH; returns None when the file does not exist.
+    """
+    path = path or os.getenv("UI_LAYOUT_PATH", "playground/pizza_page_ui_layout.json")
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _layouts_lock:
+        cached = _layouts.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    layout = UILayout.from_file(path)
+    with _layouts_lock:
+        _layouts[path] = (mtime, layout)
+    return layout
@@ -0,0 +1,134 @@
+import os
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Tuple
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_FONT_PATH = "arial.ttf"
+
+
+@lru_cache(maxsize=8)
+def load_font(font_path: str = DEFAULT_FONT_PATH, font_size: int = 6):
+    """
+    Load a truetype font once, falling back to PIL's default font if it is not installed.
+    """
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except Exception:
+        return ImageFont.load_default()
+
+
+def draw_coordinate_grid(draw: ImageDraw.ImageDraw, width: int, height: int, step: int, font, arrow_size: int = 5,
+                         label_origin: Tuple[float, float] = (0, 0), label_scale: Tuple[float, float] = (1.0, 1.0)):
+    """
+    Draw a red arrow and a "(x, y)" label on a white box for every grid point.
+
+    Labels show label_origin + pixel * label_scale, so a downscaled or cropped view can
+    be labeled with the screen coordinates its pixels map to.
+
+    This is the per-point drawing loop shared by the cached overlay and by anything
+    that still needs to draw straight onto a frame.
+    """
+    arrow_color = (255, 0, 0)  # Red color for visibility
+    for y in range(0, height, step):
+        for x in range(0, width, step):
+            # Calculate arrow endpoint
+            end_x = x + 15
+            end_y = y - 15
+
+            # Draw arrow line
+            draw.line([(end_x, end_y), (x, y)], fill=arrow_color, width=1)
+
+            # Draw arrowhead
+            draw.polygon([
+                (x, y),
+                (x + arrow_size, y - arrow_size),
+                (x - arrow_size, y - arrow_size)
+            ], fill=arrow_color)
+
+            # Add coordinate text
+            text = f"({round(label_origin[0] + x * label_scale[0])}, {round(label_origin[1] + y * label_scale[1])})"
+            text_bbox = draw.textbbox((end_x, end_y), text, font=font)
+
+            # Draw white background for text
+            draw.rectangle([
+                (text_bbox[0]-2, text_bbox[1]-2),
+                (text_bbox[2]+2, text_bbox[3]+2)
+            ], fill=(255, 255, 255))
+
+            # Draw coordinate text
+            draw.text((end_x, end_y), text, fill=(0, 0, 0), font=font)
+
+
+class GridOverlayCache:
+    """
+    GridOverlayCache:
+    -----------------
+
+    Renders the coordinate grid once per (resolution, step, font, arrow size) as a
+    transparent RGBA layer and keeps the most recently used layers in an LRU cache.
+
+    Methods:
+    - get(size, step, font_path, font_size, arrow_length, arrow_size, label_origin, label_scale) -> Image
+    - apply(image, step=None, label_origin=(0, 0), label_scale=(1.0, 1.0)) -> Image
+    - clear()
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = int(os.getenv("GRID_OVERLAY_CACHE_SIZE", 4)) if max_entries is None else max_entries
+        self._layers = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, size: Tuple[int, int], step: int, font_path: str = DEFAULT_FONT_PATH, font_size: int = 6,
+            arrow_length: int = 20, arrow_size: int = 5, label_origin: Tuple[float, float] = (0, 0),
+            label_scale: Tuple[float, float] = (1.0, 1.0)) -> Image:
+        key = (tuple(size), step, font_path, font_size, arrow_length, arrow_size, tuple(label_origin), tuple(label_scale))
+        with self._lock:
+            layer = self._layers.get(key)
+            if layer is not None:
+                self._layers.move_to_end(key)
+                self.hits += 1
+                return layer
+
+        width, height = size
+        layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        draw_coordinate_grid(ImageDraw.Draw(layer), width, height, step, load_font(font_path, font_size), arrow_size,
+                             label_origin, label_scale)
+
+        with self._lock:
+            self.misses += 1
+            self._layers[key] = layer
+            while len(self._layers) > self.max_entries:
+                self._layers.popitem(last=False)
+        return layer
+
+    def apply(self, image: Image, step: int = None, label_origin: Tuple[float, float] = (0, 0),
+              label_scale: Tuple[float, float] = (1.0, 1.0)) -> Image:
+        """
+        Alpha-composite the cached grid layer onto the image in place and return it.
+        """
+        step = int(os.getenv("SCREENSHOT_STEP", 50)) if step is None else step
+        layer = self.get(
+            image.size,
+            step,
+            font_size=int(os.getenv("FONT_SIZE", 6)),
+            arrow_length=int(os.getenv("ARROW_LENGTH", 20)),
+            arrow_size=int(os.getenv("ARROW_SIZE", 5)),
+            label_origin=label_origin,
+            label_scale=label_scale,
+        )
+        if image.mode == "RGBA":
+            image.alpha_composite(layer)
+        else:
+            image.paste(layer, (0, 0), layer)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._layers.clear()
+
+
+grid_overlay_cache = GridOverlayCache()
@@ -0,0 +1,196 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+from pydantic import BaseModel
+from TrajectoryHelper import normalize_instruction
+
+# Lines that start a plan step: "1.", "2)", "Step 3:", "**4.", "### 5." and bullets
+STEP_PATTERN = re.compile(r"^\s*(?:#+\s*)?(?:\*\*)?(?:step\s*)?(\d+)\s*[.):]\**\s*(.*)$", re.IGNORECASE)
+BULLET_PATTERN = re.compile(r"^\s*[-*•]\s+(.*)$")
+EDIT_PATTERNS = (
+    ("replace", re.compile(r"^REPLACE\s+(\d+)\s*:\s*(.+)$", re.IGNORECASE)),
+    ("insert", re.compile(r"^INSERT\s+AFTER\s+(\d+)\s*:\s*(.+)$", re.IGNORECASE)),
+    ("delete", re.compile(r"^DELETE\s+(\d+)\s*$", re.IGNORECASE)),
+)
+STOPWORDS = {"the", "and", "for", "with", "then", "that", "this", "instead", "should", "step", "steps", "please", "not", "but", "from", "into", "use"}
+
+
+def parse_plan_steps(text: str) -> List[str]:
+    """
+    Split a model-written plan into steps. Numbered lines start steps (bullets do when
+    nothing is numbered) and other lines are folded into the step above; text before the
+    first step is dropped as a preamble. Falls back to one step per non-empty line.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith("```")]
+    pattern = STEP_PATTERN if any(STEP_PATTERN.match(line) for line in lines) else BULLET_PATTERN
+    steps = []
+    for line in lines:
+        match = pattern.match(line)
+        if match:
+            steps.append(match.group(match.lastindex).replace("**", "").strip())
+        elif steps:
+            continuation = BULLET_PATTERN.match(line)
+            steps[-1] = f"{steps[-1]}; {(continuation.group(1) if continuation else line).replace('**', '')}".strip("; ")
+    return [step for step in steps if step] or lines
+
+
+def _words(text: str) -> set:
+    return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if len(word) > 2 and word not in STOPWORDS}
+
+
+class TaskPlan(BaseModel):
+    goal: str
+    steps: List[str] = []
+    created: float = 0.0
+    updated: float = 0.0
+
+    @classmethod
+    def from_text(cls, goal: str, text: str) -> "TaskPlan":
+        now = time.time()
+        return cls(goal=goal, steps=parse_plan_steps(text), created=now, updated=now)
+
+    def render(self) -> str:
+        return "\n".join(f"{number}. {step}" for number, step in enumerate(self.steps, 1))
+
+    def affected_steps(self, feedback: str) -> List[int]:
+        """
+        1-based numbers of the steps `feedback` is about: the ones it names ("step 3"),
+        otherwise the ones sharing words with it, otherwise all of them.
+        """
+        named = sorted({int(n) for n in re.findall(r"(?:step|#)\s*(\d+)", feedback, re.IGNORECASE) if 1 <= int(n) <= len(self.steps)})
+        if named:
+            return named
+        words = _words(feedback)
+        related = [number for number, step in enumerate(self.steps, 1) if words & _words(step)]
+        return related or list(range(1, len(self.steps) + 1))
+
+    def diff_prompt(self, feedback: str) -> str:
+        """An update request carrying the affected steps in full and the others abbreviated."""
+        affected = self.affected_steps(feedback)
+        lines = [f'The task plan for the goal "{self.goal}" has {len(self.steps)} steps.', "Steps affected by the feedback:"]
+        lines += [f"{number}. {self.steps[number - 1]}" for number in affected]
+        others = [f"{number}. {step[:40]}{'...' if len(step) > 40 else ''}" for number, step in enumerate(self.steps, 1) if number not in affected]
+        if others:
+            lines.append(f"Other steps (abbreviated): {' | '.join(others)}")
+        lines += [
+            f"User feedback: {feedback}",
+            "",
+            "Reply only with edits to the plan, one per line, using the step numbers above:",
+            "REPLACE <n>: <new text of step n>",
+            "INSERT AFTER <n>: <new step> (INSERT AFTER 0 adds a first step)",
+            "DELETE <n>",
+            "Reply NONE if the plan needs no change.",
+        ]
+        return "\n".join(lines)
+
+    def apply_diff(self, reply: str) -> Optional["TaskPlan"]:
+        """The plan with the edits in `reply` applied, or None when the reply is not a valid edit list."""
+        replaced, deleted, inserted = {}, set(), {}
+        edits = 0
+        for line in (line.strip().strip("`") for line in reply.splitlines()):
+            if not line:
+                continue
+            if line.upper() == "NONE":
+                continue
+            for kind, pattern in EDIT_PATTERNS:
+                match = pattern.match(line)
+                if match:
+                    break
+            else:
+                return None
+            number = int(match.group(1))
+            if number > len(self.steps) or (number < 1 and kind != "insert"):
+                return None
+            if kind == "replace":
+                replaced[number] = match.group(2).strip()
+            elif kind == "delete":
+                deleted.add(number)
+            else:
+                inserted.setdefault(number, []).append(match.group(2).strip())
+            edits += 1
+        if not edits and "NONE" not in reply.upper():
+            return None
+        steps = list(inserted.get(0, []))
+        for number, step in enumerate(self.steps, 1):
+            if number not in deleted:
+                steps.append(replaced.get(number, step))
+            steps.extend(inserted.get(number, []))
+        return self.model_copy(update={"steps": steps, "updated": time.time()})
+
+
+class PlanCache:
+    """
+    PlanCache:
+    ----------
+
+    Task plans as step lists in a SQLite file (PLAN_CACHE_PATH), keyed by the normalized
+    goal and expired after PLAN_CACHE_TTL_SECONDS, so a recurring goal is planned once.
+
+    Methods:
+    - get(goal) -> Optional[TaskPlan]
+    - put(plan) -> TaskPlan
+    - clear()
+    """
+
+    def __init__(self, path: str = None, ttl_seconds: float = None):
+        self.path = os.getenv("PLAN_CACHE_PATH", ".cache/plans.sqlite3") if path is None else path
+        self.ttl_seconds = float(os.getenv("PLAN_CACHE_TTL_SECONDS", 30 * 24 * 3600)) if ttl_seconds is None else ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS plans (key TEXT PRIMARY KEY, plan TEXT, updated REAL)")
+        self._db.commit()
+
+    def get(self, goal: str) -> Optional[TaskPlan]:
+        with self._lock:
+            row = self._db.execute("SELECT plan, updated FROM plans WHERE key = ?", (normalize_instruction(goal),)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return TaskPlan(**json.loads(row[0]))
+
+    def put(self, plan: TaskPlan) -> TaskPlan:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO plans (key, plan, updated) VALUES (?, ?, ?)",
+                (normalize_instruction(plan.goal), plan.model_dump_json(), plan.updated or time.time()),
+            )
+            self._db.commit()
+        return plan
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM plans")
+            self._db.commit()
+
+
+def plan_for_update(task_plan: str, goal: str = None, cache: PlanCache = None) -> TaskPlan:
+    """The stored plan for `goal` when it is the plan being updated, otherwise `task_plan` parsed into steps."""
+    stored = cache.get(goal) if cache is not None and goal else None
+    if stored is not None and stored.render() == task_plan.strip():
+        return stored
+    return TaskPlan.from_text(goal or "", task_plan)
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """
+    Shared PlanCache, created on first use. Returns None when PLAN_CACHE_ENABLED is false.
+    """
+    global _plan_cache
+    if os.getenv("PLAN_CACHE_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            _plan_cache = PlanCache()
+        return _plan_cache
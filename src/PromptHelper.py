@@ -0,0 +1,212 @@
+import base64
+import io
+import math
+import os
+from functools import lru_cache
+from string import Formatter
+from typing import List, Optional, Tuple
+from PIL import Image
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Chat formatting overhead per message, as counted by OpenAI for gpt-4-class models
+TOKENS_PER_MESSAGE = 4
+TRIM_MARKER = "\n[...trimmed...]\n"
+# Images sent with detail "low" are billed as one base tile whatever their size
+LOW_DETAIL_IMAGE_TOKENS = 85
+# Prefixes of every PromptTemplate, which the budget never trims
+_static_prefixes = set()
+
+
+class PromptTemplate:
+    """
+    PromptTemplate:
+    ---------------
+
+    A prompt split into a static prefix and a templated suffix. The prefix (instructions,
+    function catalog) is stored once and rendered byte-for-byte identically on every call
+    so provider-side prefix caching can reuse it; only the suffix is formatted. Prefixes
+    are registered so PromptBudget trims only the suffix of a rendered system message.
+
+    Methods:
+    - render(**values) -> str
+    """
+
+    def __init__(self, prefix: str, suffix: str = ""):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.fields = tuple(name for _, name, _, _ in Formatter().parse(suffix) if name)
+        _static_prefixes.add(prefix)
+
+    def render(self, **values) -> str:
+        if not self.fields:
+            return self.prefix + self.suffix
+        return self.prefix + self.suffix.format(**values)
+
+
+def static_prefix_length(text: str) -> Optional[int]:
+    """Length of the longest PromptTemplate prefix `text` starts with, or None when it was not rendered from one."""
+    matches = [len(prefix) for prefix in _static_prefixes if text.startswith(prefix)]
+    return max(matches) if matches else None
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    """Tokens in `text`, counted with tiktoken when installed and estimated at ~4 characters per token otherwise."""
+    if not text:
+        return 0
+    if tiktoken is not None:
+        return len(_encoding(model).encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Tokens billed for a high-detail image: fit in 2048x2048, shortest side to 768, then 170 per 512px tile plus 85."""
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 170 * math.ceil(width / 512) * math.ceil(height / 512) + 85
+
+
+def _decode_data_url(url: str) -> Tuple[str, bytes]:
+    header, data = url.split(",", 1)
+    return header[len("data:"):].split(";", 1)[0], base64.b64decode(data)
+
+
+class PromptBudget:
+    """
+    PromptBudget:
+    -------------
+
+    Measures a chat request locally (text tokens, image tokens and image bytes) and makes
+    it fit a per-request budget before it is sent: inline images are downscaled to the byte
+    budget, then the longest text is trimmed in the middle, and images are downscaled
+    further only if the request is still over. Of the first (system) message only the
+    suffix after its PromptTemplate prefix can be trimmed, so the prefix stays cacheable.
+
+    Configured with PROMPT_MAX_TOKENS, PROMPT_MAX_IMAGE_BYTES and PROMPT_MIN_IMAGE_SIDE.
+
+    Methods:
+    - measure(messages) -> dict
+    - fit(messages) -> list
+    """
+
+    def __init__(self, max_tokens: int = None, max_image_bytes: int = None, min_image_side: int = None, model: str = "gpt-4o"):
+        self.max_tokens = int(os.getenv("PROMPT_MAX_TOKENS", 8000)) if max_tokens is None else max_tokens
+        self.max_image_bytes = int(os.getenv("PROMPT_MAX_IMAGE_BYTES", 4 * 1024 * 1024)) if max_image_bytes is None else max_image_bytes
+        self.min_image_side = int(os.getenv("PROMPT_MIN_IMAGE_SIDE", 512)) if min_image_side is None else min_image_side
+        self.model = model
+
+    @staticmethod
+    def _parts(messages) -> List[dict]:
+        return [part for message in messages if isinstance(message.get("content"), list) for part in message["content"]]
+
+    def measure(self, messages) -> dict:
+        text_tokens = 0
+        image_token_count = 0
+        image_bytes = 0
+        for message in messages:
+            text_tokens += TOKENS_PER_MESSAGE
+            content = message.get("content")
+            if isinstance(content, str):
+                text_tokens += count_tokens(content, self.model)
+                continue
+            for part in content or []:
+                if part.get("type") == "text":
+                    text_tokens += count_tokens(part["text"], self.model)
+                elif part.get("type") == "image_url" and part["image_url"]["url"].startswith("data:"):
+                    _, data = _decode_data_url(part["image_url"]["url"])
+                    image_bytes += len(data)
+                    if part["image_url"].get("detail") == "low":
+                        image_token_count += LOW_DETAIL_IMAGE_TOKENS
+                    else:
+                        # Only the header is parsed to get the size
+                        image_token_count += image_tokens(*Image.open(io.BytesIO(data)).size)
+        return {
+            "text_tokens": text_tokens,
+            "image_tokens": image_token_count,
+            "tokens": text_tokens + image_token_count,
+            "image_bytes": image_bytes,
+        }
+
+    def _over(self, usage: dict) -> bool:
+        return (self.max_tokens and usage["tokens"] > self.max_tokens) or \
+            (self.max_image_bytes and usage["image_bytes"] > self.max_image_bytes)
+
+    def fit(self, messages) -> list:
+        """
+        Return `messages`, or a copy shrunk to fit the budget. The first message keeps its
+        PromptTemplate prefix and is left whole when it was not rendered from a template.
+        """
+        usage = self.measure(messages)
+        if not self._over(usage):
+            return messages
+
+        messages = [
+            {**message, "content": [dict(part) for part in message["content"]]} if isinstance(message.get("content"), list) else dict(message)
+            for message in messages
+        ]
+        first = messages[0].get("content")
+        protected = static_prefix_length(first) if isinstance(first, str) else None
+        while self.max_image_bytes and usage["image_bytes"] > self.max_image_bytes and self._downscale_largest_image(messages[1:]):
+            usage = self.measure(messages)
+        if self.max_tokens and usage["tokens"] > self.max_tokens:
+            self._trim_text(messages, usage["tokens"] - self.max_tokens, protected)
+            usage = self.measure(messages)
+        # Images only shrink for tokens when the text alone cannot make up the difference
+        while self._over(usage) and self._downscale_largest_image(messages[1:]):
+            usage = self.measure(messages)
+        print(f"Prompt fitted to budget: {usage['tokens']} tokens, {usage['image_bytes']} image bytes")
+        return messages
+
+    def _downscale_largest_image(self, messages) -> bool:
+        candidates = []
+        for part in self._parts(messages):
+            if part.get("type") == "image_url" and part["image_url"]["url"].startswith("data:"):
+                mime_type, data = _decode_data_url(part["image_url"]["url"])
+                candidates.append((len(data), part, mime_type, data))
+        for _, part, mime_type, data in sorted(candidates, key=lambda c: -c[0]):
+            image = Image.open(io.BytesIO(data))
+            if min(image.size) * 3 // 4 < self.min_image_side:
+                continue
+            image = image.resize((image.width * 3 // 4, image.height * 3 // 4), Image.LANCZOS)
+            image_format = mime_type.split("/")[-1].upper()
+            if image_format == "JPEG" and image.mode != "RGB":
+                image = image.convert("RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format)
+            part["image_url"] = {**part["image_url"], "url": f"data:{mime_type};base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"}
+            return True
+        return False
+
+    def _trim_text(self, messages, excess_tokens: int, first_protected: Optional[int] = None):
+        # (holder, key, length of the leading text that must be kept)
+        texts = [(message, "content", 0) for message in messages[1:] if isinstance(message.get("content"), str)]
+        texts += [(part, "text", 0) for part in self._parts(messages[1:]) if part.get("type") == "text"]
+        if first_protected is not None:
+            texts.append((messages[0], "content", first_protected))
+        texts = [(holder, key, protected) for holder, key, protected in texts if len(holder[key]) > protected]
+        if not texts:
+            return
+        holder, key, protected = max(texts, key=lambda t: len(t[0][t[1]]) - t[2])
+        head, text = holder[key][:protected], holder[key][protected:]
+        # Characters per token of this text, so the cut lands close to the excess
+        ratio = len(text) / max(count_tokens(text, self.model), 1)
+        cut = min(len(text), math.ceil((excess_tokens + count_tokens(TRIM_MARKER, self.model)) * ratio))
+        keep = len(text) - cut
+        trimmed = text[:keep // 2] + TRIM_MARKER + text[len(text) - (keep - keep // 2):] if keep > 0 else TRIM_MARKER
+        holder[key] = head + trimmed
+
+
+prompt_budget = PromptBudget()
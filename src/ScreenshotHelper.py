@@ -0,0 +1,115 @@
+import io
+import os
+import queue
+import threading
+from typing import Optional
+from PIL import Image
+from pydantic import BaseModel
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+FILE_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+
+class EncodedFrame(BaseModel):
+    data: bytes
+    format: str
+    path: Optional[str] = None
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+    @classmethod
+    def from_file(cls, path: str) -> "EncodedFrame":
+        extension = os.path.splitext(path)[1].lstrip(".").lower()
+        format = next((f for f, ext in FILE_EXTENSIONS.items() if ext == extension), "PNG")
+        with open(path, "rb") as f:
+            return cls(data=f.read(), format=format, path=path)
+
+
+class FrameEncoder:
+    """
+    FrameEncoder:
+    -------------
+
+    Encodes a PIL image exactly once into a reusable in-memory buffer.
+
+    The format and its settings come from the environment unless passed in:
+    - SCREENSHOT_FORMAT: PNG, JPEG or WEBP (default PNG)
+    - SCREENSHOT_PNG_COMPRESS_LEVEL: zlib level 0-9 for PNG (default 6)
+    - SCREENSHOT_QUALITY: quality 1-100 for JPEG and WEBP (default 85)
+    """
+
+    def __init__(self, format: str = None, compress_level: int = None, quality: int = None):
+        self.format = (format or os.getenv("SCREENSHOT_FORMAT", "PNG")).upper()
+        if self.format == "JPG":
+            self.format = "JPEG"
+        if self.format not in MIME_TYPES:
+            raise ValueError(f"Unsupported screenshot format: {self.format}")
+        self.compress_level = int(os.getenv("SCREENSHOT_PNG_COMPRESS_LEVEL", 6)) if compress_level is None else compress_level
+        self.quality = int(os.getenv("SCREENSHOT_QUALITY", 85)) if quality is None else quality
+        self._buffer = io.BytesIO()
+        self._lock = threading.Lock()
+
+    @property
+    def extension(self) -> str:
+        return FILE_EXTENSIONS[self.format]
+
+    def encode(self, image: Image) -> EncodedFrame:
+        if self.format == "PNG":
+            options = {"compress_level": self.compress_level}
+        else:
+            options = {"quality": self.quality}
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+        with self._lock:
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            image.save(self._buffer, format=self.format, **options)
+            data = self._buffer.getvalue()
+        return EncodedFrame(data=data, format=self.format)
+
+
+class BackgroundWriter:
+    """
+    BackgroundWriter:
+    -----------------
+
+    Writes encoded frames to disk on a daemon thread so capture never waits on file I/O.
+
+    Methods:
+    - submit(path, data)
+    - flush()
+    - close()
+    """
+
+    def __init__(self, max_pending: int = 16):
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="screenshot-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path: str, data: bytes):
+        self._queue.put((path, data))
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                path, data = item
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "wb") as f:
+                    f.write(data)
+            except Exception as e:
+                print(f"Error writing screenshot: {e}")
+            finally:
+                self._queue.task_done()
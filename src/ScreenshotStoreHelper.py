@@ -0,0 +1,317 @@
+import hashlib
+import io
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+REF_PREFIX = "store:"
+
+
+class ScreenshotRecord(BaseModel):
+    session: str
+    step: int
+    hash: str
+    kind: str
+    width: int
+    height: int
+    created: float
+
+    @property
+    def ref(self) -> str:
+        return ScreenshotStore.ref(self.session, self.step)
+
+
+class ScreenshotStore:
+    """
+    ScreenshotStore:
+    ----------------
+
+    Content-addressed screenshot storage under SCREENSHOT_STORE_DIR with a SQLite index of
+    (session, step) -> frame. Identical frames are stored once. A frame that differs from
+    the current keyframe in at most SCREENSHOT_STORE_DELTA_MAX_FRACTION of its pixels is
+    stored as a delta: a PNG of the changed bounding box, with unchanged pixels zeroed
+    and an alpha mask, pasted onto the keyframe when read back. A new keyframe is taken
+    every SCREENSHOT_STORE_KEYFRAME_INTERVAL deltas.
+
+    Frames older than SCREENSHOT_STORE_MAX_AGE_SECONDS are evicted, then the oldest frames
+    until the blobs fit in SCREENSHOT_STORE_MAX_MB; a keyframe is deleted only once no
+    delta refers to it. Frames are hashed, diffed and written on a background thread.
+
+    Methods:
+    - submit(image, data=None, session='default', step=None) -> str
+    - flush()
+    - find(session, step) -> Optional[ScreenshotRecord]
+    - frames(session=None) -> List[ScreenshotRecord]
+    - load(hash) -> Optional[Image]
+    - open(ref) -> Optional[Image]
+    - evict()
+    - stats() -> dict
+    - close()
+    """
+
+    def __init__(self, directory: str = None, max_mb: float = None, max_age_seconds: float = None,
+                 keyframe_interval: int = None, delta_max_fraction: float = None, max_pending: int = 16):
+        self.directory = os.getenv("SCREENSHOT_STORE_DIR", "screenshots/store") if directory is None else directory
+        self.max_bytes = int(1024 * 1024 * (float(os.getenv("SCREENSHOT_STORE_MAX_MB", 512)) if max_mb is None else max_mb))
+        self.max_age_seconds = float(os.getenv("SCREENSHOT_STORE_MAX_AGE_SECONDS", 7 * 24 * 3600)) if max_age_seconds is None else max_age_seconds
+        self.keyframe_interval = int(os.getenv("SCREENSHOT_STORE_KEYFRAME_INTERVAL", 30)) if keyframe_interval is None else keyframe_interval
+        self.delta_max_fraction = float(os.getenv("SCREENSHOT_STORE_DELTA_MAX_FRACTION", 0.3)) if delta_max_fraction is None else delta_max_fraction
+        self.evict_interval = 60.0
+        self.deduplicated = 0
+        self._lock = threading.Lock()
+        # Held while a frame is written and during eviction, so a keyframe cannot vanish under a new delta
+        self._write_lock = threading.Lock()
+        self._steps = {}
+        self._keyframe = None
+        self._deltas_since_keyframe = 0
+        self._last_evicted = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"), check_same_thread=False)
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY, kind TEXT, base TEXT, file TEXT, bytes INTEGER,
+                width INTEGER, height INTEGER, left INTEGER, top INTEGER, created REAL
+            );
+            CREATE TABLE IF NOT EXISTS frames (
+                id INTEGER PRIMARY KEY, session TEXT, step INTEGER, hash TEXT, created REAL,
+                UNIQUE (session, step)
+            );
+            CREATE INDEX IF NOT EXISTS frames_hash ON frames (hash);
+            CREATE INDEX IF NOT EXISTS frames_created ON frames (created);
+            CREATE INDEX IF NOT EXISTS blobs_base ON blobs (base);
+        """)
+        self._db.commit()
+        self._bytes = self._db.execute("SELECT COALESCE(SUM(bytes), 0) FROM blobs").fetchone()[0]
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="screenshot-store", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def ref(session: str, step: int) -> str:
+        """A string naming a stored frame, usable where a screenshot path is expected."""
+        return f"{REF_PREFIX}{session}/{step}"
+
+    @staticmethod
+    def is_ref(path) -> bool:
+        return isinstance(path, str) and path.startswith(REF_PREFIX)
+
+    @staticmethod
+    def new_session(prefix: str = "run") -> str:
+        return f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+    def submit(self, image: Image.Image, data: bytes = None, session: str = "default", step: int = None) -> str:
+        """
+        Queue a frame for storage and return its ref. `data` may be the frame already
+        encoded as PNG, which is then written as-is when the frame becomes a keyframe.
+        Steps are numbered per session when `step` is not given.
+        """
+        with self._lock:
+            if step is None:
+                step = self._steps.get(session, self._last_step(session)) + 1
+            self._steps[session] = max(step, self._steps.get(session, 0))
+        self._queue.put((image, data, session, step, time.time()))
+        return self.ref(session, step)
+
+    def flush(self):
+        """Wait until every submitted frame is stored."""
+        self._queue.join()
+
+    def find(self, session: str, step: int) -> Optional[ScreenshotRecord]:
+        rows = self._records("WHERE f.session = ? AND f.step = ?", (session, step))
+        return rows[0] if rows else None
+
+    def frames(self, session: str = None) -> List[ScreenshotRecord]:
+        if session is None:
+            return self._records("", ())
+        return self._records("WHERE f.session = ?", (session,))
+
+    def load(self, hash: str) -> Optional[Image.Image]:
+        """The frame stored under a content hash, with deltas applied to their keyframe."""
+        with self._lock:
+            row = self._db.execute("SELECT kind, base, file, left, top FROM blobs WHERE hash = ?", (hash,)).fetchone()
+        if row is None:
+            return None
+        kind, base, file, left, top = row
+        with Image.open(os.path.join(self.directory, file)) as stored:
+            stored.load()
+            if kind == "key":
+                return stored.convert("RGB")
+            image = self.load(base)
+            if image is None:
+                return None
+            image.paste(stored.convert("RGB"), (left, top), stored.getchannel("A"))
+            return image
+
+    def open(self, ref: str) -> Optional[Image.Image]:
+        """The frame named by a ref returned from submit()."""
+        self.flush()
+        session, _, step = ref[len(REF_PREFIX):].rpartition("/")
+        record = self.find(session, int(step))
+        return self.load(record.hash) if record is not None else None
+
+    def evict(self):
+        """Drop frames past the age budget, then the oldest frames until the size budget is met."""
+        with self._write_lock, self._lock:
+            self._db.execute("DELETE FROM frames WHERE created < ?", (time.time() - self.max_age_seconds,))
+            self._collect()
+            while self._bytes > self.max_bytes:
+                deleted = self._db.execute(
+                    "DELETE FROM frames WHERE id IN (SELECT id FROM frames ORDER BY created, id LIMIT 1)"
+                ).rowcount
+                if not deleted:
+                    break
+                self._collect()
+            self._db.commit()
+            self._last_evicted = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            frames = self._db.execute("SELECT COUNT(*) FROM frames").fetchone()[0]
+            kinds = dict(self._db.execute("SELECT kind, COUNT(*) FROM blobs GROUP BY kind").fetchall())
+        return {
+            "frames": frames,
+            "keyframes": kinds.get("key", 0),
+            "deltas": kinds.get("delta", 0),
+            "deduplicated": self.deduplicated,
+            "bytes": self._bytes,
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+        with self._lock:
+            self._db.close()
+
+    def _records(self, where: str, params: tuple) -> List[ScreenshotRecord]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT f.session, f.step, f.hash, b.kind, b.width, b.height, f.created "
+                f"FROM frames f JOIN blobs b ON b.hash = f.hash {where} ORDER BY f.session, f.step",
+                params,
+            ).fetchall()
+        return [ScreenshotRecord(session=r[0], step=r[1], hash=r[2], kind=r[3], width=r[4], height=r[5], created=r[6]) for r in rows]
+
+    def _last_step(self, session: str) -> int:
+        row = self._db.execute("SELECT MAX(step) FROM frames WHERE session = ?", (session,)).fetchone()
+        return row[0] if row[0] is not None else 0
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                with self._write_lock:
+                    self._store(*item)
+                if self._bytes > self.max_bytes or time.time() - self._last_evicted > self.evict_interval:
+                    self.evict()
+            except Exception as e:
+                print(f"Error storing screenshot: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _store(self, image: Image.Image, data: Optional[bytes], session: str, step: int, created: float):
+        array = np.asarray(image.convert("RGB"))
+        digest = hashlib.blake2b(array.data, digest_size=16)
+        digest.update(f"{array.shape}".encode("utf-8"))
+        hash = digest.hexdigest()
+        with self._lock:
+            exists = self._db.execute("SELECT 1 FROM blobs WHERE hash = ?", (hash,)).fetchone() is not None
+        if exists:
+            self.deduplicated += 1
+        else:
+            self._write_blob(hash, array, data, created)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO frames (session, step, hash, created) VALUES (?, ?, ?, ?)",
+                (session, step, hash, created),
+            )
+            self._db.commit()
+
+    def _write_blob(self, hash: str, array: np.ndarray, data: Optional[bytes], created: float):
+        height, width = array.shape[:2]
+        kind, base, left, top = "key", None, 0, 0
+        keyframe = self._keyframe
+        if keyframe is not None and keyframe[1].shape == array.shape and self._deltas_since_keyframe < self.keyframe_interval:
+            changed = np.any(array != keyframe[1], axis=2)
+            if changed.mean() <= self.delta_max_fraction:
+                rows, cols = np.flatnonzero(changed.any(axis=1)), np.flatnonzero(changed.any(axis=0))
+                top, bottom, left, right = int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1
+                mask = changed[top:bottom, left:right]
+                # Zeroed unchanged pixels compress to almost nothing; the mask says which pixels to paste
+                patch = np.dstack([array[top:bottom, left:right] * mask[..., None], mask.astype(np.uint8) * 255])
+                data = _encode_png(Image.fromarray(patch, "RGBA"))
+                kind, base = "delta", keyframe[0]
+        if kind == "key":
+            # Encoded bytes are reused only when lossless; deltas are exact against the keyframe pixels
+            if data is None or not data.startswith(PNG_SIGNATURE):
+                data = _encode_png(Image.fromarray(array))
+            left, top = 0, 0
+
+        file = os.path.join(hash[:2], f"{hash}.{kind}.png")
+        path = os.path.join(self.directory, file)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (hash, kind, base, file, bytes, width, height, left, top, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (hash, kind, base, file, len(data), width, height, left, top, created),
+            )
+            self._bytes += len(data)
+        if kind == "key":
+            self._keyframe = (hash, array)
+            self._deltas_since_keyframe = 0
+        else:
+            self._deltas_since_keyframe += 1
+
+    def _collect(self):
+        # Unreferenced blobs; a keyframe becomes unreferenced only after its last delta is gone
+        while True:
+            rows = self._db.execute(
+                "SELECT hash, file, bytes FROM blobs WHERE hash NOT IN (SELECT hash FROM frames) "
+                "AND hash NOT IN (SELECT base FROM blobs WHERE base IS NOT NULL)"
+            ).fetchall()
+            if not rows:
+                break
+            for hash, file, size in rows:
+                try:
+                    os.remove(os.path.join(self.directory, file))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM blobs WHERE hash = ?", (hash,))
+                self._bytes -= size
+                if self._keyframe is not None and self._keyframe[0] == hash:
+                    self._keyframe = None
+
+
+def _encode_png(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=int(os.getenv("SCREENSHOT_PNG_COMPRESS_LEVEL", 6)))
+    return buffer.getvalue()
+
+
+_screenshot_store = None
+_screenshot_store_lock = threading.Lock()
+
+
+def get_screenshot_store() -> Optional[ScreenshotStore]:
+    """
+    Shared ScreenshotStore, created on first use. Returns None when SCREENSHOT_STORE_ENABLED is false.
+    """
+    global _screenshot_store
+    if os.getenv("SCREENSHOT_STORE_ENABLED", "true").lower() not in ("true", "1", "yes"):
+        return None
+    with _screenshot_store_lock:
+        if _screenshot_store is None:
+            _screenshot_store = ScreenshotStore()
+        return _screenshot_store
@@ -0,0 +1,360 @@
+"""
+Run many agents in parallel, each in its own worker process on its own Xvfb display.
+
+Usage:
+    python src/SessionHelper.py --tasks tasks.jsonl --workers 4 --output results.jsonl
+
+Each line of the tasks file is either a JSON object with a "goal" (and optionally
+"task_id", "max_steps", "timeout_seconds") or a plain-text goal.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import select
+import shutil
+import subprocess
+import sys
+import time
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Appended after the task plan, so the cached prompt prefix stays the same as in interactive runs
+UNATTENDED_SUFFIX = "\nThis session runs unattended. When the goal is complete, reply with exactly DONE instead of a command.\n"
+
+
+class SessionTask(BaseModel):
+    task_id: str
+    goal: str
+    max_steps: Optional[int] = None
+    timeout_seconds: Optional[float] = None
+
+
+class SessionResult(BaseModel):
+    task_id: str
+    session: int
+    goal: str
+    success: bool = False
+    steps: int = 0
+    actions: List[str] = []
+    error: Optional[str] = None
+    started: float = 0.0
+    finished: float = 0.0
+    session_dir: str = ""
+
+
+class XvfbDisplay:
+    """
+    XvfbDisplay:
+    ------------
+
+    A private Xvfb server on display :number, started and stopped as a context manager.
+
+    Methods:
+    - start()
+    - stop()
+    """
+
+    def __init__(self, number: int, width: int = 1920, height: int = 1080, depth: int = 24):
+        self.number = number
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.process = None
+
+    @property
+    def name(self) -> str:
+        return f":{self.number}"
+
+    def start(self, timeout: float = 10.0):
+        """
+        Start Xvfb and wait until it accepts connections. Readiness comes from Xvfb itself
+        (-displayfd), so a server another process already runs on the display, or a stale
+        socket, is not mistaken for ours.
+        """
+        if shutil.which("Xvfb") is None:
+            raise RuntimeError("Xvfb is not installed")
+        ready_read, ready_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                ["Xvfb", self.name, "-screen", "0", f"{self.width}x{self.height}x{self.depth}", "-nolisten", "tcp", "-ac",
+                 "-displayfd", str(ready_write)],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(ready_write,),
+            )
+            os.close(ready_write)
+            ready_write = None
+            # Xvfb writes the display number once it is ready; EOF means it exited (e.g. the display is taken)
+            readable, _, _ = select.select([ready_read], [], [], timeout)
+            announced = os.read(ready_read, 32).decode().strip() if readable else ""
+        finally:
+            os.close(ready_read)
+            if ready_write is not None:
+                os.close(ready_write)
+        if announced != str(self.number) or self.process.poll() is not None:
+            self.stop()
+            raise RuntimeError(f"Xvfb failed to start on {self.name}")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def run_task(task: SessionTask, session: int, gui_helper, max_steps: int, timeout_seconds: float) -> SessionResult:
+    """Plan and execute one goal without a human in the loop, until the model replies DONE or a limit is hit."""
+    from LLMHelper import generate_task_plan, get_next_action_with_image, stream_next_action_with_image
+    from AutoHelper import execute_command, execute_streamed_command
+    from FrameDiffHelper import FrameChangeDetector
+    from app import build_state_description, observe, select_crops, unchanged_note, zoomed_state
+    from ContextHelper import create_agent_context
+    from TrajectoryHelper import ReplayEngine, TrajectoryRecorder
+
+    result = SessionResult(task_id=task.task_id, session=session, goal=task.goal, started=time.time(), session_dir=os.getcwd())
+    max_steps = task.max_steps or max_steps
+    deadline = time.monotonic() + (task.timeout_seconds or timeout_seconds)
+    try:
+        # Replay a stored run first; the model then only has to confirm or continue from where it diverged
+        recorder = TrajectoryRecorder()
+        replay = ReplayEngine(recorder.store).replay(task.goal, gui_helper.screenshot, lambda command: execute_command(command, gui_helper))
+        recorder.start(task.goal, replayed_steps=replay.replayed_steps)
+        result.steps = replay.replayed_steps
+        result.actions = [step.command for step in recorder.trajectory.steps]
+        state_description = build_state_description(generate_task_plan(task.goal)) + UNATTENDED_SUFFIX
+        change_detector = FrameChangeDetector()
+        max_crop_fraction = float(os.getenv("DIRTY_CROP_MAX_FRACTION", 0.25))
+        stream = os.getenv("STREAM_ACTIONS", "false").lower() in ("true", "1", "yes")
+        context = create_agent_context()
+        while result.steps < max_steps:
+            if time.monotonic() > deadline:
+                result.error = "timed out"
+                break
+            current_state, frame_diff = observe(gui_helper, change_detector, f"{task.task_id}-session-{session}")
+            description = state_description
+            if not frame_diff.changed and result.actions:
+                description += unchanged_note(result.actions[-1])
+                crops = None
+            else:
+                crops = select_crops(current_state, frame_diff, max_crop_fraction, context)
+            image = current_state if crops else zoomed_state(current_state, description)
+            if stream:
+                # Statements run as they arrive; a bare DONE is rejected by the parser before anything runs
+                screen = gui_helper.screenshot()
+                action, executed = execute_streamed_command(
+                    stream_next_action_with_image(description, image, crops=crops, context=context), gui_helper)
+            else:
+                action = get_next_action_with_image(description, image, crops=crops, context=context)
+            if action.strip().upper() == "DONE":
+                result.success = True
+                recorder.finish(success=True)
+                break
+            result.steps += 1
+            result.actions.append(action)
+            if not stream:
+                screen = gui_helper.screenshot()
+                executed = execute_command(action, gui_helper)
+            if context:
+                context.record(action, "succeeded" if executed else "failed", screen)
+            if not executed:
+                result.error = f"step {result.steps} failed"
+                break
+            recorder.record(screen, action)
+        else:
+            result.error = f"no DONE after {max_steps} steps"
+    except Exception as e:
+        result.error = f"{type(e).__name__}: {e}"
+    result.finished = time.time()
+    return result
+
+
+def session_worker(session: int, display: int, task_queue, result_queue, options: dict):
+    """
+    Worker process body: start Xvfb, point DISPLAY at it, then import the GUI modules
+    (pyautogui binds the display at import time) and run tasks until a None sentinel.
+    """
+    session_dir = os.path.abspath(os.path.join(options["output_dir"], f"session-{session}"))
+    os.makedirs(session_dir, exist_ok=True)
+    with XvfbDisplay(display, options["width"], options["height"]):
+        os.environ["DISPLAY"] = f":{display}"
+        # The screenshot store and ./screenshots land in the session's own directory
+        os.chdir(session_dir)
+        from pyautoguihelper import PyAutoGuiHelper
+        gui_helper = PyAutoGuiHelper()
+        print(f"Session {session} ready on :{display} ({session_dir})")
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            # Lets the manager fail this task if the process dies before reporting a result
+            result_queue.put({"started": task, "session": session})
+            result = run_task(SessionTask(**task), session, gui_helper, options["max_steps"], options["timeout_seconds"])
+            result_queue.put(result.model_dump())
+
+
+class SessionManager:
+    """
+    SessionManager:
+    ---------------
+
+    A pool of worker processes, each driving its own Xvfb display with its own
+    PyAutoGuiHelper and output directory. Tasks are taken from a shared queue; a session
+    runs one task at a time (it owns a single screen and mouse), bounded by `max_steps`
+    and `timeout_seconds`. Results are collected centrally and, with `results_path`,
+    appended to a JSONL file as they arrive. Workers report each task they start, so a
+    task whose worker process dies (crash, OOM kill, lost display) is recorded as failed
+    instead of being waited for.
+
+    Configured with SESSION_WORKERS, SESSION_DISPLAY_BASE, SESSION_SCREEN_SIZE,
+    SESSION_MAX_STEPS, SESSION_TIMEOUT_SECONDS and SESSION_OUTPUT_DIR.
+
+    Methods:
+    - start()
+    - submit(goal, task_id=None, max_steps=None, timeout_seconds=None) -> str
+    - results(timeout=None) -> List[SessionResult]
+    - shutdown()
+    """
+
+    def __init__(self, workers: int = None, display_base: int = None, screen_size: str = None, max_steps: int = None,
+                 timeout_seconds: float = None, output_dir: str = None, results_path: str = None):
+        self.workers = int(os.getenv("SESSION_WORKERS", os.cpu_count() or 1)) if workers is None else workers
+        self.display_base = int(os.getenv("SESSION_DISPLAY_BASE", 100)) if display_base is None else display_base
+        width, height = (screen_size or os.getenv("SESSION_SCREEN_SIZE", "1920x1080")).lower().split("x")
+        self.options = {
+            "width": int(width),
+            "height": int(height),
+            "max_steps": int(os.getenv("SESSION_MAX_STEPS", 20)) if max_steps is None else max_steps,
+            "timeout_seconds": float(os.getenv("SESSION_TIMEOUT_SECONDS", 600)) if timeout_seconds is None else timeout_seconds,
+            "output_dir": os.path.abspath(os.getenv("SESSION_OUTPUT_DIR", "sessions") if output_dir is None else output_dir),
+        }
+        self.results_path = results_path
+        # Spawned workers start with no pyautogui/X11 state inherited from this process
+        self._context = multiprocessing.get_context("spawn")
+        self._tasks = self._context.Queue()
+        self._results = self._context.Queue()
+        self._processes = []
+        self._submitted = 0
+        self._collected = []
+        # session -> (task, started) of the task each worker is running
+        self._running = {}
+
+    def start(self):
+        # Shared caches keep working after workers chdir into their session directories
+        for name, default in (("LLM_CACHE_PATH", ".cache/llm_responses.sqlite3"), ("PLAN_CACHE_PATH", ".cache/plans.sqlite3"),
+                              ("UI_LAYOUT_PATH", "playground/pizza_page_ui_layout.json")):
+            os.environ[name] = os.path.abspath(os.getenv(name, default))
+        for session in range(self.workers):
+            process = self._context.Process(
+                target=session_worker,
+                args=(session, self.display_base + session, self._tasks, self._results, self.options),
+                daemon=True,
+            )
+            process.start()
+            self._processes.append(process)
+
+    def submit(self, goal: str, task_id: str = None, max_steps: int = None, timeout_seconds: float = None) -> str:
+        task_id = task_id or f"task-{self._submitted}"
+        self._tasks.put(SessionTask(task_id=task_id, goal=goal, max_steps=max_steps, timeout_seconds=timeout_seconds).model_dump())
+        self._submitted += 1
+        return task_id
+
+    def results(self, timeout: float = None) -> List[SessionResult]:
+        """Wait for every submitted task (or until `timeout`) and return all results collected so far."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while len(self._collected) < self._submitted:
+            remaining = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+            if remaining <= 0:
+                break
+            try:
+                message = self._results.get(timeout=remaining)
+            except queue.Empty:
+                # Only once the queue is drained, so a result sent just before exiting is not lost
+                self._fail_dead_sessions()
+                if len(self._collected) < self._submitted and not any(process.is_alive() for process in self._processes):
+                    print("All sessions exited before every task finished.")
+                    break
+                continue
+            if "started" in message:
+                self._running[message["session"]] = (message["started"], time.time())
+                continue
+            self._running.pop(message["session"], None)
+            self._collect(SessionResult(**message))
+        return list(self._collected)
+
+    def _fail_dead_sessions(self):
+        for session, process in enumerate(self._processes):
+            if process.exitcode is None or session not in self._running:
+                continue
+            task, started = self._running.pop(session)
+            self._collect(SessionResult(
+                task_id=task["task_id"], session=session, goal=task["goal"], started=started, finished=time.time(),
+                error=f"session process exited with code {process.exitcode}",
+                session_dir=os.path.join(self.options["output_dir"], f"session-{session}"),
+            ))
+
+    def _collect(self, result: SessionResult):
+        self._collected.append(result)
+        status = "done" if result.success else f"failed ({result.error})"
+        print(f"[session {result.session}] {result.task_id} {status} after {result.steps} step(s)")
+        if self.results_path:
+            with open(self.results_path, "a") as f:
+                f.write(result.model_dump_json() + "\n")
+
+    def shutdown(self):
+        for _ in self._processes:
+            self._tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+
+
+def load_tasks(path: str) -> List[dict]:
+    tasks = []
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            tasks.append(json.loads(line) if line.startswith("{") else {"goal": line})
+    return tasks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", required=True, help="JSONL or plain-text file with one goal per line")
+    parser.add_argument("--workers", type=int, default=None, help="parallel sessions (SESSION_WORKERS, default: CPU count)")
+    parser.add_argument("--output", default=None, help="append results to this JSONL file")
+    args = parser.parse_args()
+
+    from dotenv import load_dotenv
+    load_dotenv()
+    manager = SessionManager(workers=args.workers, results_path=args.output)
+    manager.start()
+    tasks = load_tasks(args.tasks)
+    try:
+        for task in tasks:
+            manager.submit(task["goal"], task.get("task_id"), task.get("max_steps"), task.get("timeout_seconds"))
+        results = manager.results()
+    finally:
+        manager.shutdown()
+    succeeded = sum(result.success for result in results)
+    print(f"{succeeded}/{len(tasks)} tasks succeeded")
+    sys.exit(0 if succeeded == len(tasks) else 1)
+
+
+if __name__ == "__main__":
+    main()
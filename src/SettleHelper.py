@@ -0,0 +1,153 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Tuple
+import pyautogui
+from CaptureHelper import capture_service
+
+Region = Tuple[int, int, int, int]
+
+
+class SettleDetector:
+    """
+    SettleDetector:
+    ---------------
+
+    Replaces fixed pauses after input actions: after each action the affected region is
+    sampled every `interval` seconds, first until it changes from the first sample, then
+    until `stable_frames` consecutive samples are identical. A region that does not
+    change within `change_wait` seconds counts as settled, since the action had no
+    visible effect yet; a wait never exceeds `max_wait` seconds. Every wait is recorded
+    so the time spent per action can be inspected with summary().
+
+    Configured with SETTLE_ENABLED, SETTLE_INTERVAL_SECONDS, SETTLE_STABLE_FRAMES,
+    SETTLE_CHANGE_SECONDS, SETTLE_MAX_SECONDS and SETTLE_REGION_SIZE.
+
+    Methods:
+    - wait(region=None, max_wait=None, label='', change_wait=None) -> float
+    - region_around(x, y) -> Region
+    - suspended()
+    - active() -> bool
+    - sleep(seconds) -> float
+    - summary() -> Dict[str, dict]
+    """
+
+    def __init__(self, capture: Callable = None, interval: float = None, stable_frames: int = None,
+                 max_wait: float = None, region_size: int = None, change_wait: float = None, history: int = 1000):
+        # Native region grabs through the capture backend; anything with tobytes() works as a sample
+        self.capture = capture or (lambda region=None: capture_service.grab_region(region) if region else capture_service.grab().array)
+        self.enabled = os.getenv("SETTLE_ENABLED", "true").lower() in ("true", "1", "yes")
+        self.interval = float(os.getenv("SETTLE_INTERVAL_SECONDS", 0.05)) if interval is None else interval
+        self.stable_frames = int(os.getenv("SETTLE_STABLE_FRAMES", 3)) if stable_frames is None else stable_frames
+        self.max_wait = float(os.getenv("SETTLE_MAX_SECONDS", 2.0)) if max_wait is None else max_wait
+        self.change_wait = float(os.getenv("SETTLE_CHANGE_SECONDS", 0.5)) if change_wait is None else change_wait
+        self.region_size = int(os.getenv("SETTLE_REGION_SIZE", 400)) if region_size is None else region_size
+        self.timings = deque(maxlen=history)
+        self._local = threading.local()
+
+    def region_around(self, x: int, y: int) -> Region:
+        """A square of SETTLE_REGION_SIZE pixels centred on (x, y), clamped to the screen."""
+        width, height = pyautogui.size()
+        size = self.region_size
+        left = min(max(int(x) - size // 2, 0), max(width - size, 0))
+        top = min(max(int(y) - size // 2, 0), max(height - size, 0))
+        return (left, top, min(size, width), min(size, height))
+
+    @contextmanager
+    def suspended(self):
+        """Skip waits in this thread, e.g. between events of a batch that settles once at the end."""
+        self._local.suspended = getattr(self._local, "suspended", 0) + 1
+        try:
+            yield
+        finally:
+            self._local.suspended -= 1
+
+    def active(self) -> bool:
+        """Whether wait() really waits in this thread (enabled and not suspended)."""
+        return self.enabled and not getattr(self._local, "suspended", 0)
+
+    def wait(self, region: Optional[Region] = None, max_wait: float = None, label: str = '', change_wait: float = None) -> float:
+        """
+        Block until the region (or the whole screen) has changed and stopped changing, or
+        did not change within `change_wait` seconds. Returns the seconds waited.
+        """
+        if not self.enabled or getattr(self._local, "suspended", 0):
+            return 0.0
+        max_wait = self.max_wait if max_wait is None else max_wait
+        change_wait = self.change_wait if change_wait is None else change_wait
+        start = time.monotonic()
+        first = previous = None
+        changed = False
+        stable = 0
+        settled = False
+        while True:
+            digest = hashlib.blake2b(self.capture(region=region).tobytes(), digest_size=16).digest()
+            if first is None:
+                first = digest
+            changed = changed or digest != first
+            stable = stable + 1 if digest == previous else 1
+            previous = digest
+            elapsed = time.monotonic() - start
+            # Until the action shows an effect, identical samples only mean it has not started yet
+            if (changed and stable >= self.stable_frames) or (not changed and elapsed >= change_wait):
+                settled = True
+                break
+            if elapsed + self.interval > max_wait:
+                break
+            time.sleep(self.interval)
+        elapsed = time.monotonic() - start
+        self.timings.append({"label": label, "seconds": elapsed, "settled": settled, "changed": changed, "region": region})
+        return elapsed
+
+    def sleep(self, seconds: float) -> float:
+        """Stand-in for time.sleep in generated code: sleeps the full duration and records it."""
+        start = time.monotonic()
+        time.sleep(seconds)
+        elapsed = time.monotonic() - start
+        if self.enabled:
+            self.timings.append({"label": "sleep", "seconds": elapsed, "settled": True, "changed": None, "region": None})
+        return elapsed
+
+    def summary(self) -> Dict[str, dict]:
+        """Per-label count, mean and max settle time, and how often the cap was hit."""
+        stats = {}
+        for timing in self.timings:
+            entry = stats.setdefault(timing["label"], {"count": 0, "total": 0.0, "max": 0.0, "timeouts": 0})
+            entry["count"] += 1
+            entry["total"] += timing["seconds"]
+            entry["max"] = max(entry["max"], timing["seconds"])
+            entry["timeouts"] += 0 if timing["settled"] else 1
+        for entry in stats.values():
+            entry["mean"] = entry.pop("total") / entry["count"]
+        return stats
+
+
+settle_detector = SettleDetector()
+
+
+def with_settle(function: Callable, label: str, point_args: bool = False, detector: SettleDetector = None) -> Callable:
+    """
+    Wrap a pyautogui-style function so it drops shared frames from before it ran and waits
+    for the screen to settle afterwards, watching the area around the x, y it was given
+    (or the whole screen without one).
+    With point_args, the first two positional arguments are taken as x and y.
+    """
+    detector = detector or settle_detector
+
+    def wrapper(*args, **kwargs):
+        result = function(*args, **kwargs)
+        capture_service.invalidate()
+        x, y = kwargs.get("x"), kwargs.get("y")
+        if point_args and len(args) >= 2:
+            x, y = args[0], args[1]
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+            region = detector.region_around(x, y)
+        else:
+            region = None
+        detector.wait(region, label=label)
+        return result
+
+    return wrapper
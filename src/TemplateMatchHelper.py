@@ -0,0 +1,253 @@
+import glob
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image
+
+Box = Tuple[int, int, int, int]
+Match = Tuple[int, int, int, int, float]
+
+
+def to_gray(image) -> np.ndarray:
+    """Convert a PIL Image or an RGB(A)/gray array to a float32 grayscale array."""
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert("L"), dtype=np.float32)
+    image = np.asarray(image)
+    if image.ndim == 2:
+        return image.astype(np.float32)
+    rgb = image[..., :3].astype(np.float32)
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def downsample(gray: np.ndarray) -> np.ndarray:
+    """Halve an image by averaging 2x2 blocks (odd trailing rows/columns are dropped)."""
+    h, w = gray.shape[0] // 2 * 2, gray.shape[1] // 2 * 2
+    g = gray[:h, :w]
+    return (g[0::2, 0::2] + g[1::2, 0::2] + g[0::2, 1::2] + g[1::2, 1::2]) * 0.25
+
+
+def non_max_suppression(matches: List[Match], overlap: float = 0.3) -> List[Match]:
+    """Greedy NMS: keep the best-scoring boxes and drop any box overlapping a kept one by more than `overlap` IoU."""
+    if not matches:
+        return []
+    arr = np.array(matches, dtype=np.float64)
+    order = np.argsort(-arr[:, 4])
+    x1, y1 = arr[:, 0], arr[:, 1]
+    x2, y2 = x1 + arr[:, 2], y1 + arr[:, 3]
+    areas = arr[:, 2] * arr[:, 3]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / (areas[i] + areas[rest] - inter)
+        order = rest[iou <= overlap]
+    return [matches[i] for i in keep]
+
+
+class _Template:
+    def __init__(self, gray: np.ndarray, levels: int):
+        self.height, self.width = gray.shape
+        self.pyramid = [gray]
+        for _ in range(levels):
+            self.pyramid.append(downsample(self.pyramid[-1]))
+        # Zero-mean, flipped kernels and their norms, per pyramid level
+        self.kernels = []
+        for level in self.pyramid:
+            zero_mean = level - level.mean()
+            self.kernels.append((zero_mean[::-1, ::-1].copy(), float(np.sqrt((zero_mean ** 2).sum()))))
+
+
+class _SearchImage:
+    """A grayscale search image with its FFT and integral images, computed once and shared by all templates."""
+
+    def __init__(self, gray: np.ndarray):
+        self.gray = gray
+        self.shape = gray.shape
+        self._fft = None
+        padded = np.zeros((gray.shape[0] + 1, gray.shape[1] + 1), dtype=np.float64)
+        padded[1:, 1:] = gray
+        self.sum = padded.cumsum(0).cumsum(1)
+        padded[1:, 1:] = gray.astype(np.float64) ** 2
+        self.sum_sq = padded.cumsum(0).cumsum(1)
+
+    @property
+    def fft(self):
+        if self._fft is None:
+            self._fft = np.fft.rfft2(self.gray)
+        return self._fft
+
+    def window_sums(self, h: int, w: int, table: np.ndarray) -> np.ndarray:
+        return table[h:, w:] - table[:-h, w:] - table[h:, :-w] + table[:-h, :-w]
+
+    def ncc(self, kernel: np.ndarray, kernel_norm: float) -> Optional[np.ndarray]:
+        """Normalized cross-correlation for every valid placement of the template."""
+        h, w = kernel.shape
+        H, W = self.shape
+        if h > H or w > W or kernel_norm == 0:
+            return None
+        # Circular convolution at the image size is exact for valid placements
+        correlation = np.fft.irfft2(self.fft * np.fft.rfft2(kernel, s=self.shape), s=self.shape)
+        numerator = correlation[h - 1:, w - 1:]
+        n = h * w
+        sums = self.window_sums(h, w, self.sum)
+        variance = self.window_sums(h, w, self.sum_sq) - sums * sums / n
+        denominator = np.sqrt(np.clip(variance, 0, None)) * kernel_norm
+        scores = np.zeros_like(numerator)
+        np.divide(numerator, denominator, out=scores, where=denominator > 1e-6 * kernel_norm)
+        return scores
+
+
+class TemplateMatcher:
+    """
+    TemplateMatcher:
+    ----------------
+
+    Finds many templates in a single capture using FFT-based normalized cross-correlation.
+
+    Templates are loaded once and cached together with their image pyramids. Each
+    template is first searched at the coarsest pyramid level where it is still at least
+    `min_template_size` pixels, then candidates are refined at full resolution and
+    overlapping hits are removed with non-max suppression.
+
+    Methods:
+    - load(image) -> _Template
+    - preload(directory) -> List[str]
+    - match(screen, templates, confidence=0.8, region=None, limit=None) -> Dict[key, List[Match]]
+    - best(screen, template, confidence=0.8, region=None, near=None) -> Optional[Match]
+    """
+
+    def __init__(self, max_levels: int = None, min_template_size: int = 12, coarse_slack: float = 0.35,
+                 max_coarse_candidates: int = 32):
+        self.max_levels = int(os.getenv("TEMPLATE_MATCH_PYRAMID_LEVELS", 2)) if max_levels is None else max_levels
+        self.min_template_size = min_template_size
+        self.coarse_slack = coarse_slack
+        self.max_coarse_candidates = max_coarse_candidates
+        self._templates: Dict[str, _Template] = {}
+        self._lock = threading.Lock()
+
+    def load(self, image: Union[str, Image.Image]) -> _Template:
+        key = image if isinstance(image, str) else id(image)
+        with self._lock:
+            template = self._templates.get(key)
+        if template is not None:
+            return template
+        gray = to_gray(Image.open(image) if isinstance(image, str) else image)
+        template = _Template(gray, self.max_levels)
+        if isinstance(image, str):
+            with self._lock:
+                self._templates[key] = template
+        return template
+
+    def preload(self, directory: str) -> List[str]:
+        paths = sorted(glob.glob(os.path.join(directory, "*.png")))
+        for path in paths:
+            self.load(path)
+        return paths
+
+    def match(self, screen, templates: Sequence[Union[str, Image.Image]], confidence: float = 0.8,
+              region: Optional[Box] = None, limit: Optional[int] = None) -> Dict[Union[str, int], List[Match]]:
+        """
+        Search every template in one screen image.
+
+        Returns a dict from template (path, or id() for PIL images) to a list of
+        (left, top, width, height, score) in screen coordinates, best first.
+        """
+        gray = screen if isinstance(screen, np.ndarray) and screen.ndim == 2 and screen.dtype == np.float32 else to_gray(screen)
+        offset_x, offset_y = 0, 0
+        if region is not None:
+            left, top, width, height = region
+            left, top = max(int(left), 0), max(int(top), 0)
+            gray = gray[top:top + int(height), left:left + int(width)]
+            offset_x, offset_y = left, top
+
+        levels = [_SearchImage(gray)]
+        results = {}
+        for image in templates:
+            key = image if isinstance(image, str) else id(image)
+            template = self.load(image)
+            level = self._search_level(template)
+            while len(levels) <= level:
+                levels.append(_SearchImage(downsample(levels[-1].gray)))
+
+            matches = self._match_level(levels, template, level, confidence)
+            matches = non_max_suppression(matches)
+            if limit is not None:
+                matches = matches[:limit]
+            results[key] = [(x + offset_x, y + offset_y, w, h, s) for x, y, w, h, s in matches]
+        return results
+
+    def best(self, screen, template: Union[str, Image.Image], confidence: float = 0.8,
+             region: Optional[Box] = None, near: Optional[Tuple[int, int]] = None) -> Optional[Match]:
+        """
+        Best match of one template: the highest score, or the one whose top-left corner
+        is closest to `near` when a hint point is given.
+        """
+        key = template if isinstance(template, str) else id(template)
+        matches = self.match(screen, [template], confidence, region)[key]
+        if not matches:
+            return None
+        if near is not None:
+            return min(matches, key=lambda m: (m[0] - near[0]) ** 2 + (m[1] - near[1]) ** 2)
+        return matches[0]
+
+    def _search_level(self, template: _Template) -> int:
+        level = 0
+        size = min(template.height, template.width)
+        while level < self.max_levels and size // 2 >= self.min_template_size:
+            size //= 2
+            level += 1
+        return level
+
+    def _match_level(self, levels: List[_SearchImage], template: _Template, level: int, confidence: float) -> List[Match]:
+        kernel, norm = template.kernels[level]
+        scores = levels[level].ncc(kernel, norm)
+        if scores is None:
+            return []
+
+        if level == 0:
+            candidates = self._peaks(scores, confidence, kernel.shape)
+            return [(x, y, template.width, template.height, s) for x, y, s in candidates]
+
+        # Downsampling blurs away sub-block alignment, so coarse scores run low: keep a
+        # generous threshold but only the best few candidates
+        candidates = self._peaks(scores, confidence - self.coarse_slack, kernel.shape, self.max_coarse_candidates)
+
+        # Refine each coarse candidate in a small full-resolution window
+        full = levels[0]
+        scale = 2 ** level
+        pad = 2 * scale
+        kernel0, norm0 = template.kernels[0]
+        refined = []
+        for x, y, _ in candidates:
+            left, top = max(x * scale - pad, 0), max(y * scale - pad, 0)
+            right = min(x * scale + template.width + pad, full.shape[1])
+            bottom = min(y * scale + template.height + pad, full.shape[0])
+            window = _SearchImage(full.gray[top:bottom, left:right])
+            window_scores = window.ncc(kernel0, norm0)
+            if window_scores is None:
+                continue
+            wy, wx = np.unravel_index(int(np.argmax(window_scores)), window_scores.shape)
+            score = float(window_scores[wy, wx])
+            if score >= confidence:
+                refined.append((left + int(wx), top + int(wy), template.width, template.height, score))
+        return refined
+
+    def _peaks(self, scores: np.ndarray, threshold: float, shape: Tuple[int, int], max_candidates: int = 256):
+        ys, xs = np.nonzero(scores >= threshold)
+        if ys.size == 0:
+            return []
+        values = scores[ys, xs]
+        if values.size > max_candidates * 8:
+            top = np.argpartition(-values, max_candidates * 8)[:max_candidates * 8]
+            ys, xs, values = ys[top], xs[top], values[top]
+        h, w = shape
+        boxes = [(int(x), int(y), w, h, float(s)) for x, y, s in zip(xs, ys, values)]
+        return [(x, y, s) for x, y, _, _, s in non_max_suppression(boxes)[:max_candidates]]
+
+
+template_matcher = TemplateMatcher()
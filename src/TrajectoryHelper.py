@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from typing import Callable, List, Optional, Tuple
+from PIL import Image
+from pydantic import BaseModel
+from ActionHelper import ActionParseError, parse_actions
+from CacheHelper import perceptual_hash
+from TemplateMatchHelper import template_matcher
+
+Box = Tuple[int, int, int, int]
+
+
+def normalize_instruction(instruction: str) -> str:
+    """Lower-case, punctuation-free, single-spaced form of an instruction, used as the trajectory key."""
+    return " ".join(re.findall(r"[a-z0-9]+", instruction.lower()))
+
+
+def hamming_distance(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def action_point(command: str) -> Optional[Tuple[int, int]]:
+    """The first x, y a command acts on (positional or keyword), or None for keyboard-only commands."""
+    try:
+        actions = parse_actions(command, _AnyName())
+    except ActionParseError:
+        return None
+    for action in actions:
+        x, y = action.kwargs.get("x"), action.kwargs.get("y")
+        if len(action.args) >= 2:
+            x, y = action.args[0], action.args[1]
+        if isinstance(x, (int, float)) and isinstance(y, (int, float)):
+            return (int(x), int(y))
+    return None
+
+
+class _AnyName:
+    # parse_actions only needs `name in allowed_names`; recorded commands were already validated when they ran
+    def __contains__(self, name):
+        return True
+
+
+class TrajectoryStep(BaseModel):
+    command: str
+    fingerprint: str
+    point: Optional[Tuple[int, int]] = None
+    crop_box: Optional[Box] = None
+    crop_file: Optional[str] = None
+
+
+class Trajectory(BaseModel):
+    instruction: str
+    key: str
+    created: float
+    steps: List[TrajectoryStep] = []
+
+
+class ReplayResult(BaseModel):
+    replayed_steps: int = 0
+    total_steps: int = 0
+    diverged_at: Optional[int] = None
+    completed: bool = False
+
+
+class TrajectoryStore:
+    """
+    TrajectoryStore:
+    ----------------
+
+    Successful runs on disk under TRAJECTORY_DIR, one directory per normalized
+    instruction holding trajectory.json and the checkpoint crops.
+
+    Methods:
+    - path_for(instruction) -> str
+    - find(instruction) -> Optional[Trajectory]
+    - save(trajectory, crops)
+    - crop_path(trajectory, step) -> Optional[str]
+    """
+
+    def __init__(self, directory: str = None):
+        self.directory = os.getenv("TRAJECTORY_DIR", ".cache/trajectories") if directory is None else directory
+
+    def path_for(self, instruction: str) -> str:
+        key = hashlib.sha256(normalize_instruction(instruction).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, key)
+
+    def find(self, instruction: str) -> Optional[Trajectory]:
+        path = os.path.join(self.path_for(instruction), "trajectory.json")
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as f:
+                return Trajectory(**json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable trajectory {path}: {e}")
+            return None
+
+    def save(self, trajectory: Trajectory, crops: List[Optional[Image.Image]]):
+        """Write a trajectory and its crops, replacing any earlier recording of the same instruction."""
+        path = self.path_for(trajectory.instruction)
+        staging = f"{path}.tmp"
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for index, (step, crop) in enumerate(zip(trajectory.steps, crops)):
+            if crop is not None:
+                step.crop_file = f"step-{index:03d}.png"
+                crop.save(os.path.join(staging, step.crop_file))
+        with open(os.path.join(staging, "trajectory.json"), "w") as f:
+            f.write(trajectory.model_dump_json(indent=2))
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(staging, path)
+
+    def crop_path(self, trajectory: Trajectory, step: TrajectoryStep) -> Optional[str]:
+        if step.crop_file is None:
+            return None
+        return os.path.join(self.path_for(trajectory.instruction), step.crop_file)
+
+
+class TrajectoryRecorder:
+    """
+    TrajectoryRecorder:
+    -------------------
+
+    Records the commands of a run together with the screen they were executed on: a
+    perceptual hash of the whole screen and a template crop around the point the command
+    acts on. Nothing is stored unless finish(success=True) is called.
+
+    Methods:
+    - start(instruction, replayed_steps=0)
+    - record(screen, command)
+    - discard()
+    - finish(success) -> Optional[Trajectory]
+    """
+
+    def __init__(self, store: TrajectoryStore = None, crop_size: int = None):
+        self.store = store or TrajectoryStore()
+        self.crop_size = int(os.getenv("TRAJECTORY_CROP_SIZE", 96)) if crop_size is None else crop_size
+        self.trajectory = None
+        self._crops = []
+
+    def start(self, instruction: str, replayed_steps: int = 0):
+        """Start recording; the first `replayed_steps` steps of the stored trajectory are carried over."""
+        self.trajectory = Trajectory(instruction=instruction, key=normalize_instruction(instruction), created=time.time())
+        self._crops = []
+        stored = self.store.find(instruction) if replayed_steps else None
+        for step in (stored.steps[:replayed_steps] if stored else []):
+            crop_path = self.store.crop_path(stored, step)
+            self.trajectory.steps.append(step.model_copy(update={"crop_file": None}))
+            self._crops.append(Image.open(crop_path).copy() if crop_path and os.path.exists(crop_path) else None)
+
+    def record(self, screen: Image.Image, command: str):
+        """Record `command` as executed on `screen` (the unannotated frame just before it ran)."""
+        if self.trajectory is None:
+            return
+        point = action_point(command)
+        crop_box, crop = None, None
+        if point is not None:
+            size = self.crop_size
+            left = min(max(point[0] - size // 2, 0), max(screen.width - size, 0))
+            top = min(max(point[1] - size // 2, 0), max(screen.height - size, 0))
+            crop_box = (left, top, min(size, screen.width), min(size, screen.height))
+            crop = screen.crop((left, top, left + crop_box[2], top + crop_box[3]))
+        self.trajectory.steps.append(TrajectoryStep(
+            command=command, fingerprint=perceptual_hash(screen), point=point, crop_box=crop_box,
+        ))
+        self._crops.append(crop)
+
+    def discard(self):
+        """Stop recording this run, e.g. after a manual intervention that cannot be replayed."""
+        self.trajectory = None
+        self._crops = []
+
+    def finish(self, success: bool) -> Optional[Trajectory]:
+        trajectory, crops = self.trajectory, self._crops
+        self.discard()
+        if not success or trajectory is None or not trajectory.steps:
+            return None
+        self.store.save(trajectory, crops)
+        print(f"Saved trajectory with {len(trajectory.steps)} step(s) for: {trajectory.instruction}")
+        return trajectory
+
+
+class ReplayEngine:
+    """
+    ReplayEngine:
+    -------------
+
+    Re-runs a stored trajectory without the model. Before each step the current screen is
+    checked against the step's checkpoint: its template crop must be found within
+    TRAJECTORY_SEARCH_MARGIN pixels of where it was recorded (or, for steps without a
+    crop, the screen hash must be within TRAJECTORY_MAX_HASH_DISTANCE bits). Replay stops
+    at the first checkpoint that diverges so the caller can hand over to the model.
+
+    Methods:
+    - check(trajectory, step, screen) -> bool
+    - replay(instruction, capture, execute) -> ReplayResult
+    """
+
+    def __init__(self, store: TrajectoryStore = None, matcher=None, confidence: float = None,
+                 search_margin: int = None, max_hash_distance: int = None):
+        self.store = store or TrajectoryStore()
+        self.matcher = matcher or template_matcher
+        self.confidence = float(os.getenv("TRAJECTORY_CONFIDENCE", 0.9)) if confidence is None else confidence
+        self.search_margin = int(os.getenv("TRAJECTORY_SEARCH_MARGIN", 64)) if search_margin is None else search_margin
+        self.max_hash_distance = int(os.getenv("TRAJECTORY_MAX_HASH_DISTANCE", 24)) if max_hash_distance is None else max_hash_distance
+
+    def check(self, trajectory: Trajectory, step: TrajectoryStep, screen: Image.Image) -> bool:
+        crop_path = self.store.crop_path(trajectory, step)
+        if crop_path is None or not os.path.exists(crop_path):
+            return hamming_distance(perceptual_hash(screen), step.fingerprint) <= self.max_hash_distance
+        left, top, width, height = step.crop_box
+        margin = self.search_margin
+        region = (left - margin, top - margin, width + 2 * margin, height + 2 * margin)
+        # Loaded by image rather than path: re-recording replaces crop files under the same names
+        with Image.open(crop_path) as crop:
+            crop.load()
+            return self.matcher.best(screen, crop, self.confidence, region=region, near=(left, top)) is not None
+
+    def replay(self, instruction: str, capture: Callable[[], Image.Image], execute: Callable[[str], bool]) -> ReplayResult:
+        """
+        Replay the trajectory stored for `instruction`. `capture` returns the current
+        screen and `execute` runs one command, returning False on failure.
+        """
+        trajectory = self.store.find(instruction)
+        if trajectory is None:
+            return ReplayResult()
+        result = ReplayResult(total_steps=len(trajectory.steps))
+        for index, step in enumerate(trajectory.steps):
+            if not self.check(trajectory, step, capture()):
+                print(f"Replay diverged at step {index + 1}/{len(trajectory.steps)}; handing over to the model.")
+                result.diverged_at = index
+                return result
+            print(f"Replaying step {index + 1}/{len(trajectory.steps)}: {step.command}")
+            if not execute(step.command):
+                result.diverged_at = index
+                return result
+            result.replayed_steps += 1
+        result.completed = True
+        return result
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+import numpy as np
+from FrameDiffHelper import FrameChangeDetector
+from TemplateMatchHelper import TemplateMatcher, template_matcher, to_gray
+
+Box = Tuple[int, int, int, int]
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+class Waiter:
+    """
+    A pending wait for one template, returned by ScreenWatcher.watch().
+
+    Methods:
+    - wait(timeout=None) -> Optional[Tuple[int, int, int, int]]
+    - cancel()
+    """
+
+    def __init__(self, image_path: str, timeout: float, confidence: float, region: Optional[Box]):
+        self.image_path = image_path
+        self.confidence = confidence
+        self.region = region
+        self.deadline = time.monotonic() + timeout
+        self.location: Optional[Box] = None
+        self.checked = False
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> Optional[Box]:
+        self._done.wait(timeout)
+        return self.location
+
+    def cancel(self):
+        self._done.set()
+
+    def _finish(self, location: Optional[Box]):
+        self.location = location
+        self._done.set()
+
+
+class ScreenWatcher:
+    """
+    ScreenWatcher:
+    --------------
+
+    Serves many concurrent waiters from a single capture loop. Each iteration grabs one
+    frame, hashes it with a FrameChangeDetector and runs the template search only for
+    waiters that are new or whose region overlaps something that changed. Polling runs
+    at `min_interval` while the screen is changing and backs off towards `max_interval`
+    while it is idle. The loop thread exits when no waiters are left.
+
+    Methods:
+    - watch(image_path, timeout=30, confidence=0.8, region=None) -> Waiter
+    - stop()
+    """
+
+    def __init__(self, capture: Callable, matcher: TemplateMatcher = None, min_interval: float = None,
+                 max_interval: float = None, backoff: float = 1.5):
+        self.capture = capture
+        self.matcher = matcher or template_matcher
+        self.min_interval = float(os.getenv("WATCHER_MIN_INTERVAL", 0.05)) if min_interval is None else min_interval
+        self.max_interval = float(os.getenv("WATCHER_MAX_INTERVAL", 1.0)) if max_interval is None else max_interval
+        self.backoff = backoff
+        self._waiters: List[Waiter] = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def watch(self, image_path: str, timeout: float = 30, confidence: float = 0.8, region: Optional[Box] = None) -> Waiter:
+        waiter = Waiter(image_path, timeout, confidence, region)
+        with self._condition:
+            self._stopped = False
+            self._waiters.append(waiter)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="screen-watcher", daemon=True)
+                self._thread.start()
+            # Wake the loop so a new waiter is checked against the next frame right away
+            self._condition.notify()
+        return waiter
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            for waiter in self._waiters:
+                waiter._finish(None)
+            self._waiters.clear()
+            self._condition.notify()
+
+    def _run(self):
+        detector = FrameChangeDetector()
+        interval = self.min_interval
+        while True:
+            with self._condition:
+                self._waiters = [w for w in self._waiters if not w.done]
+                if self._stopped or not self._waiters:
+                    self._thread = None
+                    return
+                waiters = list(self._waiters)
+
+            try:
+                frame = np.asarray(self.capture())
+                diff = detector.update(frame)
+                pending = [w for w in waiters if not w.checked or (diff.changed and self._is_dirty(w, diff.dirty_regions))]
+                if pending:
+                    self._check(to_gray(frame), pending)
+            except Exception as e:
+                print(f"Error in screen watcher: {e}")
+                diff = None
+
+            now = time.monotonic()
+            for waiter in waiters:
+                if not waiter.done and now >= waiter.deadline:
+                    waiter._finish(None)
+
+            interval = self.min_interval if diff is not None and diff.changed else min(interval * self.backoff, self.max_interval)
+            with self._condition:
+                if any(not w.done for w in self._waiters):
+                    next_deadline = min(w.deadline for w in self._waiters if not w.done)
+                    self._condition.wait(max(0.0, min(interval, next_deadline - time.monotonic())))
+
+    @staticmethod
+    def _is_dirty(waiter: Waiter, dirty_regions: List[Box]) -> bool:
+        return waiter.region is None or any(_overlaps(waiter.region, region) for region in dirty_regions)
+
+    def _check(self, gray: np.ndarray, waiters: List[Waiter]):
+        # One search per (region, confidence) group, covering all of its templates
+        groups = {}
+        for waiter in waiters:
+            groups.setdefault((waiter.region, waiter.confidence), []).append(waiter)
+        for (region, confidence), group in groups.items():
+            paths = list(dict.fromkeys(w.image_path for w in group))
+            matches = self.matcher.match(gray, paths, confidence, region=region, limit=1)
+            for waiter in group:
+                waiter.checked = True
+                found = matches.get(waiter.image_path)
+                if found:
+                    waiter._finish(found[0][:4])
@@ -0,0 +1,148 @@
+import os
+import re
+import threading
+from typing import Optional, Tuple
+import pyautogui
+from PIL import Image
+from pydantic import BaseModel
+from OverlayHelper import grid_overlay_cache
+
+Point = Tuple[float, float]
+
+# Stage one of coarse-to-fine vision: the model names a point, the detail crop is taken around it
+REGION_PROMPT = """You are looking at a downscaled overview of the whole screen. The red labels give screen coordinates.
+Reply with only the x, y screen coordinates of the centre of the area needed for the next step, e.g. 640, 360.
+"""
+
+
+class ViewTransform(BaseModel):
+    """
+    Maps pixels of an image sent to the model to pyautogui screen coordinates: a view
+    pixel p is screenshot pixel origin + p / scale, which is screen point
+    screenshot pixel * screen_scale (logical points per screenshot pixel, 0.5 on a
+    HiDPI display captured at 2x).
+    """
+    origin_x: float = 0.0
+    origin_y: float = 0.0
+    scale: float = 1.0
+    screen_scale_x: float = 1.0
+    screen_scale_y: float = 1.0
+
+    def map(self, x: float, y: float) -> Point:
+        """Exact screen coordinates of view pixel (x, y)."""
+        return ((self.origin_x + x / self.scale) * self.screen_scale_x, (self.origin_y + y / self.scale) * self.screen_scale_y)
+
+    def to_screen(self, x: float, y: float) -> Tuple[int, int]:
+        sx, sy = self.map(x, y)
+        return round(sx), round(sy)
+
+    def to_view(self, x: float, y: float) -> Point:
+        """Inverse of map: the view pixel that shows screen point (x, y)."""
+        return ((x / self.screen_scale_x - self.origin_x) * self.scale, (y / self.screen_scale_y - self.origin_y) * self.scale)
+
+    def view(self, left: float, top: float, scale: float) -> "ViewTransform":
+        """Transform of a view cut from this one at view pixel (left, top) and resized by `scale`."""
+        return self.model_copy(update={
+            "origin_x": self.origin_x + left / self.scale,
+            "origin_y": self.origin_y + top / self.scale,
+            "scale": self.scale * scale,
+        })
+
+    def labels(self) -> Tuple[Point, Point]:
+        """(label_origin, label_scale) for GridOverlayCache, so grid labels show screen coordinates."""
+        return (
+            (self.origin_x * self.screen_scale_x, self.origin_y * self.screen_scale_y),
+            (self.screen_scale_x / self.scale, self.screen_scale_y / self.scale),
+        )
+
+
+_display_transforms = {}
+_display_transforms_lock = threading.Lock()
+
+
+def display_transform(capture_size: Tuple[int, int]) -> ViewTransform:
+    """
+    Transform from a full screenshot of `capture_size` pixels to screen coordinates.
+    Cached per geometry, so pyautogui.size() is only asked once per capture size.
+    """
+    capture_size = tuple(capture_size)
+    with _display_transforms_lock:
+        transform = _display_transforms.get(capture_size)
+        if transform is None:
+            screen_width, screen_height = pyautogui.size()
+            transform = ViewTransform(screen_scale_x=screen_width / capture_size[0], screen_scale_y=screen_height / capture_size[1])
+            _display_transforms[capture_size] = transform
+        return transform
+
+
+def clear_display_transforms():
+    """Forget cached geometries, e.g. after the display resolution changed."""
+    with _display_transforms_lock:
+        _display_transforms.clear()
+
+
+class CoarseToFine:
+    """
+    CoarseToFine:
+    -------------
+
+    Two-stage views of a screenshot. The overview is the whole screen downscaled to at
+    most ZOOM_OVERVIEW_MAX_SIDE pixels with a coarse grid (ZOOM_OVERVIEW_STEP). The detail
+    view is a ZOOM_CROP_SIZE crop around a chosen point, resized by ZOOM_CROP_SCALE, with
+    a finer grid (ZOOM_FINE_STEP). Grid labels on both show screen coordinates, and each
+    view comes with the ViewTransform that maps its pixels back to the screen.
+
+    Enabled with VISION_ZOOM_ENABLED.
+
+    Methods:
+    - overview(screenshot) -> (Image, ViewTransform)
+    - detail(screenshot, point) -> (Image, ViewTransform)
+    - parse_point(reply) -> Optional[Tuple[float, float]]
+    """
+
+    def __init__(self, enabled: bool = None, overview_max_side: int = None, overview_step: int = None,
+                 crop_size: str = None, crop_scale: float = None, fine_step: int = None):
+        self.enabled = os.getenv("VISION_ZOOM_ENABLED", "false").lower() in ("true", "1", "yes") if enabled is None else enabled
+        self.overview_max_side = int(os.getenv("ZOOM_OVERVIEW_MAX_SIDE", 1280)) if overview_max_side is None else overview_max_side
+        self.overview_step = int(os.getenv("ZOOM_OVERVIEW_STEP", 100)) if overview_step is None else overview_step
+        width, height = (crop_size or os.getenv("ZOOM_CROP_SIZE", "1024x576")).lower().split("x")
+        self.crop_size = (int(width), int(height))
+        self.crop_scale = float(os.getenv("ZOOM_CROP_SCALE", 1.0)) if crop_scale is None else crop_scale
+        self.fine_step = int(os.getenv("ZOOM_FINE_STEP", 80)) if fine_step is None else fine_step
+
+    def overview(self, screenshot: Image.Image) -> Tuple[Image.Image, ViewTransform]:
+        transform = display_transform(screenshot.size)
+        scale = min(1.0, self.overview_max_side / max(screenshot.size))
+        image = screenshot.convert("RGB")
+        if scale < 1.0:
+            image = image.resize((round(screenshot.width * scale), round(screenshot.height * scale)), Image.BILINEAR)
+        transform = transform.view(0, 0, scale)
+        return self._label(image, transform, self.overview_step), transform
+
+    def detail(self, screenshot: Image.Image, point: Point) -> Tuple[Image.Image, ViewTransform]:
+        """Crop around screen point `point`, clamped to the screenshot."""
+        transform = display_transform(screenshot.size)
+        x, y = transform.to_view(*point)
+        width, height = min(self.crop_size[0], screenshot.width), min(self.crop_size[1], screenshot.height)
+        left = min(max(round(x - width / 2), 0), screenshot.width - width)
+        top = min(max(round(y - height / 2), 0), screenshot.height - height)
+        image = screenshot.crop((left, top, left + width, top + height)).convert("RGB")
+        if self.crop_scale != 1.0:
+            image = image.resize((round(width * self.crop_scale), round(height * self.crop_scale)), Image.LANCZOS)
+        transform = transform.view(left, top, self.crop_scale)
+        return self._label(image, transform, self.fine_step), transform
+
+    @staticmethod
+    def parse_point(reply: Optional[str]) -> Optional[Point]:
+        match = re.search(r"(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)", reply or "")
+        if match is None:
+            return None
+        return float(match.group(1)), float(match.group(2))
+
+    @staticmethod
+    def _label(image: Image.Image, transform: ViewTransform, step: int) -> Image.Image:
+        label_origin, label_scale = transform.labels()
+        return grid_overlay_cache.apply(image, step, label_origin=label_origin, label_scale=label_scale)
+
+
+coarse_to_fine = CoarseToFine()
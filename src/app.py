@@ -1,9 +1,130 @@
+import asyncio
 import os
 import sys
 from dotenv import load_dotenv
-from LLMHelper import generate_task_plan, update_task_plan, get_next_action_with_image
+from LLMHelper import generate_task_plan, update_task_plan, get_next_action_with_image, locate_region
 from AutoHelper import execute_command
 from pyautoguihelper import PyAutoGuiHelper
+from FrameDiffHelper import FrameChangeDetector, crop_regions
+from SettleHelper import settle_detector
+from PromptHelper import PromptTemplate
+from TrajectoryHelper import ReplayEngine, TrajectoryRecorder
+from ScreenshotStoreHelper import ScreenshotStore, get_screenshot_store
+from ZoomHelper import coarse_to_fine
+from ContextHelper import create_agent_context
+from ClientHelper import close_async_llm_client
+
+# Static instructions and function catalog first, so the prefix is byte-identical on every step
+STATE_DESCRIPTION = PromptTemplate(
+    prefix="""
+You have access to PyAutoGUI functions via the PyAutoGuiHelper class.
+
+The cursor position is highlighted in the image as a red box.
+
+Available functions:
+- move_mouse(x, y, duration=0.25)
+- move_mouse_relative(dx, dy, duration=0.25)
+- click(x=None, y=None, clicks=1, interval=0.0, button='left')
+- double_click(x=None, y=None, interval=0.0, button='left')
+- right_click(x=None, y=None)
+- middle_click(x=None, y=None)
+- scroll(clicks, x=None, y=None)
+- drag_to(x, y, duration=0.25, button='left')
+- drag_rel(dx, dy, duration=0.25, button='left')
+- type_text(text, interval=0.0)
+- press_key(key)
+- hotkey(*keys)
+- launch_url_in_default_browser(url)
+""",
+    suffix="""
+The current task plan is:
+{final_task_plan}
+""",
+)
+
+def build_state_description(final_task_plan):
+    return STATE_DESCRIPTION.render(final_task_plan=final_task_plan)
+
+def observe(gui_helper, change_detector, session=None):
+    """
+    Capture the screen with the cursor outlined and diff it against the previous frame.
+    The frame is recorded under `session` in the screenshot store, or saved as
+    current_state.png when the store is disabled.
+    """
+    store = get_screenshot_store()
+    cursor_position = gui_helper.get_mouse_position()
+    current_state = gui_helper.outline_region_on_screen(
+        region=(cursor_position.x - 10, cursor_position.y - 10, 20, 20),
+        outline_color='red',
+        filename=None if store is not None else 'current_state.png'
+    )
+    if store is not None:
+        store.submit(current_state, session=session or "default")
+    return current_state, change_detector.update(current_state)
+
+def unchanged_note(previous_action):
+    """Added to the state description when the screen did not change after an action ran."""
+    return f"""
+The screen did not change after the last action:
+{previous_action}
+If it had no visible effect, choose a different action instead of repeating it.
+"""
+
+def select_crops(current_state, frame_diff, max_crop_fraction, context=None):
+    """
+    Changed regions to send instead of the full screenshot, or None to send the full
+    screenshot. Crops are only sent when `context` carries thumbnails of earlier screens,
+    since the model otherwise never saw the rest of the screen.
+    """
+    if context is None or context.thumbnail_entries <= 0:
+        return None
+    if frame_diff.first_frame or frame_diff.changed_fraction > max_crop_fraction:
+        return None
+    crops = crop_regions(current_state, frame_diff.dirty_regions, padding=16)
+    print(f"Sending {len(crops)} changed region(s) instead of the full screenshot.")
+    return crops
+
+def zoomed_state(current_state, state_description):
+    """
+    Coarse-to-fine view of the screen (VISION_ZOOM_ENABLED): the model picks a point on a
+    downscaled overview, then gets a full-resolution crop around it whose grid labels are
+    screen coordinates. Returns the full screenshot when zooming is off or no point was given.
+    """
+    if not coarse_to_fine.enabled:
+        return current_state
+    overview, _ = coarse_to_fine.overview(current_state)
+    point = locate_region(state_description, overview)
+    if point is None:
+        print("No region chosen on the overview; sending the full screenshot.")
+        return current_state
+    detail, transform = coarse_to_fine.detail(current_state, point)
+    print(f"Zoomed into {detail.width}x{detail.height} at screen {transform.to_screen(0, 0)}.")
+    return detail
+
+def replay_trajectory(goal, gui_helper, recorder):
+    """
+    Offer to replay the stored trajectory for this goal without the model, then start
+    recording. The stored commands are shown first and only run once the user agrees.
+    Returns True when the whole trajectory replayed and the user confirms the goal is done.
+    """
+    trajectory = recorder.store.find(goal)
+    if trajectory is None or not trajectory.steps:
+        recorder.start(goal)
+        return False
+    print(f"A stored run of this goal has {len(trajectory.steps)} steps:")
+    for number, step in enumerate(trajectory.steps, 1):
+        print(f"{number}. {step.command}")
+    answer = input("Replay these steps without asking for each one? (yes/no): ")
+    if answer.lower() not in ['yes', 'y']:
+        recorder.start(goal)
+        return False
+    result = ReplayEngine(recorder.store).replay(goal, gui_helper.screenshot, lambda command: execute_command(command, gui_helper))
+    if result.completed:
+        goal_status = input(f"Replayed all {result.total_steps} stored steps. Is the goal completed? (yes/no): ")
+        if goal_status.lower() in ['yes', 'y']:
+            return True
+    recorder.start(goal, replayed_steps=result.replayed_steps)
+    return False
 
 def main():
     # Load environment variables
@@ -16,6 +137,12 @@ def main():
     goal = input("Please enter your goal: ")
     print(f"Your goal is: {goal}")
 
+    # Reuse a stored trajectory for the same goal before calling the model
+    recorder = TrajectoryRecorder()
+    if replay_trajectory(goal, gui_helper, recorder):
+        print("Goal completed.")
+        return
+
     # Generate initial task plan
     task_plan = generate_task_plan(goal)
     print("Generated Task Plan:")
@@ -26,7 +153,7 @@ def main():
     if feedback.lower() in ['yes', 'y', '']:
         final_task_plan = task_plan
     else:
-        final_task_plan = update_task_plan(task_plan, feedback)
+        final_task_plan = update_task_plan(task_plan, feedback, goal=goal)
         print("Updated Task Plan:")
         print(final_task_plan)
 
@@ -35,55 +162,56 @@ def main():
     retry_count = 0
     max_retries = 3
 
+    # Skip the vision call when the screen has not changed and the recommendation was not
+    # acted on yet, and send only the changed regions when little of it has
+    change_detector = FrameChangeDetector()
+    max_crop_fraction = float(os.getenv("DIRTY_CROP_MAX_FRACTION", 0.25))
+    next_action = None
+    acted = False
+    session = ScreenshotStore.new_session()
+    # Recent actions and their outcomes, sent with each request under a fixed budget
+    context = create_agent_context()
+
     while not goal_completed:
         # Observe: Take a screenshot and draw a box around the cursor position
-        cursor_position = gui_helper.get_mouse_position()
-        gui_helper.outline_region_on_screen(
-            region=(cursor_position.x - 10, cursor_position.y - 10, 20, 20),
-            outline_color='red',
-            filename='current_state.png'
-        )
+        current_state, frame_diff = observe(gui_helper, change_detector, session)
 
         # Orient: Analyze the captured state
         print("Current state captured. Sending to LLM for analysis.")
 
         # Prepare state description
-        state_description = f"""
-The current task plan is:
-{final_task_plan}
-
-You have access to PyAutoGUI functions via the PyAutoGuiHelper class.
-
-The cursor position is highlighted in the image as a red box.
-
-Available functions:
-- move_mouse(x, y, duration=0.25)
-- move_mouse_relative(dx, dy, duration=0.25)
-- click(x=None, y=None, clicks=1, interval=0.0, button='left')
-- double_click(x=None, y=None, interval=0.0, button='left')
-- right_click(x=None, y=None)
-- middle_click(x=None, y=None)
-- scroll(clicks, x=None, y=None)
-- drag_to(x, y, duration=0.25, button='left')
-- drag_rel(dx, dy, duration=0.25, button='left')
-- type_text(text, interval=0.0)
-- press_key(key)
-- hotkey(*keys)
-- launch_url_in_default_browser(url)
-"""
+        state_description = build_state_description(final_task_plan)
 
-        # Send state to LLM to get next action
-        next_action = get_next_action_with_image(state_description, "current_state.png")
+        # Send state to LLM to get next action, unless nothing on screen changed
+        if not frame_diff.changed and next_action is not None and not acted:
+            print("Screen unchanged since the last analysis; reusing the previous recommendation.")
+        else:
+            if not frame_diff.changed and next_action is not None:
+                # Never repeat an action that had no visible effect; ask again with that noted
+                print("Screen unchanged after the last action; asking the LLM again.")
+                state_description += unchanged_note(next_action)
+                crops = None
+            else:
+                crops = select_crops(current_state, frame_diff, max_crop_fraction, context)
+            image = current_state if crops else zoomed_state(current_state, state_description)
+            next_action = get_next_action_with_image(state_description, image, crops=crops, context=context)
+            acted = False
         print("LLM recommended action:")
         print(next_action)
 
         # Decide: Ask user for approval
         user_input = input("Enter 'LGTM' to proceed, 'Stop' to exit, 'Intervene' to perform the action manually: ")
         if user_input.lower() == 'lgtm':
-            # Act: Execute the command
+            # Act: Execute the command, remembering the screen it ran on for replay
+            screen = gui_helper.screenshot()
             success = execute_command(next_action, gui_helper)
+            acted = True
+            if context:
+                context.record(next_action, "succeeded" if success else "failed", screen)
             if success:
+                recorder.record(screen, next_action)
                 print("Action executed successfully.")
+                print(f"Settle times per action: {settle_detector.summary()}")
                 retry_count = 0
             else:
                 print("Failed to execute action.")
@@ -94,6 +222,10 @@ Available functions:
         elif user_input.lower() == 'intervene':
             print("Please perform the action manually. Press Enter when done.")
             input()
+            acted = True
+            if context:
+                context.record(next_action, "done manually by the user", current_state)
+            recorder.discard()
             retry_count = 0
         else:
             print("Invalid input.")
@@ -102,6 +234,7 @@ Available functions:
         goal_status = input("Is the goal completed? (yes/no): ")
         if goal_status.lower() in ['yes', 'y']:
             goal_completed = True
+            recorder.finish(success=True)
             print("Goal completed.")
         else:
             retry_count += 1
@@ -109,5 +242,151 @@ Available functions:
                 print("Maximum retries reached. Exiting.")
                 sys.exit(0)
 
+async def ainput(prompt):
+    return await asyncio.to_thread(input, prompt)
+
+async def async_main():
+    """
+    Pipelined variant of main(): the same one-action-at-a-time loop, but the next frame
+    is captured, encoded and (with PREFETCH_NEXT_ACTION) sent to the model while the user
+    is still answering the goal-completed prompt. Model calls time out after
+    LLM_STEP_TIMEOUT_SECONDS and speculative work is cancelled when it is not needed.
+    """
+    import AsyncLLMHelper
+
+    load_dotenv()
+    gui_helper = PyAutoGuiHelper()
+    step_timeout = float(os.getenv("LLM_STEP_TIMEOUT_SECONDS", 60))
+    prefetch = os.getenv("PREFETCH_NEXT_ACTION", "true").lower() in ("true", "1", "yes")
+
+    goal = await ainput("Please enter your goal: ")
+    print(f"Your goal is: {goal}")
+
+    recorder = TrajectoryRecorder()
+    if await asyncio.to_thread(replay_trajectory, goal, gui_helper, recorder):
+        print("Goal completed.")
+        return
+
+    task_plan = await AsyncLLMHelper.generate_task_plan(goal)
+    print("Generated Task Plan:")
+    print(task_plan)
+
+    feedback = await ainput("Do you agree with this task plan? If not, please provide your feedback: ")
+    if feedback.lower() in ['yes', 'y', '']:
+        final_task_plan = task_plan
+    else:
+        final_task_plan = await AsyncLLMHelper.update_task_plan(task_plan, feedback, goal=goal)
+        print("Updated Task Plan:")
+        print(final_task_plan)
+
+    state_description = build_state_description(final_task_plan)
+    change_detector = FrameChangeDetector()
+    max_crop_fraction = float(os.getenv("DIRTY_CROP_MAX_FRACTION", 0.25))
+    retry_count = 0
+    max_retries = 3
+    previous_action = None
+    acted = False
+    session = ScreenshotStore.new_session()
+    context = create_agent_context()
+
+    async def think():
+        """
+        Observe in a worker thread, then ask the model, unless the screen is unchanged and
+        the previous recommendation was not acted on yet.
+        """
+        current_state, frame_diff = await asyncio.to_thread(observe, gui_helper, change_detector, session)
+        description = state_description
+        if not frame_diff.changed and previous_action is not None:
+            if not acted:
+                print("Screen unchanged since the last analysis; reusing the previous recommendation.")
+                return previous_action
+            # Never repeat an action that had no visible effect; ask again with that noted
+            print("Screen unchanged after the last action; asking the LLM again.")
+            description += unchanged_note(previous_action)
+            crops = None
+        else:
+            crops = select_crops(current_state, frame_diff, max_crop_fraction, context)
+        image = current_state if crops else await asyncio.to_thread(zoomed_state, current_state, description)
+        return await AsyncLLMHelper.get_next_action_with_image(description, image, crops=crops, timeout=step_timeout, context=context)
+
+    pending = asyncio.create_task(think())
+    try:
+        while True:
+            try:
+                next_action = await pending
+            except asyncio.TimeoutError:
+                print(f"LLM did not answer within {step_timeout} seconds.")
+                next_action = None
+            except Exception as e:
+                print(f"Error getting next action: {e}")
+                next_action = None
+            pending = None
+
+            if next_action is None:
+                retry_count += 1
+                if retry_count >= max_retries:
+                    print("Maximum retries reached. Exiting.")
+                    return
+                pending = asyncio.create_task(think())
+                continue
+
+            previous_action = next_action
+            acted = False
+            print("LLM recommended action:")
+            print(next_action)
+
+            user_input = await ainput("Enter 'LGTM' to proceed, 'Stop' to exit, 'Intervene' to perform the action manually: ")
+            if user_input.lower() == 'lgtm':
+                screen = await asyncio.to_thread(gui_helper.screenshot)
+                success = await asyncio.to_thread(execute_command, next_action, gui_helper)
+                acted = True
+                if context:
+                    context.record(next_action, "succeeded" if success else "failed", screen)
+                if success:
+                    recorder.record(screen, next_action)
+                    print("Action executed successfully.")
+                    print(f"Settle times per action: {settle_detector.summary()}")
+                    retry_count = 0
+                else:
+                    print("Failed to execute action.")
+                    retry_count += 1
+            elif user_input.lower() == 'stop':
+                print("Stopping the agent.")
+                return
+            elif user_input.lower() == 'intervene':
+                print("Please perform the action manually. Press Enter when done.")
+                await ainput("")
+                acted = True
+                if context:
+                    context.record(next_action, "done manually by the user")
+                recorder.discard()
+                retry_count = 0
+            else:
+                print("Invalid input.")
+
+            # Speculatively observe and think about the next step while the user answers
+            if prefetch:
+                pending = asyncio.create_task(think())
+
+            goal_status = await ainput("Is the goal completed? (yes/no): ")
+            if goal_status.lower() in ['yes', 'y']:
+                recorder.finish(success=True)
+                print("Goal completed.")
+                return
+            retry_count += 1
+            if retry_count >= max_retries:
+                print("Maximum retries reached. Exiting.")
+                return
+            if pending is None:
+                pending = asyncio.create_task(think())
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        await close_async_llm_client()
+
 if __name__ == "__main__":
-    main()
+    if "--async" in sys.argv or os.getenv("AGENT_ASYNC", "false").lower() in ("true", "1", "yes"):
+        asyncio.run(async_main())
+    else:
+        main()
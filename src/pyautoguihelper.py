@@ -1,11 +1,17 @@
 import pyautogui
-from typing import Tuple, Optional, List, Callable
+from typing import Tuple, Optional, List, Dict
 from PIL import Image, ImageDraw, ImageStat
-import time
 from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
 import webbrowser
+import numpy as np
+from TemplateMatchHelper import template_matcher, to_gray
+from WatcherHelper import ScreenWatcher
+from CaptureHelper import capture_service
+from SettleHelper import settle_detector
+from LayoutHelper import load_layout
+from InputBackendHelper import get_input_backend
 
 class MousePosition(BaseModel):
     x: int
@@ -32,7 +38,8 @@ class PyAutoGuiHelper:
     - type_text(text, interval=0.0)
     - press_key(key)
     - hotkey(*keys)
-    - screenshot(region=None) -> Image
+    - screenshot(region=None, max_age_ms=None) -> Image
+    - recent_frame() -> Image
     - locate_on_screen(image_path, confidence=0.8) -> Optional[Tuple[int, int, int, int]]
     - locate_center_on_screen(image_path, confidence=0.8) -> Optional[Tuple[int, int]]
     - alert(text, title='Alert', button='OK')
@@ -45,11 +52,15 @@ class PyAutoGuiHelper:
     - pixel(x, y) -> Tuple[int, int, int]
     - pixel_matches_color(x, y, expected_rgb, tolerance=0) -> bool
     - locate_all_on_screen(image_path, confidence=0.8) -> List[Tuple[int, int, int, int]]
-    - locate_on_screen_near(image_path, x, y, confidence=0.8) -> Optional[Tuple[int, int, int, int]]
+    - locate_many_on_screen(image_paths, confidence=0.8) -> Dict[str, Optional[Tuple[int, int, int, int]]]
+    - locate_on_screen_near(image_path, x, y, confidence=0.8, radius=None) -> Optional[Tuple[int, int, int, int]]
     - locate_center_on_screen_near(image_path, x, y, confidence=0.8) -> Optional[Tuple[int, int]]
-    - outline_region_on_screen(region, outline_color=None, filename='_showRegionOnScreen.png')
+    - outline_region_on_screen(region, outline_color=None, filename='_showRegionOnScreen.png') -> Image
     - wait_for_image(image_path, timeout=30, confidence=0.8) -> bool
+    - wait_for_image_location(image_path, timeout=30, confidence=0.8, region=None) -> Optional[Tuple[int, int, int, int]]
     - wait_for_image_and_click(image_path, timeout=30, confidence=0.8, clicks=1, interval=0.0, button='left')
+    - locate_element(target, layout_path=None) -> Optional[Tuple[int, int]]
+    - click_element(target, layout_path=None, clicks=1, button='left') -> bool
     - draw_cursor_on_screenshot(x, y, screenshot, cursor)
     - get_cursor_image() -> Image
     - launch_url_in_default_browser(url) -> bool
@@ -58,57 +69,108 @@ class PyAutoGuiHelper:
     def __init__(self):
         load_dotenv()
         pyautogui.FAILSAFE = True
-        pyautogui.PAUSE = float(os.getenv("PYAUTOGUI_PAUSE_SECONDS_AFTER_COMMAND", 0.5))
+        # With settle detection each action waits for the screen to stop changing instead of a fixed pause
+        pyautogui.PAUSE = 0 if settle_detector.enabled else float(os.getenv("PYAUTOGUI_PAUSE_SECONDS_AFTER_COMMAND", 0.5))
+        # The watcher only reads frames, so it works on the backend's arrays without copying
+        self.watcher = ScreenWatcher(capture=lambda: capture_service.grab().array)
+        # Mouse and keyboard go through the shared input backend (XTEST batches when available)
+        self.input = get_input_backend()
+        # Reads of screen content reuse a shared frame up to this old instead of grabbing again
+        self.capture_max_age_ms = float(os.getenv("CAPTURE_MAX_AGE_MS", 100))
 
     def move_mouse(self, x: int, y: int, duration: float = 0.25):
-        pyautogui.moveTo(x, y, duration=duration)
+        self.input.move_to(x, y, duration=duration)
+        self._settle('move_mouse', x, y)
 
     def move_mouse_relative(self, dx: int, dy: int, duration: float = 0.25):
-        pyautogui.moveRel(dx, dy, duration=duration)
+        self.input.move_rel(dx, dy, duration=duration)
+        self._settle('move_mouse_relative')
 
     def click(self, x: int = None, y: int = None, clicks: int = 1, interval: float = 0.0, button: str = 'left'):
-        pyautogui.click(x, y, clicks=clicks, interval=interval, button=button)
+        self.input.click(x, y, clicks=clicks, interval=interval, button=button)
+        self._settle('click', x, y)
 
     def double_click(self, x: int = None, y: int = None, interval: float = 0.0, button: str = 'left'):
-        pyautogui.doubleClick(x, y, interval=interval, button=button)
+        self.input.click(x, y, clicks=2, interval=interval, button=button)
+        self._settle('double_click', x, y)
 
     def right_click(self, x: int = None, y: int = None):
-        pyautogui.rightClick(x, y)
+        self.input.click(x, y, button='right')
+        self._settle('right_click', x, y)
 
     def middle_click(self, x: int = None, y: int = None):
-        pyautogui.middleClick(x, y)
+        self.input.click(x, y, button='middle')
+        self._settle('middle_click', x, y)
 
     def scroll(self, clicks: int, x: int = None, y: int = None):
-        pyautogui.scroll(clicks, x=x, y=y)
+        self.input.scroll(clicks, x=x, y=y)
+        self._settle('scroll', x, y)
 
     def drag_to(self, x: int, y: int, duration: float = 0.25, button: str = 'left'):
-        pyautogui.dragTo(x, y, duration=duration, button=button)
+        self.input.drag_to(x, y, duration=duration, button=button)
+        self._settle('drag_to', x, y)
 
     def drag_rel(self, dx: int, dy: int, duration: float = 0.25, button: str = 'left'):
-        pyautogui.dragRel(dx, dy, duration=duration, button=button)
+        self.input.drag_rel(dx, dy, duration=duration, button=button)
+        self._settle('drag_rel')
 
     def type_text(self, text: str, interval: float = 0.0):
-        pyautogui.write(text, interval=interval)
+        # Long text may be pasted through the clipboard (INPUT_PASTE_MIN_CHARS)
+        self.input.type_text(text, interval=interval)
+        capture_service.invalidate()
+        if settle_detector.active():
+            settle_detector.wait(label='type_text')
+            # Once the screen has settled the paste has been read, so the old clipboard can come back
+            self.input.restore_clipboard()
+        elif not settle_detector.enabled:
+            self.input.restore_clipboard(settled=False)
+        # Inside a keyboard batch the batch restores the clipboard after its own settle wait
 
     def press_key(self, key: str):
-        pyautogui.press(key)
+        self.input.press(key)
+        capture_service.invalidate()
+        settle_detector.wait(label='press_key')
 
     def hotkey(self, *keys: str):
-        pyautogui.hotkey(*keys)
+        self.input.hotkey(*keys)
+        capture_service.invalidate()
+        settle_detector.wait(label='hotkey')
 
-    def screenshot(self, region: Tuple[int, int, int, int] = None) -> Image:
-        return pyautogui.screenshot(region=region)
+    def _settle(self, label: str, x: int = None, y: int = None):
+        """
+        Drop shared frames from before the input, then wait for the area around (x, y), or
+        around the mouse when no point is given, to stop changing.
+        """
+        capture_service.invalidate()
+        if not settle_detector.enabled:
+            return
+        if x is None or y is None:
+            x, y = pyautogui.position()
+        settle_detector.wait(settle_detector.region_around(x, y), label=label)
+
+    def screenshot(self, region: Tuple[int, int, int, int] = None, max_age_ms: float = None) -> Image:
+        """
+        Capture the screen, or reuse a shared frame no older than max_age_ms. Fresh
+        region grabs bypass the frame buffer.
+        """
+        if region is not None and max_age_ms is None:
+            return Image.fromarray(np.ascontiguousarray(capture_service.grab_region(region)))
+        return capture_service.screenshot(region=region, max_age_ms=max_age_ms)
+
+    def recent_frame(self) -> Image:
+        """Read-only view of a frame no older than CAPTURE_MAX_AGE_MS, shared with other consumers."""
+        return capture_service.get_frame(self.capture_max_age_ms).image
 
     def locate_on_screen(self, image_path: str, confidence: float = 0.8) -> Optional[Tuple[int, int, int, int]]:
-        location = pyautogui.locateOnScreen(image_path, confidence=confidence)
-        if location:
-            return (location.left, location.top, location.width, location.height)
+        match = template_matcher.best(self.recent_frame(), image_path, confidence)
+        if match:
+            return match[:4]
         return None
 
     def locate_center_on_screen(self, image_path: str, confidence: float = 0.8) -> Optional[Tuple[int, int]]:
-        location = pyautogui.locateCenterOnScreen(image_path, confidence=confidence)
+        location = self.locate_on_screen(image_path, confidence)
         if location:
-            return (location[0], location[1])
+            return (location[0] + location[2] // 2, location[1] + location[3] // 2)
         return None
 
     def alert(self, text: str, title: str = 'Alert', button: str = 'OK'):
@@ -134,20 +196,36 @@ class PyAutoGuiHelper:
         return pyautogui.onScreen(x, y)
 
     def pixel(self, x: int, y: int) -> Tuple[int, int, int]:
-        return pyautogui.pixel(x, y)
+        return capture_service.pixel(x, y, self.capture_max_age_ms)
 
     def pixel_matches_color(self, x: int, y: int, expected_rgb: Tuple[int, int, int], tolerance: int = 0) -> bool:
-        return pyautogui.pixelMatchesColor(x, y, expected_rgb, tolerance=tolerance)
+        return all(abs(actual - expected) <= tolerance for actual, expected in zip(self.pixel(x, y), expected_rgb[:3]))
 
     def locate_all_on_screen(self, image_path: str, confidence: float = 0.8) -> List[Tuple[int, int, int, int]]:
-        return list(pyautogui.locateAllOnScreen(image_path, confidence=confidence))
+        return [match[:4] for match in template_matcher.match(self.recent_frame(), [image_path], confidence)[image_path]]
+
+    def locate_many_on_screen(self, image_paths: List[str], confidence: float = 0.8) -> Dict[str, Optional[Tuple[int, int, int, int]]]:
+        """
+        Search several templates against a single capture and return the best location of each (or None).
+        """
+        matches = template_matcher.match(self.recent_frame(), image_paths, confidence, limit=1)
+        return {path: (matches[path][0][:4] if matches[path] else None) for path in image_paths}
 
-    def locate_on_screen_near(self, image_path: str, x: int, y: int, confidence: float = 0.8) -> Optional[Tuple[int, int, int, int]]:
-        matches = list(pyautogui.locateAllOnScreen(image_path, confidence=confidence))
-        if not matches:
+    def locate_on_screen_near(self, image_path: str, x: int, y: int, confidence: float = 0.8, radius: int = None) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Find the match closest to (x, y), searching a region of interest around the hint
+        point first and the whole screen only if nothing is found there.
+        """
+        screen = to_gray(self.recent_frame())
+        radius = int(os.getenv("LOCATE_NEAR_RADIUS", 400)) if radius is None else radius
+        template = template_matcher.load(image_path)
+        region = (x - radius, y - radius, 2 * radius + template.width, 2 * radius + template.height)
+        closest_match = template_matcher.best(screen, image_path, confidence, region=region, near=(x, y))
+        if closest_match is None:
+            closest_match = template_matcher.best(screen, image_path, confidence, near=(x, y))
+        if closest_match is None:
             return None
-        closest_match = min(matches, key=lambda match: (match.left - x)**2 + (match.top - y)**2)
-        return (closest_match.left, closest_match.top, closest_match.width, closest_match.height)
+        return closest_match[:4]
 
     def locate_center_on_screen_near(self, image_path: str, x: int, y: int, confidence: float = 0.8) -> Optional[Tuple[int, int]]:
         location = self.locate_on_screen_near(image_path, x, y, confidence)
@@ -165,7 +243,7 @@ class PyAutoGuiHelper:
         return cursor
 
     def outline_region_on_screen(self, region: Tuple[int, int, int, int], outline_color: str = None, filename: str = '_showRegionOnScreen.png'):
-        im = self.screenshot()
+        im = self.screenshot(max_age_ms=self.capture_max_age_ms)
         mouse_position = self.get_mouse_position()
         self.draw_cursor_on_screenshot(mouse_position.x, mouse_position.y, im, self.get_cursor_image())
 
@@ -206,32 +284,52 @@ class PyAutoGuiHelper:
             y_end = min(y + dash_length, bottom)
             draw.line([(right, y), (right, y_end)], fill=outline_color, width=line_width)
 
-        im.save(filename)
+        if filename:
+            im.save(filename)
+        return im
 
     def wait_for_image(self, image_path: str, timeout: int = 30, confidence: float = 0.8) -> bool:
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            if pyautogui.locateOnScreen(image_path, confidence=confidence):
-                return True
-            time.sleep(0.5)
-        return False
+        return self.wait_for_image_location(image_path, timeout, confidence) is not None
+
+    def wait_for_image_location(self, image_path: str, timeout: int = 30, confidence: float = 0.8, region: Tuple[int, int, int, int] = None) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Wait until the image appears and return where it was found, or None on timeout.
+        Concurrent waits share the watcher's single capture loop.
+        """
+        return self.watcher.watch(image_path, timeout=timeout, confidence=confidence, region=region).wait()
 
     def draw_cursor_on_screenshot(self, x: int, y: int, screenshot: Image, cursor: Image):
         screenshot.paste(cursor, (x, y), cursor)
 
     def wait_for_image_and_click(self, image_path: str, timeout: int = 30, confidence: float = 0.8, clicks: int = 1, interval: float = 0.0, button: str = 'left'):
-        if self.wait_for_image(image_path, timeout, confidence):
-            location = pyautogui.locateCenterOnScreen(image_path, confidence=confidence)
-            if location:
-                pyautogui.click(x=location[0], y=location[1], clicks=clicks, interval=interval, button=button)
-            else:
-                print(f"Image {image_path} not found on screen.")
+        # Click the location found while waiting instead of searching a second time
+        location = self.wait_for_image_location(image_path, timeout, confidence)
+        if location:
+            self.click(x=location[0] + location[2] // 2, y=location[1] + location[3] // 2, clicks=clicks, interval=interval, button=button)
         else:
             print(f"Image {image_path} not found within {timeout} seconds.")
 
+    def locate_element(self, target: str, layout_path: str = None) -> Optional[Tuple[int, int]]:
+        """Coordinates of a named element (e.g. "pizzaType dropdown") from the UI layout file, without a screen search."""
+        layout = load_layout(layout_path)
+        if layout is None:
+            return None
+        return layout.resolve(target)
+
+    def click_element(self, target: str, layout_path: str = None, clicks: int = 1, button: str = 'left') -> bool:
+        point = self.locate_element(target, layout_path)
+        if point is None:
+            return False
+        self.click(point[0], point[1], clicks=clicks, button=button)
+        return True
+
     def launch_url_in_default_browser(self, url: str) -> bool:
         try:
             webbrowser.open_new_tab(url)
+            capture_service.invalidate()
+            page_load_wait = float(os.getenv("SETTLE_PAGE_LOAD_MAX_SECONDS", 10))
+            # The browser always changes the screen, so keep waiting for it to start
+            settle_detector.wait(max_wait=page_load_wait, change_wait=page_load_wait, label='launch_url_in_default_browser')
             return True
         except Exception as e:
             print(f"Error launching URL: {e}")
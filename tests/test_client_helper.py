@@ -0,0 +1,128 @@
+"""ClientHelper against StubOpenAIServer: retries, Retry-After, hedging and streaming over real HTTP."""
+import asyncio
+import time
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from ClientHelper import AsyncLLMClient, LLMClient, TokenBucket
+from fakes import StubOpenAIServer
+
+MESSAGES = [{"role": "user", "content": "Click the Buy Now button"}]
+
+
+def make_client(stub, cls=LLMClient, **settings):
+    settings = {"max_retries": 3, "retry_base_seconds": 0.01, "retry_max_seconds": 1.0, "hedge": False,
+                "rate_limiter": TokenBucket(0, 1), **settings}
+    return cls(api_key="test", base_url=stub.base_url, **settings)
+
+
+def test_retries_server_errors_until_success():
+    with StubOpenAIServer(failures=[503, 429]) as stub:
+        client = make_client(stub)
+        response = client.create(model="stub", messages=MESSAGES)
+        client.close()
+    assert response.choices[0].message.content == stub.response
+    assert len(stub.requests) == 3
+
+
+def test_gives_up_after_max_retries():
+    with StubOpenAIServer(failures=[500, 500, 500]) as stub:
+        client = make_client(stub, max_retries=2)
+        with pytest.raises(openai.InternalServerError):
+            client.create(model="stub", messages=MESSAGES)
+        client.close()
+    assert len(stub.requests) == 3
+
+
+def test_bad_request_is_not_retried():
+    with StubOpenAIServer(failures=[400]) as stub:
+        client = make_client(stub)
+        with pytest.raises(openai.BadRequestError):
+            client.create(model="stub", messages=MESSAGES)
+        client.close()
+    assert len(stub.requests) == 1
+
+
+def test_retry_after_is_honoured():
+    with StubOpenAIServer(failures=[429], retry_after=0.5) as stub:
+        client = make_client(stub)
+        start = time.monotonic()
+        client.create(model="stub", messages=MESSAGES)
+        elapsed = time.monotonic() - start
+        client.close()
+    assert len(stub.requests) == 2
+    assert elapsed >= 0.5
+
+
+def test_retry_after_is_capped():
+    with StubOpenAIServer(failures=[503], retry_after=30) as stub:
+        client = make_client(stub, retry_max_seconds=0.2)
+        start = time.monotonic()
+        client.create(model="stub", messages=MESSAGES)
+        elapsed = time.monotonic() - start
+        client.close()
+    assert elapsed < 5
+
+
+def test_hedged_request_wins_and_loser_is_cancelled():
+    with StubOpenAIServer(latencies=[3.0, 0.05]) as stub:
+        client = make_client(stub, hedge=True, hedge_delay_seconds=0.2)
+        start = time.monotonic()
+        response = client.create(model="stub", messages=MESSAGES)
+        elapsed = time.monotonic() - start
+        hedged = client.hedged
+        time.sleep(0.3)
+        client.close()
+    assert response.choices[0].message.content == stub.response
+    assert elapsed < 2
+    assert hedged == 1
+    assert stub.cancelled == 1
+
+
+def test_fast_request_is_not_hedged():
+    with StubOpenAIServer(latency=0.01) as stub:
+        client = make_client(stub, hedge=True, hedge_delay_seconds=1.0)
+        client.create(model="stub", messages=MESSAGES)
+        client.close()
+    assert client.hedged == 0
+    assert len(stub.requests) == 1
+
+
+def test_async_hedged_request_wins_and_loser_is_cancelled():
+    async def run(stub):
+        client = make_client(stub, cls=AsyncLLMClient, hedge=True, hedge_delay_seconds=0.2)
+        response = await client.create(model="stub", messages=MESSAGES)
+        await asyncio.sleep(0.3)
+        await client.close()
+        return client, response
+
+    with StubOpenAIServer(latencies=[3.0, 0.05]) as stub:
+        client, response = asyncio.run(run(stub))
+    assert response.choices[0].message.content == stub.response
+    assert client.hedged == 1
+    assert stub.cancelled == 1
+
+
+def test_streaming_yields_the_whole_answer_and_is_not_timed():
+    with StubOpenAIServer(response="import pyautogui pyautogui.press('enter')") as stub:
+        client = make_client(stub, hedge=True)
+        stream = client.create(model="stub", messages=MESSAGES, stream=True)
+        text = "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices)
+        client.close()
+    assert text.strip() == stub.response
+    assert stub.requests[0]["stream"] is True
+    assert client.hedged == 0
+    assert client.settings.latencies({"model": "stub"}).percentile(50) is None
+
+
+def test_latencies_are_kept_per_model_and_max_tokens():
+    with StubOpenAIServer(latency=0.01) as stub:
+        client = make_client(stub)
+        client.settings.latencies({"model": "stub", "max_tokens": 10}).min_samples = 1
+        client.create(model="stub", messages=MESSAGES, max_tokens=10)
+        client.close()
+    assert client.settings.latencies({"model": "stub", "max_tokens": 10}).percentile(95) is not None
+    assert client.settings.latencies({"model": "stub", "max_tokens": 4000}).percentile(95) is None
+    assert client.settings.latencies({"model": "other", "max_tokens": 10}).percentile(95) is None